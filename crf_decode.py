@@ -0,0 +1,500 @@
+#!/usr/bin/env python
+import re
+import io
+import codecs
+import numpy
+import operator
+import itertools
+from sys import stdin,stdout,stderr
+from time import time
+from multiprocessing import Pool
+from argparse import ArgumentParser
+import crf_text_model
+import model_bundle
+from sentence_splitting import labelSpans
+
+scriptArgs = ArgumentParser(description="Labels featurized data with a CRF++ text model (the '.txt' model written by 'crf_learn -t'), in-process, producing the same output as crf_test. Given several models trained with the same feat-list, e.g. one per attribute group, it reads the feature matrix once, runs every model over it and merges their labels.")
+
+scriptArgs.add_argument('--model',nargs='+',help="Required CRF++ text model file, i.e. the 'crf.model.txt' written by 'crf_learn -t', or a model bundle made by make_bundle.py, or several, all trained on feature matrices from the same feat-list. A bundle is memory-mapped rather than parsed, and worker processes share its weights.",required=True)
+scriptArgs.add_argument('--merge',default="priority",choices=["priority","longest","columns"],help="How the labels of several models are combined where their entities overlap: 'priority' keeps the entity of the model given first in --model, 'longest' the longest entity (then the model given first), and 'columns' doesn't merge, but writes one label column per model, in --model order. Default is priority.")
+scriptArgs.add_argument('--input',help="Optional featurized input file as produced by crf_features.py. Reads from stdin if no argument provided.")
+scriptArgs.add_argument('--output',help="Optional output file with lines of the form '<input line><tab><label>', as crf_test writes them. Writes to stdout if no argument provided.")
+scriptArgs.add_argument('--batchsize',type=int,default=5000,help="Number of sentences read before they are bucketed by length and decoded together. Default is 5000.")
+scriptArgs.add_argument('--jobs',type=int,default=1,help="Number of worker processes decoding batches in parallel. Default is 1, i.e. decode in this process.")
+scriptArgs.add_argument('--verbose',action='store_true',help="Print out model statistics and decoding throughput.")
+
+argValues = vars(scriptArgs.parse_args())
+
+
+# Command line arguments
+
+modelFiles  = argValues["model"]
+mergePolicy = argValues["merge"]
+inputFile   = argValues["input"]
+outputFile  = argValues["output"]
+batchSize   = argValues["batchsize"]
+numJobs     = argValues["jobs"]
+verbose     = argValues["verbose"]
+
+# CRF++ substitutes these for %x[row,col] references that fall before the start or after the end of the sentence.
+# Relative rows are limited to +-8 there, and so they are here.
+
+MAX_CONTEXT = 8
+BOS         = ["_B-%d" % n for n in range(MAX_CONTEXT,0,-1)]   # _B-8 ... _B-1
+EOS         = ["_B+%d" % n for n in range(1,MAX_CONTEXT+1)]    # _B+1 ... _B+8
+
+# The CRFModels being decoded with, in --model order; set by main.
+
+models = []
+
+# Column index -> ColumnVocab, and the LineVocab, shared by all models and kept across batches, so that a line or column
+# value is coded once for all of them.  Once they hold MAX_VOCAB strings between them, they are cleared, along with the
+# id tables of the templates, so that a long stream of input can't grow them without bound.
+
+columnVocabs = dict()
+lineVocab    = None
+MAX_VOCAB    = 1 << 19
+
+# Bits per column code when the codes of a conjunction are packed into one integer: enough for MAX_VOCAB strings, and
+# for the boundary values, in a column.
+
+CODE_BITS = 21
+
+
+# How decoding works:
+#
+#  - Every distinct line is given a small integer code, and is split into fields once, the first time it is seen (see
+#    LineVocab), as is every distinct string seen in a column (see ColumnVocab).  Input repeats the same lines a lot, so
+#    most lines cost a single dict lookup.  A %x[row,col] reference is then the column's codes shifted by row, with the
+#    codes of CRF++'s boundary values where that falls outside the sentence.
+#  - For a template with a single reference, the feature id for each code is looked up in the model dictionary the
+#    first time the code is seen, and kept in an array indexed by code, so expanding the template over the whole batch
+#    is a numpy gather.  Templates that conjoin several references pack the codes of each token into one integer, and
+#    look up the feature id of each distinct one the first time it is seen.
+#  - The scores of every token of the batch are summed at once, template by template.  Then sentences of equal length
+#    are stacked, and the Viterbi recursion runs over all of them together.
+#  - With several models, the coded columns of the batch are shared: every model's templates are expanded from them.
+
+
+########################################################################################################################################
+
+
+def main ():
+    """The function that is called in a command line context. """
+    nonOverlapping(modelFiles + [inputFile],[outputFile])
+    for modelFile in modelFiles:
+        startTime = time()
+        model     = readModel(modelFile)
+        models.append(model)
+        if (verbose):
+            stderr.write("Read model %s in %.2fs: %d labels, %d unigram templates, %d bigram templates, %d features\n" %
+                         (modelFile,time()-startTime,len(model.labels),len(model.unigramTemplates),len(model.bigramTemplates),len(model.featureIds)))
+    # io.open rather than codecs.open for the input: its line reading is several times faster, which matters here.
+    instream  = io.open(inputFile,encoding="utf-8",mode="r") if inputFile != None else codecs.getreader("utf-8")(stdin)
+    outstream = codecs.open(outputFile,encoding="utf-8",mode="wb") if outputFile != None else codecs.getwriter("utf-8")(stdout)
+    startTime = time()
+    stats     = {"tokens": 0, "dropped": 0}
+    batches   = readBatches(instream,stats)
+    # Worker processes are forked after the model is loaded, so they share it rather than each reading their own.
+    # Pool.imap hands back the results in input order.
+    if (numJobs > 1):
+        pool    = Pool(numJobs)
+        results = pool.imap(labelBatch,batches)
+    else:
+        pool    = None
+        results = (labelBatch(batch) for batch in batches)
+    for (result,dropped) in results:
+        outstream.write(result)
+        stats["dropped"] += dropped
+    if (pool):
+        pool.close()
+        pool.join()
+    if (verbose):
+        elapsed = max(time()-startTime,1e-6)
+        stderr.write("Decoded %d tokens in %.2fs (%.0f tokens/s)\n" % (stats["tokens"],elapsed,stats["tokens"]/elapsed))
+        if (len(models) > 1 and mergePolicy != "columns"):
+            stderr.write("Merged the labels of %d models; dropped %d overlapping entities\n" % (len(models),stats["dropped"]))
+    if (inputFile != None):
+        instream.close()
+    if (outputFile != None):
+        outstream.close()
+
+
+def readModel (filename):
+    """Reads a CRF++ text model or a model bundle; returns a CRFModel.  The models of several bundles have to have been
+       trained on the same feature plan, since they decode the same feature matrix."""
+    if (model_bundle.isBundle(filename)):
+        bundle = model_bundle.readBundle(filename)
+        plan   = [column["name"] for column in bundle.plan["columns"]]
+        if (models and models[0].plan != None and models[0].plan != plan):
+            raise RuntimeError(format("The features of bundle %s are not those of %s" % (filename,modelFiles[0])))
+        model      = makeModel(bundle.model,bundle.weights)
+        model.plan = plan
+        return model
+    textModel = crf_text_model.readTextModel(filename)
+    # Features that are not in the dictionary are pointed at a trailing block of zeros wide enough for a bigram feature,
+    # so that they add nothing, just as CRF++ drops them.  A bundle has the block already.
+    return makeModel(textModel,numpy.concatenate([textModel.weights,numpy.zeros(len(textModel.labels) ** 2)]))
+
+def makeModel (textModel,weights):
+    """Returns a CRFModel from a TextModel and its weights, followed by labels^2 zeros."""
+    model     = CRFModel()
+    model.labels = textModel.labels
+    # Templates; unigram ones start with U, bigram ones with B
+    for line in textModel.templates:
+        if (line.startswith("U")):
+            model.unigramTemplates.append(FeatureTemplate(line,model))
+        elif (line.startswith("B")):
+            model.bigramTemplates.append(FeatureTemplate(line,model))
+    model.featureIds = textModel.featureIds
+    # The header's cost-factor is not applied: crf_test scales by its own -c, 1 by default, and no positive scale changes
+    # the best path anyway.
+    model.weights   = weights
+    model.missingId = len(textModel.weights)
+    return model
+
+
+def readBatches (instream,stats):
+    """Yields lists of up to batchSize sentences, each sentence being the list of its lines.  Sentences are terminated by
+       a blank line, as in crf_features.py output.  Counts the tokens read in stats."""
+    batch    = []
+    sentence = []
+    for line in instream:
+        line = line.strip()
+        if (line != ""):
+            sentence.append(line)
+        elif (sentence):
+            batch.append(sentence)
+            stats["tokens"] += len(sentence)
+            sentence = []
+            if (len(batch) >= batchSize):
+                yield batch
+                batch = []
+    if (sentence):
+        batch.append(sentence)
+        stats["tokens"] += len(sentence)
+    if (batch):
+        yield batch
+
+def labelBatch (batch):
+    """Takes a list of sentences, each a list of lines; returns the output for them as a single string, each input line
+       followed by a tab and its label, with a blank line after each sentence, just as crf_test writes it, and the number
+       of entities dropped in merging.  Uses the global models, which worker processes inherit from main."""
+    limitVocabs()
+    columns = BatchColumns(batch)
+    paths   = [viterbi(model,columns) for model in models]
+    if (len(models) == 1):
+        # What follows each line is one of the model's labels, with the blank line that ends a sentence after its last token.
+        labels   = models[0].labels
+        suffixes = numpy.array([u"\t%s\n" % label for label in labels] + [u"\t%s\n\n" % label for label in labels],dtype=object)
+        return (u"".join(map(operator.add,columns.lines,suffixes[paths[0] + len(labels) * columns.isLast])),0)
+    labelLists = [[model.labels[y] for y in path.tolist()] for model,path in zip(models,paths)]
+    output     = []
+    dropped    = 0
+    start      = 0
+    for sentence in batch:
+        end        = start + len(sentence)
+        sentLabels = [labels[start:end] for labels in labelLists]
+        if (mergePolicy == "columns"):
+            labels = ["\t".join(tokenLabels) for tokenLabels in zip(*sentLabels)]
+        else:
+            (labels,numDropped) = mergeLabels(sentLabels,mergePolicy)
+            dropped += numDropped
+        output.extend(["%s\t%s\n" % pair for pair in zip(sentence,labels)])
+        output.append("\n")
+        start = end
+    return ("".join(output),dropped)
+
+def limitVocabs ():
+    """Clears the line and column vocabularies, and the id tables of the templates that index them, once they hold
+       MAX_VOCAB strings between them.  Called between batches, when no codes are in use."""
+    global lineVocab
+    templates = [template for model in models for template in model.unigramTemplates + model.bigramTemplates]
+    size      = sum([len(vocab.strings) for vocab in columnVocabs.values()]) + sum([len(template.comboIds) for template in templates])
+    if (lineVocab == None or len(lineVocab.codes) + size >= MAX_VOCAB):
+        lineVocab = LineVocab()
+        columnVocabs.clear()
+        for template in templates:
+            template.idTable  = numpy.zeros(0,dtype=numpy.int64)
+            template.comboIds = dict()
+
+def mergeLabels (labelLists,policy):
+    """Takes one list of labels per model for a sentence; returns a single list of labels, and the number of entities
+       dropped.  Entities are taken in policy order, each kept unless it overlaps one already kept, and keep the labels
+       their model gave them; tokens outside them are 'O'."""
+    entities = []
+    for m,labels in enumerate(labelLists):
+        entities.extend([(start,end,m) for (start,end) in labelSpans(labels)])
+    if (policy == "longest"):
+        entities.sort(key=lambda (start,end,m): (start - end,m,start))
+    else:
+        entities.sort(key=lambda (start,end,m): (m,start))
+    merged  = ["O"] * len(labelLists[0])
+    taken   = [False] * len(merged)
+    dropped = 0
+    for (start,end,m) in entities:
+        if (any(taken[start:end+1])):
+            dropped += 1
+            continue
+        for i in range(start,end+1):
+            merged[i] = labelLists[m][i]
+            taken[i]  = True
+    return (merged,dropped)
+
+
+def columnVocab (col):
+    """Returns the ColumnVocab of a column of the feature matrix, shared by every batch and model."""
+    vocab = columnVocabs.get(col)
+    if (vocab == None):
+        vocab = ColumnVocab()
+        columnVocabs[col] = vocab
+    return vocab
+
+
+def viterbi (model,columns):
+    """Takes the BatchColumns of a batch of sentences; returns an array of label indices, one per token in batch order,
+       the highest scoring label sequence for each sentence."""
+    numLabels   = len(model.labels)
+    # Unigram scores: (tokens, labels).  Bigram scores: (tokens, previous label, label), for the transition into each
+    # token.  In the usual case of a lone 'B' template these are the same everywhere, and there is just one row of them.
+    unigrams    = scoreFeatures(model,model.unigramTemplates,columns,numLabels)
+    transitions = scoreFeatures(model,model.bigramTemplates,columns,numLabels*numLabels).reshape(-1,numLabels,numLabels)
+    paths       = numpy.zeros(columns.numTokens,dtype=numpy.int64)
+    for length,starts in columns.buckets().items():
+        numSents  = len(starts)
+        tokens    = starts[:,numpy.newaxis] + numpy.arange(length)   # (sentences, positions)
+        best      = numpy.zeros((numSents,numLabels)) + atTokens(unigrams,tokens[:,0])
+        backPtrs  = numpy.zeros((numSents,length,numLabels),dtype=numpy.int32)
+        for t in range(1,length):
+            # Ties go to the lowest previous label, as in CRF++.
+            cand          = best[:,:,numpy.newaxis] + atTokens(transitions,tokens[:,t])
+            backPtrs[:,t] = cand.argmax(axis=1)
+            best          = cand.max(axis=1) + atTokens(unigrams,tokens[:,t])
+        path       = numpy.zeros((numSents,length),dtype=numpy.int64)
+        path[:,-1] = best.argmax(axis=1)
+        sentRange  = numpy.arange(numSents)
+        for t in range(length-1,0,-1):
+            path[:,t-1] = backPtrs[sentRange,t,path[:,t]]
+        paths[tokens] = path
+    return paths
+
+def atTokens (scores,tokens):
+    """Returns the rows of scores for an array of tokens; a single row of scores is the same for all of them."""
+    return scores[tokens] if len(scores) > 1 else scores[0]
+
+def scoreFeatures (model,templates,columns,width):
+    """Expands the templates at every token of the batch, and sums the 'width' weights that follow the id of each
+       resulting feature, template by template.  Returns an array of shape (tokens, width), or (1, width) if no template
+       refers to the input, as the scores are then the same for every token."""
+    scores = numpy.zeros((1,width))
+    # The weights of the feature with id i are row i of this view: no copy is made.
+    rows   = numpy.lib.stride_tricks.as_strided(model.weights,shape=(len(model.weights) - width + 1,width),
+                                                strides=(model.weights.strides[0],model.weights.strides[0]))
+    for template in templates:
+        if (template.refs):
+            weights = rows.take(template.expand(columns),axis=0)
+        else:
+            weights = rows[template.featureId(())][numpy.newaxis,:]
+        if (len(weights) > len(scores)):
+            scores = scores + weights
+        else:
+            scores += weights
+    return scores
+
+
+def nonOverlapping (files1, files2):
+    """Takes two lists of files; raises an exception if they overlap."""
+    for file1 in files1:
+        for file2 in files2:
+            if (file1 != None and file2 != None and file1 == file2):
+                raise RuntimeError(format("Can't overwrite %s" % file1))
+
+
+class FeatureTemplate(object):
+    """A CRF++ template line like 'U01+0:%x[-1,9]/%x[0,9]', compiled into a format string like 'U01+0:%s/%s' and the
+       list of (row,col) references whose values are substituted into it."""
+    def __init__ (self,template,model):
+        self.template = template
+        self.model    = model
+        self.refs     = []
+        self.idTable  = numpy.zeros(0,dtype=numpy.int64)  # Feature id per column code, for single-reference templates.
+        self.comboIds = dict()                            # Feature id per packed combination of codes, for conjunctions.
+        pieces        = []
+        pos           = 0
+        for match in re.finditer(r'%x\[(-?\d+),(\d+)\]',template):
+            row = int(match.group(1))
+            col = int(match.group(2))
+            if (row < -MAX_CONTEXT or row > MAX_CONTEXT):
+                raise RuntimeError(format("Row %d is outside of the +-%d context CRF++ allows in template %s" % (row,MAX_CONTEXT,template)))
+            pieces.append(template[pos:match.start()].replace("%","%%"))
+            pieces.append("%s")
+            self.refs.append((row,col))
+            pos = match.end()
+        pieces.append(template[pos:].replace("%","%%"))
+        self.format = "".join(pieces)
+
+    def featureId (self,values):
+        """Returns the id of the feature this template expands to for the tuple of reference values."""
+        return self.model.featureIds.get(self.format % values,self.model.missingId)
+
+    def expand (self,columns):
+        """Returns the array of feature ids this template expands to at every token of a batch."""
+        if (len(self.refs) == 0):
+            return numpy.repeat(self.featureId(()),columns.numTokens)
+        codes = [columns.codes(ref) for ref in self.refs]
+        if (len(codes) == 1):
+            return self.expandSingle(codes[0],columnVocab(self.refs[0][1]))
+        if (len(codes) * CODE_BITS < 64 and max([column.max() for column in codes]) < 1 << CODE_BITS):
+            return self.expandPacked(codes)
+        # Other conjunctions are looked up once per distinct combination of codes in the batch.
+        stacked  = numpy.ascontiguousarray(numpy.column_stack(codes))
+        rows     = stacked.view(numpy.dtype((numpy.void,stacked.dtype.itemsize * stacked.shape[1]))).ravel()
+        (uniq,firsts,inverse) = numpy.unique(rows,return_index=True,return_inverse=True)
+        vocabs   = [columnVocab(col) for (row,col) in self.refs]
+        ids      = [self.featureId(tuple([vocab.strings[code] for vocab,code in zip(vocabs,stacked[first])])) for first in firsts]
+        return numpy.array(ids,dtype=numpy.int64)[inverse]
+
+    def expandSingle (self,codes,vocab):
+        """Maps column codes to feature ids through idTable, extending it for any codes that are new since the last call."""
+        known = len(self.idTable)
+        if (len(vocab.strings) > known):
+            newIds       = [self.featureId((value,)) for value in vocab.strings[known:]]
+            self.idTable = numpy.concatenate([self.idTable,numpy.array(newIds,dtype=numpy.int64)])
+        return self.idTable[codes]
+
+    def expandPacked (self,codes):
+        """Maps the codes of a conjunction, packed into one integer per token, to feature ids through comboIds, looking
+           up the feature of each combination the first time it is seen."""
+        keys = codes[0]
+        for column in codes[1:]:
+            keys = (keys << CODE_BITS) | column
+        (uniq,inverse) = numpy.unique(keys,return_inverse=True)
+        ids     = numpy.array(map(self.comboIds.get,uniq.tolist(),itertools.repeat(-1,len(uniq))),dtype=numpy.int64)
+        missing = numpy.flatnonzero(ids < 0)
+        if (len(missing)):
+            newKeys   = uniq[missing]
+            shifts    = range(CODE_BITS * (len(self.refs) - 1),-1,-CODE_BITS)
+            values    = [map(columnVocab(col).strings.__getitem__,((newKeys >> shift) & ((1 << CODE_BITS) - 1)).tolist())
+                         for (row,col),shift in zip(self.refs,shifts)]
+            (featureIds,missingId,form) = (self.model.featureIds,self.model.missingId,self.format)
+            newIds    = [featureIds.get(form % combination,missingId) for combination in zip(*values)]
+            ids[missing] = newIds
+            self.comboIds.update(itertools.izip(newKeys.tolist(),newIds))
+        return ids[inverse]
+
+class ColumnVocab(object):
+    """Assigns a small integer code to every distinct string seen in one column of the feature matrix.  The boundary
+       values _B-8..._B-1 are always 0...7, and _B+1..._B+8 are 8...15."""
+    def __init__ (self):
+        self.strings = BOS + EOS                                           # Code -> string
+        self.codes   = dict([(value,code) for code,value in enumerate(self.strings)])  # String -> code
+
+    def encode (self,values):
+        """Returns the array of codes for a list of strings, assigning new codes as needed."""
+        codes   = numpy.array(map(self.codes.get,values,itertools.repeat(-1,len(values))),dtype=numpy.int64)
+        missing = numpy.flatnonzero(codes < 0)
+        if (len(missing)):
+            missingValues = [values[i] for i in missing.tolist()]
+            new           = list(set(missingValues))
+            self.codes.update(itertools.izip(new,xrange(len(self.strings),len(self.strings) + len(new))))
+            self.strings.extend(new)
+            codes[missing] = map(self.codes.__getitem__,missingValues)
+        return codes
+
+class LineVocab(object):
+    """Assigns a small integer code to every distinct input line, and keeps the codes of its fields in each column's
+       ColumnVocab, so that a line seen before is coded with a single lookup rather than one per field."""
+    def __init__ (self):
+        self.codes      = dict()  # Line -> code
+        self.numFields  = None
+        self.fieldCodes = None    # (lines, fields) array of the column codes of each line's fields, with room to grow
+
+    def encode (self,lines):
+        """Returns the array of codes for a list of lines, splitting and coding the fields of those not seen before."""
+        codes   = numpy.array(map(self.codes.get,lines,itertools.repeat(-1,len(lines))),dtype=numpy.int64)
+        missing = numpy.flatnonzero(codes < 0)
+        if (len(missing)):
+            missingLines = [lines[i] for i in missing.tolist()]
+            self.add(list(set(missingLines)))
+            codes[missing] = map(self.codes.__getitem__,missingLines)
+        return codes
+
+    def add (self,lines):
+        """Codes the fields of distinct new lines, splitting them all in one go: field j of each is then every
+           numFields-th of the fields, from the j-th."""
+        if (self.numFields == None):
+            self.numFields = lines[0].count(u"\t") + 1
+        if (set(map(operator.methodcaller("count",u"\t"),lines)) != set([self.numFields - 1])):
+            raise RuntimeError("Inconsistent number of fields in the input lines")
+        fields = u"\t".join(lines).split(u"\t")
+        start  = len(self.codes)
+        end    = start + len(lines)
+        if (self.fieldCodes is None or end > len(self.fieldCodes)):
+            grown = numpy.zeros((max(2 * end,1024),self.numFields),dtype=numpy.int32)
+            if (self.fieldCodes is not None):
+                grown[:start] = self.fieldCodes[:start]
+            self.fieldCodes = grown
+        for col in range(self.numFields):
+            self.fieldCodes[start:end,col] = columnVocab(col).encode(fields[col::self.numFields])
+        self.codes.update(itertools.izip(lines,xrange(start,end)))
+
+class BatchColumns(object):
+    """The coded columns of the feature matrix of a batch of sentences, each an array with one code per token, in batch
+       order, and the codes each %x[row,col] reference takes at every token."""
+    def __init__ (self,batch):
+        self.lines       = [line for sentence in batch for line in sentence]
+        self.numTokens   = len(self.lines)
+        self.lineCodes   = lineVocab.encode(self.lines)
+        self.sentLengths = numpy.array([len(sentence) for sentence in batch],dtype=numpy.int64)
+        self.starts      = numpy.cumsum(self.sentLengths) - self.sentLengths
+        self.lengths     = numpy.repeat(self.sentLengths,self.sentLengths)                       # Per token: its sentence's length,
+        self.positions   = numpy.arange(self.numTokens) - numpy.repeat(self.starts,self.sentLengths)  # and its position in it.
+        self.isLast      = (self.positions == self.lengths - 1).astype(numpy.int64)
+        self.columns     = dict()  # Column index -> array of codes
+        self.refs        = dict()  # (row,col) -> array of codes
+
+    def buckets (self):
+        """Returns a dict from each sentence length to the array of the first tokens of the sentences of that length."""
+        buckets = dict()
+        for length,start in zip(self.sentLengths.tolist(),self.starts.tolist()):
+            buckets.setdefault(length,[]).append(start)
+        return dict([(length,numpy.array(starts,dtype=numpy.int64)) for length,starts in buckets.items()])
+
+    def column (self,col):
+        coded = self.columns.get(col)
+        if (coded is None):
+            if (col >= lineVocab.numFields):
+                raise RuntimeError(format("Template refers to column %d, but the input lines only have %d" % (col,lineVocab.numFields)))
+            coded = lineVocab.fieldCodes[self.lineCodes,col].astype(numpy.int64)
+            self.columns[col] = coded
+        return coded
+
+    def codes (self,ref):
+        """Returns the codes of reference (row,col) at every token: those of the column row tokens away, or where that is
+       outside the sentence, of CRF++'s boundary value for it."""
+        codes = self.refs.get(ref)
+        if (codes is None):
+            (row,col) = ref
+            codes     = self.column(col)
+            if (row != 0):
+                target = self.positions + row
+                codes  = codes[numpy.clip(numpy.arange(self.numTokens) + row,0,self.numTokens - 1)]
+                codes  = numpy.where(target < 0,MAX_CONTEXT + target,codes)
+                codes  = numpy.where(target >= self.lengths,MAX_CONTEXT + target - self.lengths,codes)
+            self.refs[ref] = codes
+        return codes
+
+class CRFModel(object):
+    """The parts of a CRF++ text model needed for decoding."""
+    def __init__ (self):
+        self.labels           = []      # Label strings, indexed by label id.
+        self.unigramTemplates = []      # FeatureTemplates for the U templates.
+        self.bigramTemplates  = []      # FeatureTemplates for the B templates.
+        self.featureIds       = dict()  # Expanded feature string -> index of its first weight.
+        self.weights          = None    # Weights, followed by a block of zeros.
+        self.missingId        = None    # Id standing in for features not in the dictionary; points at the zeros.
+        self.plan             = None    # Column names of the feature plan, for a model from a bundle.
+
+# Call the 'main' function if we are being invoke in a script context.
+if (__name__ == "__main__"):
+    main()
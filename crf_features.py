@@ -4,18 +4,32 @@ import string
 from sys import stdin,stdout,stderr
 import inspect
 import codecs
+import zlib
+import json
+import StringIO
+from time import time
 from argparse import ArgumentParser
+from sentence_splitting import findSplitPoints,splitAt,labelSpans
+from feature_csr import CSRWriter
+from model_bundle import readBundleHeader
 
 scriptArgs = ArgumentParser(description="Extracts features for input to CRF++'s crf_learn and crf_test executables")
 
 scriptArgs.add_argument('--input',help="Optional input file, with one token per line. Additional tab-separated fields, e.g. a label, may follow. Reads from stdin if no argument provided.")
-scriptArgs.add_argument('--output',help="Optional output file with lines of the form '<token><tab><feat><tab<feat><tab>...<label>'. Writes to stdout if no argument provided.")
-scriptArgs.add_argument('--featlist',help="Required input file with features to be extracted, one feature entry per line.",required=True)
-scriptArgs.add_argument('--templates',help="Optional output file containing feature template definitions needed by crf_learn")
+scriptArgs.add_argument('--output',nargs='+',help="Optional output file with lines of the form '<token><tab><feat><tab<feat><tab>...<label>'. Writes to stdout if no argument provided. With several feat-lists, one output file per feat-list, in the same order.")
+scriptArgs.add_argument('--featlist',nargs='+',help="Input file with features to be extracted, one feature entry per line. Several feat-lists may be given, in which case the features they use are computed once per token, and a feature matrix and template file is written for each. Required unless --bundle is given.")
+scriptArgs.add_argument('--bundle',help="Model bundle, made by make_bundle.py, whose feature plan is used instead of --featlist: the input is featurized exactly as the model's training data was, without reading the feat-list or its word and phrase list files. If the model was trained with --extrafeatdefs, give the same file again, or --trustbundle.")
+scriptArgs.add_argument('--templates',nargs='+',help="Optional output file containing feature template definitions needed by crf_learn. With several feat-lists, one template file per feat-list, in the same order.")
+scriptArgs.add_argument('--plan',nargs='+',help="Optional output file for the feature plan resolved from the feat-list, as JSON: the feature matrix columns and how each is computed, OPTIONS: monocase, any --extrafeatdefs, the contents of its word and phrase lists, and the templates. make_bundle.py bundles it with the trained model. With several feat-lists, one plan file per feat-list, in the same order.")
+scriptArgs.add_argument('--csr',nargs='+',help="Optional output directory for the feature matrix as a SciPy-style CSR matrix of memory-mappable NumPy .npy files: a row per token, a column per distinct feature the unigram templates expand to, the label of each token, and the feature strings.  The text matrix is then only written if --output is given. With several feat-lists, one directory per feat-list, in the same order.")
 scriptArgs.add_argument('--labeled',action='store_true',help="Require input lines to have a label as well as a token.")
 scriptArgs.add_argument('--monocase',action='store_true',help="Convert all input tokens to lower case before feature extraction.")
 scriptArgs.add_argument('--verbose',action='store_true',help="Print out extra information about the feature extraction.")
-scriptArgs.add_argument('--extrafeatdefs',help="File of additional 'defFeat' feature definitions to use.")
+scriptArgs.add_argument('--extrafeatdefs',help="File of additional 'defFeat' feature definitions to use. With --bundle, it must be the file the model was trained with.")
+scriptArgs.add_argument('--trustbundle',action='store_true',help="With --bundle, run the additional feature definitions the bundle carries, if any. They are Python code, so only give this for bundles from a source you trust; otherwise give the definitions' file with --extrafeatdefs.")
+scriptArgs.add_argument('--maxlength',type=int,help="Optional maximum sentence length. Longer sentences are split into pieces, at punctuation where possible, and never inside a labeled entity.")
+scriptArgs.add_argument('--profile',help="Optional output file to which the time, call count and number of distinct values of each feature, and the time taken by each stage of the sentence loop, are written as JSON. They are also printed as a table on stderr.")
+scriptArgs.add_argument('--piecemap',help="Optional output file recording, for each sentence written, the number of the input sentence it is a piece of and its token offset in it. Used by stitch_pieces.py to rejoin tagged pieces.")
 
         
 argValues = vars(scriptArgs.parse_args())
@@ -24,14 +38,21 @@ argValues = vars(scriptArgs.parse_args())
 # Command line arguments
 
 
-inputFile    = argValues["input"]
-outputFile   = argValues["output"]
-featListFile = argValues["featlist"]
-templateFile = argValues["templates"]
-labeled      = argValues["labeled"]
-verbose      = argValues["verbose"]
-monocase     = argValues["monocase"]
-featDefsFile = argValues["extrafeatdefs"]
+inputFile     = argValues["input"]
+outputFiles   = argValues["output"]
+featListFiles = argValues["featlist"]
+bundleFile    = argValues["bundle"]
+templateFiles = argValues["templates"]
+planFiles     = argValues["plan"]
+csrDirs       = argValues["csr"]
+labeled       = argValues["labeled"]
+verbose       = argValues["verbose"]
+monocase      = argValues["monocase"]
+featDefsFile  = argValues["extrafeatdefs"]
+trustBundle   = argValues["trustbundle"]
+maxLength     = argValues["maxlength"]
+pieceMapFile  = argValues["piecemap"]
+profileFile   = argValues["profile"]
 
 
 # Mapping from feature names to FeatDefinition objects.
@@ -39,11 +60,22 @@ featDefsFile = argValues["extrafeatdefs"]
 featureNamesToDefinitions = {}
 
 # The list of specific features and their associated functions that that will be used in the current run of the program.
+# With several feat-lists, these are the union of their columns, each of which has a FeatList saying which it uses.
 
-featureEntries         = []  # Entries in the feature list file.
-featureNamesUsed       = []  # Column names of the feature matrix.
+featLists              = []  # FeatList objects, one per feat-list file.
+featureNamesUsed       = []  # Names of the feature columns computed for each token.
 featureDefinitionsUsed = []  # Corresponding feature definitions of those columns.
 
+# The tokens of the sentence being featurized, and the columns computed for it so far by feature name, so that a hashed
+# feature reuses the values of the features it hashes rather than computing them again.
+
+sentenceColumns = (None,{})
+
+# What a feature plan needs, besides the columns and the word and phrase lists they are defined from, which each FeatList
+# keeps, to define them again: the source of the --extrafeatdefs file, if any.
+
+extraFeatDefs = None
+
 # Constant that is used to denote null aka missing aka empty feature value
 
 EMPTY = "_NULL_"
@@ -55,6 +87,19 @@ VOWELS           = set("a e i o u A E I O U".split())
 cvdTranslation   = None  # Gets initialized by function
 shapeTranslation = None
 
+# Mapping from feature and stage names to FeatProfile objects; None unless profiling.
+
+featProfiles = None
+
+# The time spent in the feature calls made by each profiled feature call in progress, innermost last, so that a feature
+# that calls others, like a hashed one, is charged only for its own time.
+
+nestedFeatSeconds = []
+
+# Distinct values are counted for each feature up to this many; beyond it only the count of values output goes on.
+
+MAX_PROFILE_VALUES = 100000
+
 
 
 # Features inspired by:
@@ -68,26 +113,87 @@ shapeTranslation = None
 
 def main ():
     """The function that is called in a command line context. """
+    global monocase
+    if ((featListFiles == None) == (bundleFile == None)):
+        raise RuntimeError("Give either --featlist or --bundle")
     # Make sure we aren't unintentionally overwriting an input file        
-    nonOverlapping([featListFile,inputFile,featDefsFile],[outputFile,templateFile])
+    nonOverlapping((featListFiles or []) + [inputFile,featDefsFile,bundleFile],
+                   (outputFiles or []) + (templateFiles or []) + (csrDirs or []) + (planFiles or []) + [pieceMapFile,profileFile])
+    makeFeatLists()
     # Initialize whatever script variables have to be initialized
     initializeScriptData()
     # Define the script's built-in features
     defineBuiltInFeatures()   
-    # Read any additional feature definitions that may have been specified
-    if (featDefsFile):
-        readExtraFeatDefsFile(featDefsFile)
-    # Read the list of feature entries we will be working with
-    readFeatureListFile(featListFile)
+    if (bundleFile):
+        # Everything else comes from the bundle's feature plan
+        readPlan(featLists[0],readBundleHeader(bundleFile)["plan"])
+        addFeatureColumns(featLists[0])
+    else:
+        # Read any additional feature definitions that may have been specified
+        if (featDefsFile):
+            readExtraFeatDefsFile(featDefsFile)
+        # Read the lists of feature entries we will be working with.  An OPTIONS line only applies to its own feat-list, and
+        # since tokens are featurized once for all of them, the feat-lists have to agree on it.
+        monocaseArg = monocase
+        for featList in featLists:
+            monocase = monocaseArg
+            readFeatureListFile(featList)
+            featList.monocase = monocase
+            if (featList.monocase != featLists[0].monocase):
+                raise RuntimeError(format("Feat-lists %s and %s differ in OPTIONS: monocase" % (featLists[0].featListFile,featList.featListFile)))
+            addFeatureColumns(featList)
     # Print them out if we are in 'verbose' mode.
     if (verbose):
-        printFeatsUsed()
+        for featList in featLists:
+            printFeatsUsed(featList)
+    # Set up profiling if it was asked for; otherwise it costs nothing.
+    if (profileFile):
+        enableProfiling()
     # Featurize the file.            
-    writeFeatMatrixFile(inputFile,outputFile,labeled)
-    # Write out the template file if a template file argument was provided.
-    if (templateFile):
-        writeTemplateFile(templateFile)
+    startTime = time()
+    writeFeatMatrixFile(inputFile,featLists,labeled)
+    if (profileFile):
+        writeProfile(profileFile,time() - startTime)
+    # Write out the template and plan files if those arguments were provided.
+    for featList in featLists:
+        if (featList.templateFile):
+            writeTemplateFile(featList.templateFile,featList)
+        if (featList.planFile):
+            writePlanFile(featList.planFile,featList)
     
+def makeFeatLists ():
+    """Pairs each feat-list file given on the command line, or the bundle, with its output, template and plan files."""
+    sources  = featListFiles or [bundleFile]
+    numLists = len(sources)
+    if (numLists > 1 and csrDirs == None and (outputFiles == None or len(outputFiles) != numLists)):
+        raise RuntimeError(format("With %d feat-lists, %d output files are needed" % (numLists,numLists)))
+    for files in [outputFiles,templateFiles,csrDirs,planFiles]:
+        if (files != None and len(files) != numLists):
+            raise RuntimeError(format("Got %d feat-lists, but %d output, template, CSR or plan files" % (numLists,len(files))))
+    allOutputs = (outputFiles or []) + (templateFiles or []) + (csrDirs or []) + (planFiles or [])
+    for i,filename in enumerate(allOutputs):
+        nonOverlapping([filename],allOutputs[i+1:])
+    for i,featListFile in enumerate(sources):
+        outputFile   = outputFiles[i] if outputFiles != None else None
+        templateFile = templateFiles[i] if templateFiles != None else None
+        featList     = FeatList(featListFile,outputFile,templateFile)
+        featList.csrDir   = csrDirs[i] if csrDirs != None else None
+        featList.planFile = planFiles[i] if planFiles != None else None
+        featLists.append(featList)
+
+def addFeatureColumns (featList):
+    """Adds the columns of a feat-list that are not computed already to featureNamesUsed and featureDefinitionsUsed, and
+       records the index in those of each of the feat-list's own columns.  Columns are shared when they have the same
+       definition, so a feature redefined by a later feat-list gets a column of its own."""
+    for featName,featDef in zip(featList.featureNames,featList.featureDefinitions):
+        matching = [i for i,used in enumerate(featureDefinitionsUsed) if used is featDef]
+        if (matching):
+            featList.columns.append(matching[0])
+        else:
+            featList.columns.append(len(featureDefinitionsUsed))
+            featureNamesUsed.append(featName)
+            featureDefinitionsUsed.append(featDef)
+
 def initializeScriptData ():
     global cvdTranslation,shapeTranslation
     cvdTranslation   = makeCVDTranslation()
@@ -111,29 +217,41 @@ def initializeScriptData ():
 #         writeTemplateFile(templateFile)
 
 
-def writeFeatMatrixFile (inputFile,outputFile,labeled):
-    """Featurizes inputFile, writing the result to outputFile.  If 'labeled' is True, lines in the inputFile must have a label. """
+def writeFeatMatrixFile (inputFile,featLists,labeled):
+    """Featurizes inputFile, writing the result to the output file of each FeatList.  If 'labeled' is True, lines in the inputFile must have a label. """
     reqFields = None
     instream  = codecs.open(inputFile,encoding="utf-8",mode="rb") if inputFile != None else stdin 
-    outstream = codecs.open(outputFile,encoding="utf-8",mode="wb") if outputFile != None else stdout
+    for featList in featLists:
+        if (featList.outputFile != None or featList.csrDir == None):
+            featList.outstream = codecs.open(featList.outputFile,encoding="utf-8",mode="wb") if featList.outputFile != None else stdout
+        if (featList.csrDir != None):
+            featList.csr = CSRWriter(featList.csrDir,templateLines(featList),["token"] + featList.featureNames,labeled)
+    pieceMap  = open(pieceMapFile,"wb") if pieceMapFile != None else None
     tokens  = []
     labels = []
     lineNum = 1
+    sentNum = 0
     while (True):
         line = instream.readline()
         if (not line):
             break
         line = line.strip()
         if (line == ""):
-            featuresPerWord = featurizeSentence(tokens)
-            for i in range(0,len(tokens)):
-                outfields = [tokens[i]]
-                outfields.extend(featuresPerWord[i])
-                outfields.extend(labels[i])
-                # outstream.write("%s\n" % join(outfields,"\t"))
-                outstream.write("%s\n" % "\t".join(outfields))
-            outstream.write("\n")
-            outstream.flush()
+            # Split overly long sentences into pieces, each of which is featurized and written out as a sentence of its own
+            splits = []
+            if (maxLength is not None):
+                spans  = labelSpans([fields[-1] for fields in labels]) if labeled else []
+                splits = findSplitPoints(tokens,maxLength,spans)
+            offset = 0
+            for pieceTokens,pieceLabels in zip(splitAt(tokens,splits),splitAt(labels,splits)):
+                writeFeaturizedSentence(pieceTokens,pieceLabels,featLists)
+                if (pieceMap):
+                    pieceMap.write("%d\t%d\n" % (sentNum,offset))
+                offset += len(pieceTokens)
+            for featList in featLists:
+                if (featList.outstream):
+                    featList.outstream.flush()
+            sentNum += 1
             tokens = []
             labels = []
         else:
@@ -156,18 +274,44 @@ def writeFeatMatrixFile (inputFile,outputFile,labeled):
         raise RuntimeError("Input file did not end with an empty line as required")
     if (inputFile != None):
         instream.close()     
-    if (outputFile != None):
-        outstream.close()  
+    for featList in featLists:
+        if (featList.outputFile != None):
+            featList.outstream.close()
+        if (featList.csr):
+            featList.csr.close({"featlist": featList.featListFile, "monocase": featList.monocase})
+    if (pieceMap):
+        pieceMap.close()
+
+def writeFeaturizedSentence (tokens,labels,featLists):
+    """Writes the feature matrix rows for a sentence to the output of each FeatList, each row being the token, the feat-list's
+       features and the label fields, followed by an empty line, and adds them to its CSR matrix if it has one.  The
+       features are computed once for all feat-lists."""
+    featuresPerWord = featurizeSentence(tokens)
+    for featList in featLists:
+        columns   = featList.columns
+        allUsed   = (len(columns) == len(featureDefinitionsUsed))
+        outstream = featList.outstream
+        rows      = []
+        for i in range(0,len(tokens)):
+            outfields = [tokens[i]]
+            outfields.extend(featuresPerWord[i] if allUsed else [featuresPerWord[i][c] for c in columns])
+            rows.append(outfields)
+            if (outstream):
+                # outstream.write("%s\n" % join(outfields,"\t"))
+                outstream.write("%s\n" % "\t".join(outfields + labels[i]))
+        if (outstream):
+            outstream.write("\n")
+        if (featList.csr):
+            featList.csr.addSentence(rows,[fields[-1] for fields in labels] if labeled else None)
 
 def featurizeSentence (tokens):
-    """Takes a list of tokens, and returns a corresponding list of feature values"""
-    columnsPerFeature = []
-    for featDef in featureDefinitionsUsed:
-        column = featDef.sequenceFunc(tokens)
-        for i,val in enumerate(column):
-            if (val == None):
-                column[i] = EMPTY
-        columnsPerFeature.append(column)
+    """Takes a list of tokens, and returns a corresponding list of feature values.  Hashed features are computed after
+       the others, so that they find the columns of the features they hash already computed."""
+    global sentenceColumns
+    sentenceColumns = (tokens,{})
+    for featDef in sorted(featureDefinitionsUsed,key=lambda featDef: featDef.hashing != None):
+        sentenceColumn(featDef,tokens)
+    columnsPerFeature = [sentenceColumns[1][featDef.name] for featDef in featureDefinitionsUsed]
     rowsPerToken = []
     for i in range(0,len(tokens)):
         row = []
@@ -176,9 +320,95 @@ def featurizeSentence (tokens):
         rowsPerToken.append(row)
     return rowsPerToken
 
+def sentenceColumn (featDef,tokens):
+    """Returns a feature's column of values for the tokens, with EMPTY for None.  For the sentence being featurized, it is
+       computed only once."""
+    (columnTokens,columns) = sentenceColumns
+    column = columns.get(featDef.name) if columnTokens is tokens else None
+    if (column == None):
+        column = featDef.sequenceFunc(tokens)
+        for i,val in enumerate(column):
+            if (val == None):
+                column[i] = EMPTY
+        if (columnTokens is tokens):
+            columns[featDef.name] = column
+    return column
+
+def enableProfiling ():
+    """Wraps the sequence function of each feature used, and the featurizer's per-sentence functions, so that their
+       times, call counts and, for features, distinct output values, are recorded in featProfiles."""
+    global featProfiles,featurizeSentence,writeFeaturizedSentence
+    featProfiles = {}
+    for featDef in featureDefinitionsUsed:
+        featDef.sequenceFunc = profiledFunction(featDef.name,featDef.sequenceFunc,countValues=True)
+    featurizeSentence       = profiledFunction("(featurize)",featurizeSentence)
+    writeFeaturizedSentence = profiledFunction("(featurize+write)",writeFeaturizedSentence)
+
+def profiledFunction (name,func,countValues=False):
+    """Returns a function that calls func and adds the time taken to the FeatProfile of the given name.  If countValues
+       is true, func is a feature's sequence function: the values it returns are counted too, up to MAX_PROFILE_VALUES
+       distinct ones, and the time of the feature calls it makes is left out of its own."""
+    profile = FeatProfile(name)
+    featProfiles[name] = profile
+    def profiled (*args):
+        if (not countValues):
+            startTime = time()
+            result    = func(*args)
+            profile.seconds += time() - startTime
+            profile.calls   += 1
+            return result
+        nestedFeatSeconds.append(0.0)
+        startTime = time()
+        try:
+            result = func(*args)
+        finally:
+            seconds = time() - startTime
+            nested  = nestedFeatSeconds.pop()
+            if (nestedFeatSeconds):
+                nestedFeatSeconds[-1] += seconds
+        profile.seconds += seconds - nested
+        profile.calls   += 1
+        profile.tokens  += len(result)
+        if (len(profile.values) < MAX_PROFILE_VALUES):
+            profile.values.update(result)
+        return result
+    return profiled
+
+def writeProfile (filename,totalSeconds):
+    """Writes the profile of a featurization run that took totalSeconds as JSON to the file, and as a table, sorted by
+       time, to stderr.  The time spent reading input is what is left of the total after featurizing and writing.  A
+       feature's distinct values are given as at least MAX_PROFILE_VALUES, with distinctValuesCapped, if it had more."""
+    featurizing = featProfiles.pop("(featurize)")
+    sentences   = featProfiles.pop("(featurize+write)")
+    features = []
+    for profile in featProfiles.values():
+        capped = len(profile.values) >= MAX_PROFILE_VALUES
+        features.append({"feature": profile.name, "seconds": profile.seconds, "calls": profile.calls, "tokens": profile.tokens,
+                         "distinctValues": min(len(profile.values),MAX_PROFILE_VALUES), "distinctValuesCapped": capped})
+    features.sort(key=lambda f: f["seconds"],reverse=True)
+    stages = {"total": totalSeconds, "featurize": featurizing.seconds, "write": sentences.seconds - featurizing.seconds,
+              "read": totalSeconds - sentences.seconds, "sentences": sentences.calls}
+    with open(filename,"wb") as outstream:
+        json.dump({"features": features, "stages": stages},outstream,indent=1,sort_keys=True)
+    stderr.write("\nFeature profile:\n\n")
+    stderr.write("%-40s %10s %8s %10s %10s %8s\n" % ("feature","seconds","percent","calls","tokens","distinct"))
+    for f in features:
+        percent = 100.0 * f["seconds"] / max(totalSeconds,1e-9)
+        distinct = format(("%d+" if f["distinctValuesCapped"] else "%d") % f["distinctValues"])
+        stderr.write("%-40s %10.3f %7.1f%% %10d %10d %8s\n" % (f["feature"],f["seconds"],percent,f["calls"],f["tokens"],distinct))
+    stderr.write("\nSentence loop (%d sentences): read %.3fs, featurize %.3fs, write %.3fs, total %.3fs\n" %
+                 (stages["sentences"],stages["read"],stages["featurize"],stages["write"],stages["total"]))
+
 def readExtraFeatDefsFile (filename):
     stderr.write("Reading additional feature defs from %s\n" % filename)
-    execfile(filename,globals(),locals())
+    with open(filename,"rb") as instream:
+        executeFeatDefs(instream.read(),filename)
+
+def executeFeatDefs (source,filename):
+    """Executes the source of a file of feature definitions, keeping it for the feature plan."""
+    global extraFeatDefs
+    extraFeatDefs = {"file": filename, "source": source}
+    exec compile(source,filename,"exec") in globals(),locals()
 
 
 def composeTokenFunctions (func1,func2):
@@ -250,7 +480,8 @@ def executeDefWordList (string):
     filenames = tokens[2]
     wordSet   = readWordSetFromFiles(filenames.split(","))
     tokenFunc = wordSetToTokenFunc(wordSet)
-    defFeat(featname,tokenFunc)
+    featDef   = defFeat(featname,tokenFunc)
+    featDef.gazetteer = {"name": featname, "type": "wordlist", "files": filenames.split(","), "words": sorted(wordSet)}
     
 def executeDefPhraseList (string):
     """Executes a feature definition that defines the feature by whole-phrase match in a phrase
@@ -260,7 +491,8 @@ def executeDefPhraseList (string):
     filenames = tokens[2]
     index     = readPhraseIndexFromFiles(filenames.split(","))
     seqFunc   = phraseIndexToSequenceFunc(index)
-    defFeat(featname,seqFunc,isSeq=True)
+    featDef   = defFeat(featname,seqFunc,isSeq=True)
+    featDef.gazetteer = {"name": featname, "type": "phraselist", "files": filenames.split(","), "index": index}
     
 
 def defFeat (name,func,isSeq=False):
@@ -286,10 +518,11 @@ def defFeat (name,func,isSeq=False):
     return featDef
 
 
-def readFeatureListFile (filename):
-    """Reads the features to be used, one feature entry per line.  Lines starting with '#' are treated as comments and ignored. Feature entries
+def readFeatureListFile (featList):
+    """Reads the features to be used, one feature entry per line, from the file of a FeatList, into the FeatList.  Lines starting with '#' are treated as comments and ignored. Feature entries
        may be simple, consisting of just a single feature reference, or compound, consisting of multiple feature references separated by '/'s. """
-    with open(filename,"r") as instream:
+    featureEntries = featList.entries
+    with open(featList.featListFile,"r") as instream:
         for line in instream:
             line = line.strip()
             # Ignore blank lines or lines starting with a '#'.
@@ -325,8 +558,21 @@ def readFeatureListFile (filename):
     for entry in featureEntries:        
         if (len(entry.featRefs) == 1):
             featName = entry.featRefs[0].feat
-            featureNamesUsed.append(featName)
-            featureDefinitionsUsed.append(getFeatDefinitionOrError(featName))
+            featList.featureNames.append(featName)
+            featList.featureDefinitions.append(getFeatDefinitionOrError(featName))
+    featList.gazetteers = usedGazetteers(featList)
+
+def usedGazetteers (featList):
+    """Returns the plan entries of the word and phrase lists that the columns of a FeatList are defined from, directly, by
+       composition like 'hairword.upcase', or by hashing.  Lists other feat-lists define, and this one doesn't use, are
+       left out."""
+    names = []
+    for featName,featDef in zip(featList.featureNames,featList.featureDefinitions):
+        for ref in (featDef.hashing[0] if featDef.hashing else [featName]):
+            name = parseFeatRef(ref).feat.split(".")[0]
+            if (name not in names):
+                names.append(name)
+    return [getFeatDefinitionOrError(name).gazetteer for name in names if getFeatDefinitionOrError(name).gazetteer]
 
 
 def parseFeatureListEntry (entryString):
@@ -349,13 +595,18 @@ def parseFeatureListEntry (entryString):
         entry.featRefs.append(parseFeatRef(featRef))
     # Parse the quantifier string, which specifies which positions the entry will apply to
     parseQuantifierString(entry,join(quantTokens))    
+    # A hashed entry is rewritten as a plain entry over a single column of bucket ids computed from its feature references
+    if (entry.hashBuckets):
+        hashedFeat     = defineHashedFeature(entry.featRefs,entry.hashBuckets)
+        entry.featRefs = [FeatRef(hashedFeat.name)]
     return entry    
 
 
 def parseQuantifierString (featListEntry,quantString):
     """Takes a FeatListEntry and the 'quantifier' portion of the feat list entry string. This string specifies the set of word positions the entry 
        is to be applied to, and whether they are to be treated bag-of-words are not.  An empty quantifier string is implicitly position 0 only. 
-       Multiple position specifications are allowed, and combined via set union."""
+       Multiple position specifications are allowed, and combined via set union.  A '-hash 2^20' (or '-hash 1048576') spec makes the entry's
+       values hashed bucket ids rather than raw strings, which puts a hard bound on the number of features the entry can produce."""
     unparsed  = quantString.strip()
     positions = set()
     while (unparsed != ""):
@@ -367,6 +618,8 @@ def parseQuantifierString (featListEntry,quantString):
         commas = re.match(r'([+-]?\d+)((,[+-]?\d+)*)',unparsed)
         # Bag-of-words spec:  -bow
         bow       = re.match(r'\-bow',unparsed)
+        # Feature hashing spec: -hash 2^20 or -hash 1048576
+        hashing   = re.match(r'\-hash\s*(\d+)(\s*\^\s*(\d+))?',unparsed)
         if (plusMinus):
             window = int(plusMinus.group(1))
             end    = plusMinus.end()
@@ -384,6 +637,15 @@ def parseQuantifierString (featListEntry,quantString):
             end = bow.end()
             featListEntry.bow = True
             unparsed = unparsed[end:].strip()
+        elif (hashing):
+            buckets = int(hashing.group(1))
+            if (hashing.group(3)):
+                buckets = buckets ** int(hashing.group(3))
+            if (buckets < 1):
+                raise RuntimeError(format("Number of hash buckets must be positive in this quantifier quantString: %s" % quantString))
+            featListEntry.hashBuckets = buckets
+            end = hashing.end()
+            unparsed = unparsed[end:].strip()
         elif (commas):
             pos1   = commas.group(1)
             others = split(commas.group(2),",")
@@ -401,6 +663,49 @@ def parseQuantifierString (featListEntry,quantString):
                    
 
 
+def defineHashedFeature (featRefs,buckets):
+    """Defines, if not already defined, a sequence feature whose value at each position is the bucket, out of 'buckets', that
+       the conjunction of the feature references' values hashes to.  Positions referenced beyond either end of the sentence
+       take CRF++'s boundary values _B-n and _B+n.  Returns the FeatDefinition."""
+    name    = format("hash%d(%s)" % (buckets,join([featRefString(ref) for ref in featRefs],"/")))
+    featDef = featureNamesToDefinitions.get(name)
+    if (featDef):
+        return featDef
+    refDefs = [(getFeatDefinitionOrError(ref.feat),ref.pos) for ref in featRefs]
+    def hashedValues (tokens):
+        columns = []
+        for featDef,pos in refDefs:
+            columns.append((sentenceColumn(featDef,tokens),pos))
+        values = []
+        for i in range(0,len(tokens)):
+            parts = []
+            for column,pos in columns:
+                j = i + pos
+                if (j < 0):
+                    parts.append(format("_B%d" % j))
+                elif (j >= len(tokens)):
+                    parts.append(format("_B+%d" % (j - len(tokens) + 1)))
+                else:
+                    parts.append(column[j])
+            values.append(str(hashBucket("/".join(parts),buckets)))
+        return values
+    featDef         = defFeat(name,hashedValues,isSeq=True)
+    featDef.hashing = ([featRefString(ref) for ref in featRefs],buckets)
+    return featDef
+
+def hashBucket (string,buckets):
+    """Returns the bucket from 0 to buckets-1 a string hashes to.  Uses CRC-32 rather than the built-in hash so that the
+       bucket is the same in every process and on every platform, which it has to be for the features a model was trained
+       with to match the ones it decodes with."""
+    return (zlib.crc32(string.encode("utf-8")) & 0xffffffff) % buckets
+
+def featRefString (featRef):
+    """Returns the feature list file form of a FeatRef, e.g. 'cvd' or 'token-1'."""
+    if (featRef.pos == 0):
+        return featRef.feat
+    return format("%s%+d" % (featRef.feat,featRef.pos))
+
+
 def parseFeatRef (featRefString):
     """Parses a single feature reference like 'cvd' or 'cvd-1' into a FeatRef object"""
     assert(featRefString)
@@ -461,26 +766,42 @@ def isDefinedFeat (string):
     """Returns true if the string is the name of an existing defined feature."""
     return featureNamesToDefinitions.get(string) != None
 
-def writeTemplateFile (filename):
-    "Writes out the template definitions in the index-addressed format that CRF++ uses."
+def writeTemplateFile (filename,featList):
+    "Writes out the template definitions of a FeatList in the index-addressed format that CRF++ uses."
+    outstream = open(filename,"wb")
+    writeTemplates(featList,outstream)
+    outstream.close()
+
+def writeTemplates (featList,outstream):
+    "Writes the template file of a FeatList to a stream: from its entries, or as its feature plan has it."
+    if (featList.templates != None):
+        for line in featList.templates:
+            outstream.write("%s\n" % line)
+        return
     # We split up unigram and bigram features, and write their template entries separately just for clarity's sake.
     unigrams = []
     bigrams  = []
-    for entry in featureEntries:
+    for entry in featList.entries:
         if (entry.type == "B"):
             bigrams.append(entry)
         else:
             unigrams.append(entry)
-    outstream = open(filename,"wb")
-    writeTemplatesForFeatEntries(unigrams,outstream)
+    writeTemplatesForFeatEntries(unigrams,featList.featureNames,outstream)
     # We typically would not expect a bigram feature except for "B" itself, but they are allowed w/o prejudice.
     if (bigrams):
         outstream.write("\n")
-        writeTemplatesForFeatEntries(bigrams,outstream)
-    outstream.close()
-
-def writeTemplatesForFeatEntries (entries,outstream):
-    "Writes a list of FeatListEntry objects to a stream, leaving the stream open when it is done"
+        writeTemplatesForFeatEntries(bigrams,featList.featureNames,outstream)
+
+def templateLines (featList):
+    """Returns the unigram template lines of a FeatList, as writeTemplateFile writes them."""
+    if (featList.templates != None):
+        return [line for line in featList.templates if line.startswith("U")]
+    outstream = StringIO.StringIO()
+    writeTemplatesForFeatEntries([entry for entry in featList.entries if entry.type != "B"],featList.featureNames,outstream)
+    return outstream.getvalue().splitlines()
+
+def writeTemplatesForFeatEntries (entries,featureNames,outstream):
+    "Writes a list of FeatListEntry objects, given the column names of their feature matrix, to a stream, leaving the stream open when it is done"
     idx = 0
     for entry in entries:
         # An entry containing no feature references is just a reference to a tag unigram or tag bigram, and 
@@ -502,7 +823,7 @@ def writeTemplatesForFeatEntries (entries,outstream):
                 for f,ref in enumerate(entry.featRefs):
                     # The column index is i+1, since index 0 in feature matrix rows is by convention the token itself. We don't have
                     # to write the token out, but we do for clarity. If the token is used as a feat itself, it will simply appear twice.
-                    col = featureNamesUsed.index(ref.feat) + 1
+                    col = featureNames.index(ref.feat) + 1
                     row = ref.pos + pos                   
                     if (f > 0):
                         outstream.write("/")
@@ -514,10 +835,77 @@ def writeTemplatesForFeatEntries (entries,outstream):
 
 
 
-def printFeatsUsed ():
-    """Prints out the feature names which define the columns of the feature matrix."""
-    stderr.write("\nColumns of feature matrix:\n\n")
-    for i,feat in enumerate(featureNamesUsed):
+def writePlanFile (filename,featList):
+    """Writes the feature plan of a FeatList as JSON: its columns, each with what a hashed one is hashed from, its monocase
+       option, the word and phrase lists and extra feature definitions they may use, and its template lines.  This is
+       what readPlan needs to featurize input for a model trained on the FeatList's feature matrix."""
+    columns = []
+    for featName,featDef in zip(featList.featureNames,featList.featureDefinitions):
+        column = {"name": featName}
+        if (featDef.hashing):
+            (column["hashRefs"],column["hashBuckets"]) = featDef.hashing
+        columns.append(column)
+    templates = StringIO.StringIO()
+    writeTemplates(featList,templates)
+    plan = {"featlist": featList.featListFile, "monocase": featList.monocase, "columns": columns, "gazetteers": featList.gazetteers,
+            "extraFeatDefs": extraFeatDefs, "templates": templates.getvalue().splitlines()}
+    with open(filename,"wb") as outstream:
+        json.dump(plan,outstream,indent=1,sort_keys=True)
+
+def readPlan (featList,plan):
+    """Sets up a FeatList, and the feature definitions its columns need, from a feature plan as writePlanFile writes it,
+       rather than from a feat-list file."""
+    global monocase
+    if (monocase and not plan["monocase"]):
+        raise RuntimeError(format("--monocase was given, but the model in %s was trained without it" % bundleFile))
+    if (plan["extraFeatDefs"]):
+        executePlanFeatDefs(plan["extraFeatDefs"])
+    elif (featDefsFile):
+        raise RuntimeError(format("--extrafeatdefs was given, but the model in %s was trained without it" % bundleFile))
+    for gazetteer in plan["gazetteers"]:
+        if (gazetteer["type"] == "wordlist"):
+            featDef = defFeat(gazetteer["name"],wordSetToTokenFunc(set(gazetteer["words"])))
+        else:
+            # Phrases are byte strings, as readPhraseIndexFromFiles reads them.
+            index = dict([(word.encode("utf-8"),[[w.encode("utf-8") for w in phrase] for phrase in phrases])
+                          for word,phrases in gazetteer["index"].items()])
+            featDef = defFeat(gazetteer["name"],phraseIndexToSequenceFunc(index),isSeq=True)
+        featDef.gazetteer = gazetteer
+        featList.gazetteers.append(gazetteer)
+    for column in plan["columns"]:
+        if ("hashRefs" in column):
+            featDef = defineHashedFeature([parseFeatRef(ref) for ref in column["hashRefs"]],column["hashBuckets"])
+        else:
+            featDef = getFeatDefinitionOrError(column["name"])
+        featList.featureNames.append(column["name"])
+        featList.featureDefinitions.append(featDef)
+    monocase           = plan["monocase"]
+    featList.monocase  = monocase
+    featList.templates = plan["templates"]
+
+
+def executePlanFeatDefs (planFeatDefs):
+    """Runs the additional feature definitions of a feature plan.  They are Python source, and a bundle may have been
+       fetched from anywhere, so the bundle's copy is only run with --trustbundle.  Otherwise the same definitions have to
+       be given with --extrafeatdefs, and are run from that file."""
+    if (featDefsFile):
+        with open(featDefsFile,"rb") as instream:
+            source = instream.read()
+        if (source != planFeatDefs["source"]):
+            raise RuntimeError(format("%s is not the --extrafeatdefs file the model in %s was trained with (%s)" % (featDefsFile,bundleFile,planFeatDefs["file"])))
+        stderr.write("Reading additional feature defs from %s\n" % featDefsFile)
+        executeFeatDefs(source,featDefsFile)
+    elif (trustBundle):
+        stderr.write("Running the additional feature defs from %s in %s\n" % (planFeatDefs["file"],bundleFile))
+        executeFeatDefs(planFeatDefs["source"],planFeatDefs["file"])
+    else:
+        raise RuntimeError(format("The model in %s was trained with the additional feature definitions in %s, which are Python code: give that file with --extrafeatdefs, or --trustbundle to run the bundle's copy" % (bundleFile,planFeatDefs["file"])))
+
+
+def printFeatsUsed (featList):
+    """Prints out the feature names which define the columns of a FeatList's feature matrix."""
+    stderr.write("\nColumns of feature matrix for %s:\n\n" % featList.featListFile)
+    for i,feat in enumerate(featList.featureNames):
         stderr.write("%-2d  %s\n" % (i+1,feat))
 
 
@@ -912,13 +1300,32 @@ def defineBuiltInFeatures ():
     defFeat('unique-chars', uniqueChars)
     defFeat('strip-vowels', stripVowels)
 
+class FeatList(object):
+    """A feat-list file, its entries and feature matrix columns, and the files its matrix and templates are written to."""
+    def __init__ (self,featListFile,outputFile,templateFile):
+        self.featListFile       = featListFile
+        self.outputFile         = outputFile
+        self.templateFile       = templateFile
+        self.entries            = []     # Entries in the feature list file.
+        self.featureNames       = []     # Column names of its feature matrix.
+        self.featureDefinitions = []     # Corresponding feature definitions of those columns.
+        self.columns            = []     # Index of each column in featureDefinitionsUsed.
+        self.monocase           = False  # Whether its OPTIONS line asks for monocase.
+        self.outstream          = None
+        self.csrDir             = None   # Directory its CSR matrix is written to, if any.
+        self.csr                = None   # The CSRWriter for that.
+        self.planFile           = None   # File its feature plan is written to, if any.
+        self.templates          = None   # Template lines, when it comes from a bundle's feature plan rather than entries.
+        self.gazetteers         = []     # Plan entries of the word and phrase lists its columns are defined from.
+
 class FeatListEntry(object):
     """Comprises a U (unigram) or B (bigram) type indicator, a window, and a list of FeatRefs."""
     def __init__ (self):
-        self.type      = "U"
-        self.featRefs  = []
-        self.positions = None
-        self.bow       = False
+        self.type        = "U"
+        self.featRefs    = []
+        self.positions   = None
+        self.bow         = False
+        self.hashBuckets = None  # Number of hash buckets if the entry's values are hashed, otherwise None.
    
 class FeatRef(object):
     """Represents a reference to a feature in the feature list file.  Is just the feature name and its relative position."""    
@@ -926,6 +1333,15 @@ class FeatRef(object):
         self.feat = feat
         self.pos  = pos
 
+class FeatProfile(object):
+    """Cumulative run time statistics for one feature definition, or one stage of the featurizer."""
+    def __init__ (self,name):
+        self.name    = name
+        self.seconds = 0.0    # Total time spent
+        self.calls   = 0      # Number of calls, i.e. sentences
+        self.tokens  = 0      # Number of values output
+        self.values  = set()  # Distinct values output, up to MAX_PROFILE_VALUES
+
 class FeatDefinition(object):
     """Represents the information needed to extract the feature"""
     def __init__ (self,name):
@@ -933,6 +1349,8 @@ class FeatDefinition(object):
         self.tokenFunc    = None  # Definitions have these unless they are are sequence-oriented.
         self.sequenceFunc = None  # Every definition will have one, constructed from tokenFunc if an explicit one is not given.
         self.isSequence   = False # A sequential feature will have only a sequenceFunc
+        self.hashing      = None  # For a hashed feature, the feature references it hashes and the number of buckets.
+        self.gazetteer    = None  # For a word or phrase list feature, its feature plan entry.
 
 # Call the 'main' function if we are being invoke in a script context. 
 if (__name__ == "__main__"):
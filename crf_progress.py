@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+import re
+import os
+import json
+import math
+import subprocess
+from sys import stdout
+from time import time,sleep
+from threading import Timer,Lock
+from argparse import ArgumentParser,REMAINDER
+
+scriptArgs = ArgumentParser(description="Runs crf_learn, passing its output through to stdout, and keeps a JSON status file up to date with its progress: iteration, objective and its change, error rates, elapsed time and a rough estimate of the time remaining. Optionally stops it when a wall-clock budget runs out. Usage: crf_progress.py --status FILE [--budget SECONDS] -- crf_learn [crf_learn args]")
+
+scriptArgs.add_argument('--status',help="Required status file, rewritten after every line of crf_learn output.",required=True)
+scriptArgs.add_argument('--budget',type=float,help="Optional wall-clock budget for crf_learn, in seconds. When it runs out, crf_learn is stopped, the status is 'stopped', and the exit status is 124.")
+scriptArgs.add_argument('command',nargs=REMAINDER,help="The crf_learn command line, after '--'.")
+
+argValues = vars(scriptArgs.parse_args())
+
+
+# Command line arguments
+
+statusFile = argValues["status"]
+budget     = argValues["budget"]
+command    = argValues["command"]
+
+# crf_learn's defaults for its stopping criteria, used unless the command line gives -e or -m.  It stops when the relative
+# change in the objective has been under eta for CONVERGED_ITERS iterations in a row, or after maxiter iterations.
+
+DEFAULT_ETA     = 0.0001
+DEFAULT_MAXITER = 10000
+CONVERGED_ITERS = 3
+
+# Number of recent iterations the rate at which the objective's relative change shrinks is estimated from, and the least
+# number needed.  The changes are noisy from one L-BFGS iteration to the next, so the estimate is a rough one.
+
+RATE_WINDOW = 50
+MIN_RATE_ITERS = 5
+
+# Exit status when the budget runs out, as for timeout(1).
+
+BUDGET_EXIT_CODE = 124
+
+ITER_PATTERN = re.compile(r'^iter=(\d+)\s+(.*)$')
+
+
+########################################################################################################################################
+
+
+def main ():
+    """The function that is called in a command line context. """
+    args = command[1:] if (command and command[0] == "--") else command
+    if (not args):
+        raise RuntimeError("No crf_learn command given")
+    progress = TrainingProgress(args)
+    process  = subprocess.Popen(args,stdout=subprocess.PIPE,stderr=subprocess.STDOUT)
+    progress.pid = process.pid
+    progress.update(state="reading")
+    timer = None
+    if (budget != None):
+        timer = Timer(budget,stopOnBudget,[process,progress])
+        timer.daemon = True
+        timer.start()
+    for line in iter(process.stdout.readline,""):
+        stdout.write(line)
+        stdout.flush()
+        progress.readLine(line.strip())
+    exitCode = process.wait()
+    if (timer):
+        timer.cancel()
+    if (progress.state == "stopped"):
+        stdout.write("STOPPED: wall-clock budget of %.0f seconds ran out after iteration %s\n" % (budget,progress.iteration))
+        progress.update(exitCode=BUDGET_EXIT_CODE)
+        exit(BUDGET_EXIT_CODE)
+    elif (exitCode == 0):
+        progress.update(state="done",exitCode=exitCode,remainingSeconds=0.0)
+    else:
+        progress.update(state="failed",exitCode=exitCode)
+    exit(exitCode)
+
+def stopOnBudget (process,progress):
+    """Called from the budget timer: stops crf_learn, giving it a few seconds to exit before killing it."""
+    if (process.poll() != None):
+        return
+    progress.update(state="stopped",message=format("Wall-clock budget of %.0f seconds ran out" % budget))
+    try:
+        process.terminate()
+        for i in range(50):
+            if (process.poll() != None):
+                return
+            sleep(0.1)
+        process.kill()
+    except OSError:
+        pass
+
+def commandOption (args,option,default,convert):
+    """Returns the value of a crf_learn option like '-m 100' or '-m100' in the command line, or the default."""
+    for i,arg in enumerate(args):
+        if (arg == option and i + 1 < len(args)):
+            return convert(args[i+1])
+        if (arg.startswith(option) and len(arg) > len(option) and not arg.startswith("--")):
+            return convert(arg[len(option):])
+    return default
+
+def estimateRemainingIterations (diffs,eta,maxIter):
+    """Takes the relative objective changes so far, one per iteration.  Returns a rough estimate of the number of iterations
+       left before crf_learn's convergence test is met, assuming the changes keep shrinking at the geometric rate of a least
+       squares fit to their logs over the last RATE_WINDOW iterations, or None if they aren't shrinking.  Never more than
+       maxIter allows."""
+    iteration = len(diffs) - 1
+    left      = max(maxIter - iteration,0)
+    converged = 0
+    for diff in reversed(diffs):
+        if (diff >= eta):
+            break
+        converged += 1
+    if (converged > 0):
+        return min(max(CONVERGED_ITERS - converged,0),left)
+    logs = [math.log(d) for d in diffs[1:][-RATE_WINDOW:] if d > 0]
+    if (len(logs) < MIN_RATE_ITERS):
+        return None
+    meanX = (len(logs) - 1) / 2.0
+    meanY = sum(logs) / len(logs)
+    rate  = sum([(x - meanX) * (y - meanY) for x,y in enumerate(logs)]) / sum([(x - meanX) ** 2 for x in range(len(logs))])
+    if (rate >= 0):
+        return None
+    # Where the fitted line is now, and how many more iterations it takes to get under eta, then stay there
+    level  = meanY + rate * (len(logs) - 1 - meanX)
+    needed = int(math.ceil((math.log(eta) - level) / rate)) + CONVERGED_ITERS - 1
+    return min(max(needed,CONVERGED_ITERS),left)
+
+
+class TrainingProgress(object):
+    """What is known about a crf_learn run, written to the status file as JSON whenever it changes."""
+    def __init__ (self,args):
+        self.state            = "starting"  # starting, reading, training, done, failed or stopped
+        self.message          = None
+        self.pid              = None
+        self.exitCode         = None
+        self.startTime        = time()
+        self.elapsedSeconds   = 0.0
+        self.budgetSeconds    = budget
+        self.eta              = commandOption(args,"-e",DEFAULT_ETA,float)
+        self.maxIterations    = commandOption(args,"-m",DEFAULT_MAXITER,int)
+        self.sentences        = None
+        self.features         = None
+        self.iteration        = None        # Latest iteration, from 0
+        self.objective        = None
+        self.objectiveDelta   = None        # Change in the objective from the previous iteration
+        self.diff             = None        # crf_learn's relative change in the objective
+        self.tokenErrorRate   = None
+        self.sentErrorRate    = None
+        self.secondsPerIter   = None
+        self.remainingIters   = None
+        self.remainingSeconds = None
+        self.diffs            = []
+        self.trainStart       = None
+        self.lock             = Lock()
+
+    def readLine (self,line):
+        """Updates the progress from a line of crf_learn output, if it is one that says anything about it."""
+        match = ITER_PATTERN.match(line)
+        if (match):
+            self.readIteration(int(match.group(1)),dict(re.findall(r'(\w+)=(\S+)',match.group(2))))
+        elif (line.startswith("Number of sentences:")):
+            self.sentences = int(line.split(":")[1])
+        elif (line.startswith("Number of features:")):
+            self.features = int(line.split(":")[1])
+        elif (line.startswith("eta:")):
+            self.eta = float(line.split(":")[1])
+        elif (line.startswith("shrinking size:")):
+            # The last line before training starts
+            self.trainStart = time()
+            self.update(state="training")
+
+    def readIteration (self,iteration,values):
+        objective = float(values["obj"])
+        if (self.objective != None):
+            self.objectiveDelta = objective - self.objective
+        self.iteration      = iteration
+        self.objective      = objective
+        self.tokenErrorRate = float(values.get("terr",0))
+        self.sentErrorRate  = float(values.get("serr",0))
+        if ("diff" in values):
+            self.diff = float(values["diff"])
+            self.diffs.append(self.diff)
+        now = time()
+        self.secondsPerIter = (now - (self.trainStart or self.startTime)) / (iteration + 1)
+        self.remainingIters = estimateRemainingIterations(self.diffs,self.eta,self.maxIterations) if self.diffs else None
+        self.remainingSeconds = self.remainingIters * self.secondsPerIter if (self.remainingIters != None) else None
+        self.update(state="training")
+
+    def update (self,**changes):
+        """Sets the given attributes and rewrites the status file.  The file is replaced in one step, so that a reader never
+           sees a partly written one.  Once stopped, the state stays stopped."""
+        with self.lock:
+            if (self.state == "stopped"):
+                changes.pop("state",None)
+            for name,value in changes.items():
+                setattr(self,name,value)
+            self.elapsedSeconds = time() - self.startTime
+            status = {"state": self.state, "message": self.message, "pid": self.pid, "exitCode": self.exitCode,
+                      "elapsedSeconds": self.elapsedSeconds, "budgetSeconds": self.budgetSeconds,
+                      "sentences": self.sentences, "features": self.features, "iteration": self.iteration,
+                      "maxIterations": self.maxIterations, "eta": self.eta, "objective": self.objective,
+                      "objectiveDelta": self.objectiveDelta, "diff": self.diff, "tokenErrorRate": self.tokenErrorRate,
+                      "sentErrorRate": self.sentErrorRate, "secondsPerIteration": self.secondsPerIter,
+                      "estimatedRemainingIterations": self.remainingIters, "estimatedRemainingSeconds": self.remainingSeconds}
+            tempFile = statusFile + ".tmp"
+            with open(tempFile,"wb") as outstream:
+                json.dump(status,outstream,indent=1,sort_keys=True)
+            os.rename(tempFile,statusFile)
+
+# Call the 'main' function if we are being invoke in a script context.
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,123 @@
+"""Running crf_learn and crf_test on featurized files, and scoring tagged output, used by train_sharded.py and
+   tune_training.py.  This is a plain module, with no command line of its own."""
+
+import os
+import io
+import subprocess
+from time import time,sleep
+from sentence_splitting import labelSpans
+
+
+def learnCommand (crfLearn,flags,templateFile,trainFile,modelFile,threads):
+    """Returns the crf_learn command line, with '-p threads' added unless the flags already say how many threads to use."""
+    command = [crfLearn] + flags
+    if ("-p" not in flags and not [f for f in flags if f.startswith("--thread")]):
+        command += ["-p",str(threads)]
+    return command + [templateFile,trainFile,modelFile]
+
+def runCommands (commands,numJobs,logDir,deadline=None):
+    """Runs the commands, up to numJobs at a time, each with its output going to the log file logFileFor names.  If a
+       deadline, a time() value, is given, commands not started by then are skipped and those still running then are
+       killed.  Returns a (exit status, seconds) pair for each command, the status being None if it was skipped or killed."""
+    results = [(None,0.0)] * len(commands)
+    waiting = range(len(commands))
+    running = []
+    while (waiting or running):
+        while (waiting and len(running) < numJobs and (deadline == None or time() < deadline)):
+            i = waiting.pop(0)
+            with open(logFileFor(commands[i],logDir),"wb") as logstream:
+                running.append((i,subprocess.Popen(commands[i],stdout=logstream,stderr=subprocess.STDOUT),time()))
+        if (deadline != None and time() >= deadline):
+            waiting = []
+        for (i,process,startTime) in list(running):
+            exitCode = process.poll()
+            if (exitCode == None and deadline != None and time() >= deadline):
+                process.kill()
+                process.wait()
+                running.remove((i,process,startTime))
+                results[i] = (None,time() - startTime)
+            elif (exitCode != None):
+                running.remove((i,process,startTime))
+                results[i] = (exitCode,time() - startTime)
+        sleep(0.1)
+    return results
+
+def logFileFor (command,logDir):
+    """Returns the log file for a command: its last argument, e.g. the model file, with '.log' added, in logDir."""
+    return os.path.join(logDir,os.path.basename(command[-1]) + ".log")
+
+def evaluateModel (crfTest,modelFile,testFile,workDir,deadline=None):
+    """Tags a featurized, labeled file with crf_test and a binary model; returns the scores evaluateTagged gives.  If a
+       deadline, a time() value, is given and crf_test is still running then, it is killed and None is returned."""
+    tagged = os.path.join(workDir,os.path.basename(modelFile) + ".tagged")
+    with open(tagged,"wb") as outstream:
+        process = subprocess.Popen([crfTest,"-m",modelFile,testFile],stdout=outstream)
+        if (deadline != None):
+            while (process.poll() == None and time() < deadline):
+                sleep(0.1)
+            if (process.poll() == None):
+                process.kill()
+                process.wait()
+                return None
+        if (process.wait() != 0):
+            raise RuntimeError(format("crf_test failed on %s" % modelFile))
+    return evaluateTagged(tagged)
+
+def evaluateTagged (taggedFile):
+    """Scores crf_test output, in which the last column is the label given and the one before it the true label.  Returns
+       the token accuracy, and the precision, recall and F1 of the entities, i.e. runs of the same label other than 'O',
+       as a dict."""
+    tokens   = 0
+    correct  = 0
+    found    = 0
+    expected = 0
+    matched  = 0
+    for sentence in readSentences(taggedFile):
+        gold = [line.split("\t")[-2] for line in sentence]
+        best = [line.split("\t")[-1] for line in sentence]
+        tokens  += len(gold)
+        correct += len([1 for g,b in zip(gold,best) if g == b])
+        goldEntities = entitySpans(gold)
+        bestEntities = entitySpans(best)
+        expected += len(goldEntities)
+        found    += len(bestEntities)
+        matched  += len(goldEntities & bestEntities)
+    precision = float(matched) / found if found else 0.0
+    recall    = float(matched) / expected if expected else 0.0
+    f1        = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0.0
+    return {"tokens": tokens, "tokenAccuracy": float(correct) / max(tokens,1), "precision": precision, "recall": recall, "f1": f1}
+
+def entitySpans (labels):
+    """Returns the set of (start,end,type) entities in a list of labels."""
+    spans = set()
+    for (start,end) in labelSpans(labels):
+        label = labels[start]
+        spans.add((start,end,label[2:] if (label.startswith("B_") or label.startswith("I_")) else label))
+    return spans
+
+def readSentences (filename):
+    """Returns the sentences of a featurized file, each as the list of its lines.  Sentences are terminated by a blank line."""
+    sentences = []
+    sentence  = []
+    with io.open(filename,encoding="utf-8",mode="r") as instream:
+        for line in instream:
+            line = line.rstrip("\r\n")
+            if (line.strip() == ""):
+                if (sentence):
+                    sentences.append(sentence)
+                sentence = []
+            else:
+                sentence.append(line)
+    if (sentence):
+        sentences.append(sentence)
+    return sentences
+
+def writeSentences (sentences,filename):
+    """Writes sentences, as lists of lines, each followed by a blank line; returns the filename."""
+    with io.open(filename,encoding="utf-8",mode="w") as outstream:
+        for sentence in sentences:
+            for line in sentence:
+                outstream.write(line)
+                outstream.write(u"\n")
+            outstream.write(u"\n")
+    return filename
@@ -0,0 +1,77 @@
+"""Reading and writing CRF++ text models, the '.txt' model files written by 'crf_learn -t', used by crf_decode.py and
+   train_sharded.py.  This is a plain module, with no command line of its own.  A text model can be turned into the binary
+   model crf_test needs with 'crf_learn -C TEXT_MODEL BINARY_MODEL'.  numpy is only imported to read a model, so that
+   crf_features.py can import model_bundle, and so this module, without it."""
+
+import io
+
+
+def readTextModel (filename):
+    """Reads a CRF++ text model, which consists of a header, the label list, the template list, the feature dictionary
+       and the weights, in that order, each section being terminated by a blank line. Returns a TextModel."""
+    import numpy
+    model = TextModel()
+    with io.open(filename,encoding="utf-8",mode="r") as instream:
+        # Header lines like 'maxid: 95996'
+        for line in readSection(instream):
+            fields = line.split(":",1)
+            model.header.append((fields[0].strip(),fields[1].strip()))
+        header = dict(model.header)
+        if ("maxid" not in header or "cost-factor" not in header):
+            raise RuntimeError(format("%s does not look like a CRF++ text model (was it written with 'crf_learn -t'?)" % filename))
+        maxId = int(header["maxid"])
+        # Labels, in the order their indices are assigned
+        model.labels = list(readSection(instream))
+        # Templates; unigram ones start with U, bigram ones with B
+        model.templates = list(readSection(instream))
+        # Feature dictionary: '<first weight index> <expanded feature string>'
+        for line in readSection(instream):
+            fields = line.split(" ",1)
+            model.featureIds[fields[1]] = int(fields[0])
+        # Weights, one per line
+        model.weights = numpy.array([float(line) for line in readSection(instream)],dtype=numpy.float64)
+    if (len(model.weights) != maxId):
+        raise RuntimeError(format("Model %s is truncated: expected %d weights but found %d" % (filename,maxId,len(model.weights))))
+    return model
+
+def writeTextModel (model,filename):
+    """Writes a TextModel in the format crf_learn -t does, with the header's maxid set from the weights.  The dictionary
+       is written in sorted order of feature strings, as CRF++ does."""
+    with io.open(filename,encoding="utf-8",mode="w") as outstream:
+        for key,value in model.header:
+            if (key == "maxid"):
+                value = str(len(model.weights))
+            outstream.write(u"%s: %s\n" % (key,value))
+        outstream.write(u"\n")
+        for section in [model.labels,model.templates]:
+            for line in section:
+                outstream.write(u"%s\n" % line)
+            outstream.write(u"\n")
+        for feature in sorted(model.featureIds):
+            outstream.write(u"%d %s\n" % (model.featureIds[feature],feature))
+        outstream.write(u"\n")
+        for weight in model.weights:
+            outstream.write(u"%.16f\n" % weight)
+
+def readSection (instream):
+    """Yields the lines of the stream up to the next blank line or the end of the stream."""
+    for line in instream:
+        line = line.rstrip("\r\n")
+        if (line == ""):
+            return
+        yield line
+
+def featureWidth (feature,numLabels):
+    """Returns the number of weights a dictionary feature has: one per label for a unigram (U) feature, one per pair of
+       labels for a bigram (B) feature."""
+    return numLabels * numLabels if feature.startswith("B") else numLabels
+
+
+class TextModel(object):
+    """The contents of a CRF++ text model."""
+    def __init__ (self):
+        self.header     = []      # (key,value) pairs, in file order: version, cost-factor, maxid, xsize.
+        self.labels     = []      # Label strings, indexed by label id.
+        self.templates  = []      # Template lines, U ones then B ones.
+        self.featureIds = dict()  # Expanded feature string -> index of its first weight.
+        self.weights    = None    # numpy array of all the weights.
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+import re
+import io
+import json
+from sys import stdin,stdout,stderr
+from bisect import bisect_left
+from argparse import ArgumentParser
+
+scriptArgs = ArgumentParser(description="Estimates, without training, the number of features crf_learn will create from featurized training data and a template file, and the memory it will need. Prints the smallest -f frequency cutoff that fits the memory budget, if any.")
+
+scriptArgs.add_argument('--input',help="Optional featurized training file, as produced by crf_features.py --labeled. Reads from stdin if no argument provided.")
+scriptArgs.add_argument('--templates',help="Required template file, as produced by crf_features.py --templates.",required=True)
+scriptArgs.add_argument('--threads',type=int,default=1,help="Number of crf_learn threads (its -p). Default is 1.")
+scriptArgs.add_argument('--algorithm',default="CRF-L2",choices=["CRF-L2","CRF-L1","MIRA"],help="crf_learn algorithm (its -a). Default is CRF-L2.")
+scriptArgs.add_argument('--maxmemory',type=float,help="Optional memory budget for crf_learn, in megabytes. Exit status is 1 if no cutoff up to --maxfreq fits it.")
+scriptArgs.add_argument('--minfreq',type=int,default=1,help="Smallest frequency cutoff (crf_learn -f) to consider. Default is 1.")
+scriptArgs.add_argument('--maxfreq',type=int,default=10,help="Largest frequency cutoff to consider. Default is 10.")
+scriptArgs.add_argument('--report',help="Optional output file for the full estimate as JSON.")
+
+argValues = vars(scriptArgs.parse_args())
+
+
+# Command line arguments
+
+inputFile    = argValues["input"]
+templateFile = argValues["templates"]
+numThreads   = argValues["threads"]
+algorithm    = argValues["algorithm"]
+maxMemory    = argValues["maxmemory"]
+minFreq      = argValues["minfreq"]
+maxFreq      = argValues["maxfreq"]
+reportFile   = argValues["report"]
+
+# CRF++ substitutes these for %x[row,col] references that fall before the start or after the end of the sentence.
+
+MAX_CONTEXT = 8
+BOS         = ["_B-%d" % n for n in range(MAX_CONTEXT,0,-1)]   # _B-8 ... _B-1
+EOS         = ["_B+%d" % n for n in range(1,MAX_CONTEXT+1)]    # _B+1 ... _B+8
+
+# Rough per-item sizes in bytes of crf_learn's data structures (CRF++ 0.58, 64 bit), used for the memory estimate.
+#
+#  - Each weight has a double in alpha, one per thread in the expected counts, and for the L-BFGS algorithms, 2*5+1 in
+#    the history plus 2 more (diag and v); CRF-L1 has one more (xi).
+#  - Each distinct feature string is a std::map node holding a std::string and an (id,freq) pair.
+#  - Each token keeps its columns as strings, a vector of pointers to them, a vector of pointers to its lattice Nodes,
+#    and a -1 terminated list of int feature ids per template type.
+#  - Each thread builds the lattice for one sentence at a time: a Node per label and a Path per pair of labels at each
+#    token, with the Nodes holding vectors of pointers to their Paths.  Each thread also has its own allocators.
+#
+# Measured peaks of crf_learn -a CRF-L2 on 67k to 541k tokens of dig-crf.feat-list output are within 10% of this.
+
+WEIGHT_DOUBLES = {"CRF-L2": 1 + 13, "CRF-L1": 1 + 14, "MIRA": 1}
+MAP_NODE_BYTES = 80
+TOKEN_BYTES    = 100
+NODE_BYTES     = 112
+PATH_BYTES     = 32
+THREAD_BYTES   = 6 * 1024 * 1024
+
+
+########################################################################################################################################
+
+
+def main ():
+    """The function that is called in a command line context. """
+    (unigrams,bigrams) = readTemplateFile(templateFile)
+    instream = io.open(inputFile,encoding="utf-8",mode="r") if inputFile != None else stdin
+    data     = countFeatures(instream,unigrams + bigrams)
+    if (inputFile != None):
+        instream.close()
+    estimates = []
+    for freq in range(minFreq,maxFreq+1):
+        estimates.append(estimateMemory(data,unigrams,bigrams,freq))
+    chosen = None
+    for estimate in estimates:
+        if (maxMemory is None or estimate["megabytes"] <= maxMemory):
+            chosen = estimate
+            break
+    printEstimates(data,unigrams + bigrams,estimates,chosen)
+    if (reportFile):
+        with open(reportFile,"wb") as outstream:
+            report = {"tokens": data.numTokens, "sentences": data.numSentences, "labels": len(data.labels),
+                      "templates": [{"template": t.template, "distinct": t.numDistinct()} for t in unigrams + bigrams],
+                      "estimates": estimates, "chosenFreq": chosen["freq"] if chosen else None, "maxMemory": maxMemory}
+            json.dump(report,outstream,indent=1,sort_keys=True)
+    if (chosen is None):
+        stderr.write("No frequency cutoff up to %d brings the estimate under %.0f MB\n" % (maxFreq,maxMemory))
+        exit(1)
+    stdout.write("%d\n" % chosen["freq"])
+
+
+def readTemplateFile (filename):
+    """Reads a CRF++ template file; returns the lists of unigram and bigram Templates."""
+    unigrams = []
+    bigrams  = []
+    with io.open(filename,encoding="utf-8",mode="r") as instream:
+        for line in instream:
+            line = line.strip()
+            if (line.startswith("U")):
+                unigrams.append(Template(line))
+            elif (line.startswith("B")):
+                bigrams.append(Template(line))
+    return (unigrams,bigrams)
+
+def countFeatures (instream,templates):
+    """Expands the templates over every sentence of the featurized stream, as crf_learn would, counting each distinct
+       feature string's occurrences.  Returns a FeatureData."""
+    data     = FeatureData()
+    sentence = []
+    for line in instream:
+        line = line.strip()
+        if (line != ""):
+            sentence.append(line.split("\t"))
+            data.inputBytes += len(line) + 1
+        elif (sentence):
+            countSentenceFeatures(sentence,templates,data)
+            sentence = []
+    if (sentence):
+        countSentenceFeatures(sentence,templates,data)
+    return data
+
+def countSentenceFeatures (sentence,templates,data):
+    length = len(sentence)
+    data.numSentences += 1
+    data.numTokens    += length
+    data.maxLength     = max(data.maxLength,length)
+    data.numColumns    = max(data.numColumns,len(sentence[0]))
+    # The last column is the label; the rest are what the templates may refer to.
+    columns = zip(*sentence)
+    for label in columns[-1]:
+        data.labels.add(label)
+    padded = [BOS + list(column) + EOS for column in columns[:-1]]
+    for template in templates:
+        template.count(padded,length)
+
+def estimateMemory (data,unigrams,bigrams,freq):
+    """Returns a dict with the estimated numbers of features and weights, and crf_learn's peak memory use, for a given
+       frequency cutoff.  The feature dictionary holds every distinct feature until training starts, when the ones below
+       the cutoff are dropped and the weights are allocated, so the peak is whichever of those two phases is larger."""
+    numLabels    = len(data.labels)
+    allFeatures  = sum([t.numDistinct() for t in unigrams + bigrams])
+    allKeyBytes  = sum([t.keyBytes for t in unigrams + bigrams])
+    keptFeatures = sum([t.numKept(freq) for t in unigrams + bigrams])
+    numWeights   = sum([t.numKept(freq) for t in unigrams]) * numLabels + sum([t.numKept(freq) for t in bigrams]) * numLabels * numLabels
+    keptKeyBytes = allKeyBytes * keptFeatures / max(allFeatures,1)
+    # Memory that is there throughout: the input, and the per-token pointers and feature id lists
+    inputBytes   = data.inputBytes + data.numTokens * (TOKEN_BYTES + 8 * data.numColumns + 8 * numLabels)
+    cacheBytes   = data.numTokens * (len(unigrams) + 1) * 4 + data.numTokens * (len(bigrams) + 1) * 4
+    # Feature dictionary before the cutoff is applied
+    buildBytes   = allFeatures * MAP_NODE_BYTES + allKeyBytes
+    # Feature dictionary after, plus weights, plus one lattice per thread
+    weightBytes  = numWeights * 8 * (WEIGHT_DOUBLES[algorithm] + numThreads)
+    latticeBytes = numThreads * (THREAD_BYTES + data.maxLength * (numLabels * (NODE_BYTES + 16 * numLabels) + numLabels * numLabels * PATH_BYTES))
+    trainBytes   = keptFeatures * MAP_NODE_BYTES + keptKeyBytes + weightBytes + latticeBytes
+    peakBytes    = inputBytes + cacheBytes + max(buildBytes,trainBytes)
+    return {"freq": freq, "features": keptFeatures, "weights": numWeights, "megabytes": peakBytes / (1024.0 * 1024.0)}
+
+def printEstimates (data,templates,estimates,chosen):
+    """Prints the per-template feature counts and the per-cutoff estimates to stderr."""
+    stderr.write("\n%d tokens in %d sentences, %d labels, longest sentence %d tokens\n" %
+                 (data.numTokens,data.numSentences,len(data.labels),data.maxLength))
+    stderr.write("\n%-50s %10s" % ("template","distinct"))
+    for estimate in estimates:
+        stderr.write(" %9s" % ("f=%d" % estimate["freq"]))
+    stderr.write("\n")
+    for template in templates:
+        stderr.write("%-50s %10d" % (template.template[:50],template.numDistinct()))
+        for estimate in estimates:
+            stderr.write(" %9d" % template.numKept(estimate["freq"]))
+        stderr.write("\n")
+    stderr.write("\n%-10s %12s %14s %12s\n" % ("cutoff","features","weights","est. MB"))
+    for estimate in estimates:
+        mark = "  <=" if estimate is chosen else ""
+        stderr.write("%-10s %12d %14d %12.1f%s\n" % ("-f %d" % estimate["freq"],estimate["features"],estimate["weights"],estimate["megabytes"],mark))
+
+
+class Template(object):
+    """A CRF++ template line, compiled into a format string and (row,col) references, with occurrence counts of the
+       distinct feature strings it expands to.  Strings are counted by hash, to keep this tool's own memory down."""
+    def __init__ (self,template):
+        self.template = template
+        self.refs     = []
+        self.counts   = dict()  # Hash of feature string -> number of occurrences
+        self.keyBytes = 0       # Total length of the distinct feature strings
+        self.sorted   = None    # Sorted occurrence counts, computed on demand
+        pieces        = []
+        pos           = 0
+        for match in re.finditer(r'%x\[(-?\d+),(\d+)\]',template):
+            pieces.append(template[pos:match.start()].replace("%","%%"))
+            pieces.append("%s")
+            self.refs.append((int(match.group(1)),int(match.group(2))))
+            pos = match.end()
+        pieces.append(template[pos:].replace("%","%%"))
+        self.format = "".join(pieces)
+        # Bigram features are only generated from the second token on.
+        self.start  = 1 if template.startswith("B") else 0
+
+    def count (self,padded,length):
+        """Counts the feature strings this template expands to over a sentence, given its padded columns."""
+        count = length - self.start
+        if (count <= 0):
+            return
+        values = []
+        for (row,col) in self.refs:
+            if (col >= len(padded)):
+                raise RuntimeError(format("Template %s refers to column %d, but the input only has %d besides the label" % (self.template,col,len(padded))))
+            first = MAX_CONTEXT + self.start + row
+            values.append(padded[col][first:first+count])
+        if (values):
+            keys = [self.format % v for v in zip(*values)]
+        else:
+            keys = [self.format % ()] * count
+        counts = self.counts
+        for key in keys:
+            h = hash(key)
+            c = counts.get(h)
+            if (c is None):
+                counts[h] = 1
+                self.keyBytes += len(key)
+            else:
+                counts[h] = c + 1
+
+    def numDistinct (self):
+        return len(self.counts)
+
+    def numKept (self,freq):
+        """Returns the number of distinct features that occur at least freq times."""
+        if (self.sorted is None):
+            self.sorted = sorted(self.counts.values())
+        return len(self.sorted) - bisect_left(self.sorted,freq)
+
+class FeatureData(object):
+    """What countFeatures learns about the training data as a whole."""
+    def __init__ (self):
+        self.numTokens    = 0
+        self.numSentences = 0
+        self.maxLength    = 0
+        self.inputBytes   = 0
+        self.numColumns   = 0
+        self.labels       = set()
+
+# Call the 'main' function if we are being invoke in a script context.
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,202 @@
+"""Writing a feature matrix as a SciPy-style CSR matrix, in memory-mappable NumPy .npy files, used by crf_features.py.
+   This is a plain module, with no command line of its own, and it doesn't need numpy: the .npy files are written
+   directly, a block at a time, so that the matrix never has to be held in memory.
+
+   Each token is a row, and each distinct feature string the unigram templates expand to, e.g. 'U03+0:Cvv/cvv', as in a
+   crf_learn model's dictionary, is a column.  A directory holds:
+
+     indptr.npy        - int64, rows+1: row i's entries are indices[indptr[i]:indptr[i+1]]
+     indices.npy       - int32, the column of each entry, ascending within a row
+     data.npy          - float32, the count of each entry: 1, or more for a '-bow' entry that sees a value more than once
+     labels.npy        - int32, rows: each token's label, as an index into the "labels" of meta.json; only for labeled input
+     sentences.npy     - int64, sentences+1: sentence j is rows sentences[j] to sentences[j+1]-1
+     vocab.npy         - uint8, the UTF-8 feature strings, one after another
+     vocab_offsets.npy - int64, columns+1: column k's string is vocab[vocab_offsets[k]:vocab_offsets[k+1]]
+     meta.json         - the shape, labels, templates and column names
+
+   To load it:
+
+     indptr  = numpy.load("dir/indptr.npy",mmap_mode="r")
+     indices = numpy.load("dir/indices.npy",mmap_mode="r")
+     data    = numpy.load("dir/data.npy",mmap_mode="r")
+     matrix  = scipy.sparse.csr_matrix((data,indices,indptr),shape=json.load(open("dir/meta.json"))["shape"])
+"""
+
+import os
+import re
+import sys
+import json
+import array
+import struct
+
+
+# Bytes reserved for a .npy header, so that it can be written once the length of the array is known.  A multiple of 64,
+# as numpy wants, so that the data that follows is aligned.
+
+NPY_HEADER_BYTES = 128
+
+# The values CRF++ substitutes for %x[row,col] references before the start and after the end of a sentence.
+
+BOS = "_B%d"
+EOS = "_B+%d"
+
+
+def compileTemplate (line):
+    """Takes a template line like 'U01+0:%x[-1,9]/%x[0,9]'; returns a format string like 'U01+0:%s/%s' and the list of
+       (row,col) references whose values are substituted into it."""
+    pieces = []
+    refs   = []
+    pos    = 0
+    for match in re.finditer(r'%x\[(-?\d+),(\d+)\]',line):
+        pieces.append(line[pos:match.start()].replace("%","%%"))
+        pieces.append("%s")
+        refs.append((int(match.group(1)),int(match.group(2))))
+        pos = match.end()
+    pieces.append(line[pos:].replace("%","%%"))
+    return ("".join(pieces),refs)
+
+
+class CSRWriter(object):
+    """Expands the unigram templates of a feat-list over featurized sentences, and writes the result to a directory as a
+       CSR matrix.  Bigram templates are left out: they are about pairs of labels rather than tokens."""
+    def __init__ (self,directory,templateLines,columnNames,labeled):
+        if (not os.path.isdir(directory)):
+            os.makedirs(directory)
+        self.directory   = directory
+        self.lines       = [line for line in templateLines if line.startswith("U")]
+        self.templates   = [compileTemplate(line) for line in self.lines]
+        self.context     = max([abs(row) for (pattern,refs) in self.templates for (row,col) in refs] + [0])
+        self.columnNames = columnNames                   # Names of the feature matrix columns, the token first.
+        self.labeled     = labeled
+        self.vocab       = dict()                        # Feature string -> column
+        self.vocabList   = []                            # Column -> feature string
+        self.labelIds    = dict()                        # Label -> index
+        self.labelList   = []                            # Index -> label
+        self.numRows     = 0
+        self.numEntries  = 0
+        self.indptr      = NpyFile(os.path.join(directory,"indptr.npy"),"l")
+        self.indices     = NpyFile(os.path.join(directory,"indices.npy"),"i")
+        self.data        = NpyFile(os.path.join(directory,"data.npy"),"f")
+        self.labels      = NpyFile(os.path.join(directory,"labels.npy"),"i") if labeled else None
+        self.sentences   = NpyFile(os.path.join(directory,"sentences.npy"),"l")
+        self.indptr.append([0])
+        self.sentences.append([0])
+
+    def addSentence (self,rows,labels):
+        """Takes the feature matrix rows of a sentence, each a list of column values with the token first, and, for labeled
+           input, the label of each token; adds a matrix row for each token.  An empty sentence, as two blank lines in a
+           row in the input make, adds no rows, but is still a sentence, as it is in the text output."""
+        length  = len(rows)
+        if (length == 0):
+            self.sentences.append([self.numRows])
+            return
+        context = self.context
+        # Each column, padded with the boundary values, so that a reference at any row is a slice.
+        padded  = [[BOS % j for j in range(-context,0)] + list(values) + [EOS % j for j in range(1,context+1)] for values in zip(*rows)]
+        columnsPerTemplate = []
+        for (pattern,refs) in self.templates:
+            if (len(refs) == 1):
+                (row,col) = refs[0]
+                features  = [pattern % value for value in padded[col][context+row:context+row+length]]
+            elif (refs):
+                features  = [pattern % values for values in zip(*[padded[col][context+row:context+row+length] for (row,col) in refs])]
+            else:
+                features  = [pattern] * length
+            columnsPerTemplate.append(self.columns(features))
+        indptr  = []
+        indices = []
+        data    = []
+        for columns in zip(*columnsPerTemplate):
+            # A bag-of-words entry gives the same feature at each position that has the same value; those are counted.
+            columns  = sorted(columns)
+            previous = None
+            for column in columns:
+                if (column == previous):
+                    data[-1] += 1.0
+                else:
+                    indices.append(column)
+                    data.append(1.0)
+                previous = column
+            indptr.append(self.numEntries + len(indices))
+        self.indices.append(indices)
+        self.data.append(data)
+        self.indptr.append(indptr)
+        self.numEntries += len(indices)
+        self.numRows    += length
+        self.sentences.append([self.numRows])
+        if (self.labeled):
+            self.labels.append([self.labelId(label) for label in labels])
+
+    def columns (self,features):
+        """Returns the list of columns of a list of feature strings, adding new ones to the vocabulary."""
+        columns = map(self.vocab.get,features)
+        if (None in columns):
+            for i,column in enumerate(columns):
+                if (column == None):
+                    column = self.vocab.get(features[i])
+                    if (column == None):
+                        column = len(self.vocabList)
+                        self.vocab[features[i]] = column
+                        self.vocabList.append(features[i])
+                    columns[i] = column
+        return columns
+
+    def labelId (self,label):
+        labelId = self.labelIds.get(label)
+        if (labelId == None):
+            labelId = len(self.labelList)
+            self.labelIds[label] = labelId
+            self.labelList.append(label)
+        return labelId
+
+    def close (self,extra=None):
+        """Writes the vocabulary and meta.json, with anything in the extra dict added to it, and finishes the .npy files."""
+        for npy in [self.indptr,self.indices,self.data,self.labels,self.sentences]:
+            if (npy):
+                npy.close()
+        vocab   = NpyFile(os.path.join(self.directory,"vocab.npy"),"B")
+        offsets = NpyFile(os.path.join(self.directory,"vocab_offsets.npy"),"l")
+        encoded = [feature.encode("utf-8") for feature in self.vocabList]
+        vocab.append(array.array("B","".join(encoded)))
+        offset  = 0
+        ends    = [0]
+        for string in encoded:
+            offset += len(string)
+            ends.append(offset)
+        offsets.append(ends)
+        vocab.close()
+        offsets.close()
+        meta = {"shape": [self.numRows,len(self.vocabList)], "entries": self.numEntries, "sentences": self.sentences.length - 1,
+                "labels": self.labelList if self.labeled else None, "columns": self.columnNames,
+                "templates": self.lines}
+        meta.update(extra or {})
+        with open(os.path.join(self.directory,"meta.json"),"wb") as outstream:
+            json.dump(meta,outstream,indent=1,sort_keys=True)
+
+
+class NpyFile(object):
+    """A one-dimensional .npy file written a block at a time.  The header is rewritten with the final length on closing."""
+    def __init__ (self,filename,typecode):
+        self.typecode  = typecode
+        self.itemsize  = array.array(typecode).itemsize
+        self.length    = 0
+        self.outstream = open(filename,"wb")
+        self.outstream.write(self.header())
+
+    def header (self):
+        kind   = {"l": "i", "i": "i", "B": "u", "f": "f"}[self.typecode]
+        order  = "|" if self.itemsize == 1 else ("<" if sys.byteorder == "little" else ">")
+        header = "{'descr': '%s%s%d', 'fortran_order': False, 'shape': (%d,), }" % (order,kind,self.itemsize,self.length)
+        header = header.ljust(NPY_HEADER_BYTES - 10 - 1) + "\n"
+        return "\x93NUMPY\x01\x00" + struct.pack("<H",len(header)) + header
+
+    def append (self,values):
+        if (not isinstance(values,array.array)):
+            values = array.array(self.typecode,values)
+        values.tofile(self.outstream)
+        self.length += len(values)
+
+    def close (self):
+        self.outstream.seek(0)
+        self.outstream.write(self.header())
+        self.outstream.close()
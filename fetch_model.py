@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+import os
+import re
+import json
+import zlib
+import shutil
+import socket
+import urllib2
+import hashlib
+import httplib
+import urlparse
+from sys import stdout,stderr
+from time import sleep
+from argparse import ArgumentParser
+
+scriptArgs = ArgumentParser(description="Fetches the model files of a manifest written by package_model.py, e.g. the 'manifest' URL train_model.sh returns, into a local directory: downloads the compressed files, resuming interrupted transfers with range requests, checks their sizes and SHA-256s before and after decompression, and then swaps them in all at once by repointing the directory's 'current' link. Nothing is downloaded if the manifest hasn't changed since the last fetch, or for files the current version already has. Prints the directory of the version now current.")
+
+scriptArgs.add_argument('--manifest',help="Required URL of the manifest, e.g. http://host/outputs/tmp.XXXXXXXX/manifest.json.",required=True)
+scriptArgs.add_argument('--dest',help="Required local directory. Versions are kept in DEST/versions/<id>, and DEST/current links to the one in use, so decoders can use e.g. DEST/current/crf.bundle.",required=True)
+scriptArgs.add_argument('--retries',type=int,default=5,help="Number of times a download is retried, from where it stopped, after a network error. Default is 5.")
+scriptArgs.add_argument('--timeout',type=float,default=60,help="Seconds without data after which a connection counts as failed. Default is 60.")
+scriptArgs.add_argument('--keep',type=int,default=2,help="Number of versions to keep, the current one included, so that decoders still using an earlier one aren't left without it. Default is 2.")
+scriptArgs.add_argument('--verbose',action='store_true',help="Report each download, resume and skip on stderr.")
+
+argValues = vars(scriptArgs.parse_args())
+
+
+# Command line arguments
+
+manifestUrl = argValues["manifest"]
+destDir     = argValues["dest"]
+numRetries  = argValues["retries"]
+timeout     = argValues["timeout"]
+numKept     = argValues["keep"]
+verbose     = argValues["verbose"]
+
+# Under destDir: the link to the version in use, the versions, partial downloads, and the manifest validators of the
+# last fetch, for conditional requests.
+
+CURRENT   = "current"
+VERSIONS  = "versions"
+DOWNLOADS = "downloads"
+STATE     = "fetch.json"
+
+BLOCK_SIZE = 1 << 20
+
+
+########################################################################################################################################
+
+
+def main ():
+    """The function that is called in a command line context. """
+    for directory in [destDir,os.path.join(destDir,VERSIONS),os.path.join(destDir,DOWNLOADS)]:
+        if (not os.path.isdir(directory)):
+            os.makedirs(directory)
+    state    = readState()
+    response = fetchManifest(state)
+    if (response == None):
+        report("Manifest not modified; %s is current" % state["id"])
+        stdout.write("%s\n" % currentDir())
+        return
+    (manifest,validators) = response
+    versionDir = os.path.join(destDir,VERSIONS,manifest["id"])
+    if (currentId() != manifest["id"]):
+        if (not os.path.isdir(versionDir)):
+            makeVersion(manifest,versionDir)
+        swapIn(manifest["id"])
+        removeOldVersions()
+    else:
+        report("Version %s is current already" % manifest["id"])
+    validators.update({"url": manifestUrl, "id": manifest["id"]})
+    writeState(validators)
+    stdout.write("%s\n" % currentDir())
+
+def fetchManifest (state):
+    """Gets the manifest, conditionally on it having changed if it was fetched from the same URL before.  Returns None if
+       it hasn't, and otherwise the manifest and its ETag and Last-Modified validators."""
+    request = urllib2.Request(manifestUrl)
+    if (state.get("url") == manifestUrl and currentId() == state.get("id")):
+        if (state.get("etag")):
+            request.add_header("If-None-Match",state["etag"])
+        if (state.get("lastModified")):
+            request.add_header("If-Modified-Since",state["lastModified"])
+    try:
+        response = withRetries(lambda: urllib2.urlopen(request,timeout=timeout),"manifest")
+    except urllib2.HTTPError as error:
+        if (error.code == 304):
+            return None
+        raise
+    manifest = json.loads(response.read())
+    if (manifest.get("version") != 1):
+        raise RuntimeError(format("Don't know version %s of the manifest at %s" % (manifest.get("version"),manifestUrl)))
+    checkManifest(manifest)
+    return (manifest,{"etag": response.info().get("ETag"), "lastModified": response.info().get("Last-Modified")})
+
+def checkManifest (manifest):
+    """Raises an exception unless everything of a manifest that goes into local paths is safe to put there: the id and
+       SHA-256s have to be hex digests, and the file names relative paths that localName accepts.  The manifest comes
+       from the network, and a name like '../../.bashrc' must not get written."""
+    if (not isDigest(manifest.get("id"))):
+        raise RuntimeError(format("The manifest at %s has a bad id: %r" % (manifestUrl,manifest.get("id"))))
+    for entry in manifest["files"]:
+        localName(entry["name"])
+        if (not isDigest(entry.get("sha256")) or not isDigest(entry.get("compressedSha256"))):
+            raise RuntimeError(format("The manifest at %s has a bad SHA-256 for %s" % (manifestUrl,entry["name"])))
+
+def isDigest (value):
+    return isinstance(value,basestring) and re.match(r'^[0-9a-f]{64}$',value) != None
+
+def localName (name):
+    """Returns the local path, relative to a version directory, of a manifest file name, whose parts are separated by '/'.
+       Raises an exception if the name is absolute or empty, or has an empty, '.' or '..' part, or a part with a local
+       path separator in it, so that the path can't lead outside the version directory."""
+    parts = name.split("/") if isinstance(name,basestring) else [""]
+    for part in parts:
+        if (part in ["",os.curdir,os.pardir] or os.sep in part or (os.altsep and os.altsep in part) or os.path.isabs(part)):
+            raise RuntimeError(format("The manifest at %s has a file name that is not a plain relative path: %r" % (manifestUrl,name)))
+    name = os.path.join(*parts)
+    if (name == "manifest.json"):
+        raise RuntimeError(format("The manifest at %s lists a file named manifest.json" % manifestUrl))
+    return name
+
+def makeVersion (manifest,versionDir):
+    """Fills the directory of a new version with the manifest's files, checked against it: from the current version if
+       it has the same file, and otherwise downloaded.  The directory is built under a temporary name and renamed when
+       complete, so that a version directory is never partial."""
+    building = versionDir + ".tmp"
+    shutil.rmtree(building,ignore_errors=True)
+    os.makedirs(building)
+    current  = readManifest(currentDir())
+    existing = dict([(entry["name"],entry["sha256"]) for entry in current["files"]]) if current else {}
+    for entry in manifest["files"]:
+        name   = localName(entry["name"])
+        target = os.path.join(building,name)
+        if (not os.path.abspath(target).startswith(os.path.join(os.path.abspath(building),""))):
+            raise RuntimeError(format("%s would be written outside %s" % (entry["name"],building)))
+        if (not os.path.isdir(os.path.dirname(target))):
+            os.makedirs(os.path.dirname(target))
+        if (existing.get(entry["name"]) == entry["sha256"]):
+            report("%s is unchanged" % entry["name"])
+            linkOrCopy(os.path.join(currentDir(),name),target)
+        else:
+            compressed = download(entry)
+            decompress(compressed,target,entry)
+            os.remove(compressed)
+    with open(os.path.join(building,"manifest.json"),"wb") as outstream:
+        json.dump(manifest,outstream,indent=1,sort_keys=True)
+    os.rename(building,versionDir)
+
+def download (entry):
+    """Downloads the compressed file of a manifest entry into the downloads directory, resuming a download of the same
+       file that was interrupted, this run or before; returns its filename once its size and SHA-256 are right."""
+    url     = urlparse.urljoin(manifestUrl,entry["compressed"])
+    partial = os.path.join(destDir,DOWNLOADS,entry["compressedSha256"] + ".part")
+    for attempt in range(numRetries + 1):
+        try:
+            downloadTo(url,partial,entry["compressedBytes"])
+            break
+        except (urllib2.URLError,httplib.HTTPException,socket.error) as error:
+            if (isinstance(error,urllib2.HTTPError) or attempt == numRetries):
+                raise
+            report("Download of %s stopped at %d bytes (%s); resuming" % (url,os.path.getsize(partial) if os.path.exists(partial) else 0,error))
+            sleep(min(2 ** attempt,30))
+    if (fileDigest(partial) != entry["compressedSha256"]):
+        os.remove(partial)
+        raise RuntimeError(format("%s does not have the SHA-256 the manifest gives" % url))
+    return partial
+
+def downloadTo (url,partial,size):
+    """Appends to the partial file what it lacks of the one at the URL, of the given size, asking for just that range.  A
+       server that sends the whole file instead gets it written from the start."""
+    have = os.path.getsize(partial) if os.path.exists(partial) else 0
+    if (have > size):
+        os.remove(partial)
+        have = 0
+    if (have == size):
+        return
+    request = urllib2.Request(url)
+    if (have > 0):
+        request.add_header("Range","bytes=%d-" % have)
+        report("Resuming %s at byte %d of %d" % (url,have,size))
+    else:
+        report("Downloading %s (%d bytes)" % (url,size))
+    try:
+        response = urllib2.urlopen(request,timeout=timeout)
+    except urllib2.HTTPError as error:
+        # The server's file is shorter than the part downloaded, so that isn't a part of it after all: start again.
+        if (error.code == 416 and have > 0):
+            os.remove(partial)
+            return downloadTo(url,partial,size)
+        raise
+    if (response.getcode() == 206 and not response.info().get("Content-Range","").startswith("bytes %d-" % have)):
+        raise RuntimeError(format("%s sent the wrong range: %s" % (url,response.info().get("Content-Range"))))
+    with open(partial,"ab" if response.getcode() == 206 else "wb") as outstream:
+        for block in iter(lambda: response.read(BLOCK_SIZE),""):
+            outstream.write(block)
+    if (os.path.getsize(partial) < size):
+        raise socket.error(format("connection closed after %d of %d bytes" % (os.path.getsize(partial),size)))
+
+def decompress (compressed,target,entry):
+    """Decompresses a downloaded file to target, checking its size and SHA-256 against the manifest entry."""
+    digest       = hashlib.sha256()
+    numBytes     = 0
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)   # gzip format
+    with open(compressed,"rb") as instream:
+        with open(target,"wb") as outstream:
+            for block in iter(lambda: instream.read(BLOCK_SIZE),""):
+                block = decompressor.decompress(block)
+                digest.update(block)
+                numBytes += len(block)
+                outstream.write(block)
+            block = decompressor.flush()
+            digest.update(block)
+            numBytes += len(block)
+            outstream.write(block)
+    if (numBytes != entry["bytes"] or digest.hexdigest() != entry["sha256"]):
+        os.remove(target)
+        raise RuntimeError(format("%s does not decompress to the %s of the manifest" % (compressed,entry["name"])))
+
+def swapIn (versionId):
+    """Points the current link at a version, by renaming a new link over it, which replaces it in one step."""
+    link = os.path.join(destDir,CURRENT)
+    if (os.path.lexists(link + ".tmp")):
+        os.remove(link + ".tmp")
+    os.symlink(os.path.join(VERSIONS,versionId),link + ".tmp")
+    os.rename(link + ".tmp",link)
+    report("%s is now version %s" % (link,versionId))
+
+def removeOldVersions ():
+    """Removes all but the numKept most recently made versions, never the current one."""
+    versionsDir = os.path.join(destDir,VERSIONS)
+    versions    = [name for name in os.listdir(versionsDir) if not name.endswith(".tmp") and name != currentId()]
+    versions.sort(key=lambda name: os.path.getmtime(os.path.join(versionsDir,name)),reverse=True)
+    for name in versions[max(numKept - 1,0):]:
+        shutil.rmtree(os.path.join(versionsDir,name),ignore_errors=True)
+
+def withRetries (func,what):
+    """Calls func, again after a network error other than an HTTP error status, up to numRetries more times."""
+    for attempt in range(numRetries + 1):
+        try:
+            return func()
+        except (urllib2.URLError,httplib.HTTPException,socket.error) as error:
+            if (isinstance(error,urllib2.HTTPError) or attempt == numRetries):
+                raise
+            report("Fetching the %s failed (%s); retrying" % (what,error))
+            sleep(min(2 ** attempt,30))
+
+def currentDir ():
+    return os.path.join(destDir,CURRENT)
+
+def currentId ():
+    """Returns the id of the current version, or None if there is none."""
+    link = currentDir()
+    return os.path.basename(os.readlink(link)) if os.path.islink(link) else None
+
+def readManifest (directory):
+    filename = os.path.join(directory,"manifest.json")
+    if (not os.path.exists(filename)):
+        return None
+    with open(filename,"rb") as instream:
+        return json.load(instream)
+
+def readState ():
+    filename = os.path.join(destDir,STATE)
+    if (not os.path.exists(filename)):
+        return {}
+    with open(filename,"rb") as instream:
+        return json.load(instream)
+
+def writeState (state):
+    filename = os.path.join(destDir,STATE)
+    with open(filename + ".tmp","wb") as outstream:
+        json.dump(state,outstream,indent=1,sort_keys=True)
+    os.rename(filename + ".tmp",filename)
+
+def linkOrCopy (source,target):
+    """Hard-links source to target, or copies it where links aren't possible."""
+    try:
+        os.link(source,target)
+    except OSError:
+        shutil.copy2(source,target)
+
+def fileDigest (filename):
+    """Returns the SHA-256 of a file's contents, as hex."""
+    digest = hashlib.sha256()
+    with open(filename,"rb") as instream:
+        for block in iter(lambda: instream.read(BLOCK_SIZE),""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def report (message):
+    if (verbose):
+        stderr.write("%s\n" % message)
+
+# Call the 'main' function if we are being invoke in a script context.
+if (__name__ == "__main__"):
+    main()
@@ -1,5 +1,9 @@
 import json as JSON
 import codecs
+import random
+from multiprocessing import Pool
+from sentence_splitting import findSplitPoints,splitAt
+from near_duplicates import findClusters
 from argparse import ArgumentParser
 from sys import stdout,stdin,stderr
 
@@ -8,18 +12,43 @@ scriptArgs.add_argument("--inputs",nargs='*',help="File containing a JSON list o
 scriptArgs.add_argument("--output",help="Output file which will have lines <token><tab><label>, one token/label pair per line.")
 scriptArgs.add_argument("--iob",action='store_true',help="Add 'B_' and 'I_' prefixes to name labels for IOB annotation, vs. the default IO.")
 scriptArgs.add_argument("--nametypes",help="List of entity types to restrict to, comma-separated.  Optional; not really needed anymore.")
+scriptArgs.add_argument("--negfraction",type=float,default=1.0,help="Fraction of all-'O' sentences (no annotations) to keep, chosen at random. Default is 1.0, i.e. keep them all.")
+scriptArgs.add_argument("--maxtokens",type=int,help="Optional cap on the total number of tokens written. Sentences are written in input order until one would take the total over the cap; it and all the sentences after it are dropped, rather than only the ones that don't fit, which would favor short sentences. The sentences kept are the start of the input, so shuffle it first for a random sample.")
+scriptArgs.add_argument("--maxlength",type=int,help="Optional maximum sentence length. Longer sentences are split into pieces, at punctuation where possible, and never inside an annotated entity.")
+scriptArgs.add_argument("--seed",type=int,default=0,help="Seed for the random choice of all-'O' sentences to keep, so that a run can be reproduced. Default is 0.")
+scriptArgs.add_argument("--dedup",type=float,help="Optional similarity threshold, e.g. 0.7, for dropping near-duplicate sentences: sentences whose sets of token trigrams (lower-cased, digits replaced by 0) have at least this Jaccard similarity are clustered, over all the inputs, and one sentence is kept per cluster and set of entity types in it, preferring annotated sentences. Applies to the sentences written, i.e. the pieces with --maxlength.")
+scriptArgs.add_argument("--dedupstats",help="Optional output file for statistics of the --dedup clusters as JSON: their number and sizes, the sentences and tokens dropped, and the largest clusters.")
+scriptArgs.add_argument("--jobs",type=int,default=1,help="Number of worker processes converting --inputs files in parallel. The output is the same whatever the number. Default is 1.")
 
 argValues = scriptArgs.parse_args()
 
-inputFiles = argValues.inputs
-outputFile = argValues.output
-useIOB     = argValues.iob
-onlyTypes  = None
+inputFiles  = argValues.inputs
+outputFile  = argValues.output
+useIOB      = argValues.iob
+onlyTypes   = None
+negFraction = argValues.negfraction
+maxTokens   = argValues.maxtokens
+maxLength   = argValues.maxlength
+numJobs     = argValues.jobs
+dedup       = argValues.dedup
+dedupStats  = argValues.dedupstats
 
 if (argValues.nametypes is not None):
     onlyTypes = set(argValues.nametypes.split(","))
 
-outputNameTypes = set()
+# Sentence counts for the input being converted; reset for each input file.
+
+sentenceCounts = {"sentences": 0, "negatives": 0, "negativesKept": 0}
+
+# The same, totalled over all the input files, counts of what was written, and the name types of the sentences written,
+# reported at the end.
+
+totalNameTypes = set()
+totalCounts    = {"sentences": 0, "negatives": 0, "negativesKept": 0, "written": 0, "overCap": 0, "tokens": 0, "nearDuplicates": 0}
+
+# Random number generator for negative sentence downsampling, reseeded for each input file for reproducibility.
+
+sampler = random.Random(argValues.seed)
 
 # Not using these right now
 excludeTokens = set("&lt;br&gt; &lt;br/&gt; &amp; &amp;#039; &lt;/a&gt;".split())
@@ -27,35 +56,154 @@ excludeTokens = set("&lt;br&gt; &lt;br/&gt; &amp; &amp;#039; &lt;/a&gt;".split()
 ##############################################################
 
 def main ():
-    nonOverlapping(inputFiles,[outputFile])
+    nonOverlapping(inputFiles,[outputFile,dedupStats])
     if (outputFile is not None):
         outstream = codecs.open(outputFile,"wb","utf-8")
     else:
         outstream = stdout
     if (inputFiles):
-        for inputFile in inputFiles:
-            processJSONFile(inputFile,outstream)
+        # Files are converted independently, in worker processes if there is more than one job, and their output is
+        # written in the order the files were given.
+        tasks = list(enumerate(inputFiles))
+        if (numJobs > 1):
+            pool        = Pool(numJobs)
+            conversions = pool.imap(convertJSONFile,tasks)
+        else:
+            pool        = None
+            conversions = (convertJSONFile(task) for task in tasks)
+        # Near duplicates are found over all the files, so all of them have to be converted before any is written.
+        if (dedup is not None):
+            conversions = removeNearDuplicates(list(conversions))
+        for conversion in conversions:
+            writeConversion(conversion,outstream)
+        if (pool):
+            pool.close()
+            pool.join()
     else:
-        processJSONStream(stdin,outstream)
+        conversions = [convertJSONStream(stdin,0)]
+        if (dedup is not None):
+            conversions = removeNearDuplicates(conversions)
+        writeConversion(conversions[0],outstream)
     if (outstream != stdout):
         outstream.close()
-    stderr.write("\nName types found: %s\n" % " ".join(outputNameTypes))
+    stderr.write("\nName types found: %s\n" % " ".join(sorted(totalNameTypes)))
+    printSentenceCounts()
+
+def printSentenceCounts ():
+    """Writes the numbers of sentences and tokens kept, and the negative sampling rate, to stderr."""
+    counts = totalCounts
+    stderr.write("Negative sampling rate: %g (seed %d); kept %d of %d all-'O' sentences\n" %
+                 (negFraction,argValues.seed,counts["negativesKept"],counts["negatives"]))
+    if (dedup is not None):
+        stderr.write("Near duplicates (similarity %g): dropped %d sentences\n" % (dedup,counts["nearDuplicates"]))
+    if (maxTokens is not None):
+        stderr.write("Token cap: %d; dropped %d sentences from the first that would have exceeded it on\n" % (maxTokens,counts["overCap"]))
+    stderr.write("Wrote %d tokens in %d of %d sentences\n" % (counts["tokens"],counts["written"],counts["sentences"]))
 
-def processJSONFile (inputFile,outstream):
-    """Takes a file containing a JSON list, and and an output stream."""
-    instream = codecs.open(inputFile,"rb","utf-8")
-    processJSONStream(instream,outstream)
+def convertJSONFile (task):
+    """Takes a pair of the index of an input file and its name; returns the conversion of the file as described for
+       convertJSONStream.  This is what worker processes run."""
+    (fileIndex,inputFile) = task
+    instream   = codecs.open(inputFile,"rb","utf-8")
+    conversion = convertJSONStream(instream,fileIndex)
     instream.close()
+    return conversion
+
+def convertJSONStream (instream,fileIndex):
+    """Takes an input stream with a JSON list on it and the index of the input file it comes from.  Returns a pair of
+       the list of sentences kept, each a pair of its tokens and labels, and the sentence counts.  The negative sampler is
+       reseeded from the seed and the file index, so that each file's sample is the same however the files are divided
+       up among processes."""
+    sampler.seed(argValues.seed + 1000003 * fileIndex)
+    for key in sentenceCounts:
+        sentenceCounts[key] = 0
+    sentences = []
+    processJSONStream(instream,sentences)
+    return (sentences,dict(sentenceCounts))
 
-def processJSONStream (instream,outstream):
-    """Takes an input stream, on which a JSON list is assumed to be, and an output stream.
-       Generates the annotation from the JSON list and writes it to outputstream."""
+def writeConversion (conversion,outstream):
+    """Writes the labeled sentences of a conversion to the output stream, dropping, from the first sentence that would
+       take the total number of tokens over maxTokens on, every sentence, and adds its counts, and the name types of the
+       sentences written, to the totals."""
+    (sentences,counts) = conversion
+    for key,count in counts.items():
+        totalCounts[key] += count
+    for (tokens,labels) in sentences:
+        if (maxTokens is not None and (totalCounts["overCap"] > 0 or totalCounts["tokens"] + len(tokens) > maxTokens)):
+            totalCounts["overCap"] += 1
+            continue
+        writeLabeledSentence(tokens,labels,outstream)
+        totalNameTypes.update([nameType(label) for label in labels if label != "O"])
+        totalCounts["written"] += 1
+        totalCounts["tokens"]  += len(tokens)
+
+def removeNearDuplicates (conversions):
+    """Takes a list of conversions; returns them with the near-duplicate sentences taken out of their sentences, as decided by
+       chooseRepresentatives, and writes the cluster statistics if they were asked for."""
+    sentences = []
+    for c,(convSentences,counts) in enumerate(conversions):
+        for (tokens,labels) in convSentences:
+            sentences.append((c,[fixToken(token) for token in tokens],labels))
+    clusterIds = findClusters([tokens for (c,tokens,labels) in sentences],dedup,argValues.seed)
+    members    = dict()
+    for i,clusterId in enumerate(clusterIds):
+        members.setdefault(clusterId,[]).append(i)
+    keep = set()
+    for clusterId,indices in members.items():
+        keep.update(chooseRepresentatives([sentences[i][2] for i in indices],indices))
+    kept = [[] for conversion in conversions]
+    for i,(c,tokens,labels) in enumerate(sentences):
+        if (i in keep):
+            kept[c].append((tokens,labels))
+    totalCounts["nearDuplicates"] += len(sentences) - len(keep)
+    if (dedupStats):
+        writeDedupStats(dedupStats,sentences,members,keep)
+    return [(convSentences,counts) for convSentences,(oldSentences,counts) in zip(kept,conversions)]
+
+def chooseRepresentatives (labelLists,indices):
+    """Takes the label lists of the sentences of a cluster and their indices; returns the indices of those to keep: for
+       each distinct set of entity types in the cluster, the sentence with the most labeled tokens (the first, of equals).
+       If any sentence in the cluster is annotated, the unannotated ones are all dropped."""
+    best = dict()
+    for labels,index in zip(labelLists,indices):
+        types   = frozenset([nameType(label) for label in labels if label != "O"])
+        labeled = len([label for label in labels if label != "O"])
+        if (types not in best or labeled > best[types][0]):
+            best[types] = (labeled,index)
+    if (len(best) > 1):
+        best.pop(frozenset(),None)
+    return [index for (labeled,index) in best.values()]
+
+def nameType (label):
+    """Returns the name type of a label other than 'O', i.e. the label without any IOB prefix."""
+    return label[2:] if useIOB else label
+
+def writeDedupStats (filename,sentences,members,keep):
+    sizes     = sorted([len(indices) for indices in members.values()],reverse=True)
+    tokens    = sum([len(tokens) for (c,tokens,labels) in sentences])
+    kept      = sum([len(sentences[i][1]) for i in keep])
+    largest   = sorted(members.values(),key=len,reverse=True)[:20]
+    histogram = dict()
+    for size in sizes:
+        histogram[size] = histogram.get(size,0) + 1
+    stats = {"threshold": dedup, "sentences": len(sentences), "kept": len(keep), "dropped": len(sentences) - len(keep),
+             "tokens": tokens, "tokensKept": kept, "clusters": len(sizes), "clustersWithDuplicates": len([s for s in sizes if s > 1]),
+             "clusterSizes": dict([(str(size),count) for size,count in histogram.items()]),
+             "annotatedKept": len([i for i in keep if any([label != "O" for label in sentences[i][2]])]),
+             "largestClusters": [{"size": len(indices), "kept": len([i for i in indices if i in keep]),
+                                  "example": " ".join(sentences[indices[0]][1][:20])} for indices in largest]}
+    with open(filename,"wb") as outstream:
+        JSON.dump(stats,outstream,indent=1,sort_keys=True)
+
+def processJSONStream (instream,sentences):
+    """Takes an input stream, on which a JSON list is assumed to be, and a list of sentences.
+       Generates the annotation from the JSON list and adds it to the sentences."""
     forms = JSON.load(instream)
-    processJSONForms(forms,outstream)
+    processJSONForms(forms,sentences)
 
-def processJSONForms (forms,outstream):
-    """Takes a JSON list, and an output stream.  Generates the annotation from the JSON list
-       and writes it to the output stream."""
+def processJSONForms (forms,sentences):
+    """Takes a JSON list, and a list of sentences.  Generates the annotation from the JSON list and adds each sentence
+       kept to the list, as a pair of its tokens and labels, for writeLabeledSentence."""
     assert(type(forms) == list)
     # print("%d forms" % len(forms))
     for form in forms:
@@ -91,28 +239,48 @@ def processJSONForms (forms,outstream):
                 entity.tokens = sentTokens[start:end+1]
                 entity.string = " ".join(entity.tokens)
                 entities.append(entity)
-                outputNameTypes.add(labelType)
         # Generate labels for them and print them out one per line
         labels = generateLabelsForSentence(sentTokens,entities)
-        # Don't filter right now 
-        # (sentTokens,labels) = filterTokens(sentTokens,labels)
-        for i in range(0,len(labels)):
-            # outstream.write("%s\t%s\n" % (sentTokens[i].encode("utf-8"),labels[i]))
-            # outstream.write("%s\t%s\n" % (sentTokens[i],labels[i]))
-            token = fixToken(sentTokens[i])
-            tmp = token
-            tmp += unicode("\t")
-            tmp += unicode(labels[i])
-            tmp += unicode("\n")
-            if ("\t" not in tmp):
-                raise "Huh?"
-            outstream.write(tmp)
-            # outstream.write(sentTokens[i])
-            # outstream.write(unicode("\t"))
-            # outstream.write(labels[i])
-            # outstream.write("\n")
-        # Last line must be empty with newline.     
-        outstream.write("\n")
+        # Split overly long sentences into pieces, each of which is written out as a sentence of its own
+        splits = []
+        if (maxLength is not None):
+            splits = findSplitPoints(sentTokens,maxLength,[(e.start,e.end) for e in entities])
+        for pieceTokens,pieceLabels in zip(splitAt(sentTokens,splits),splitAt(labels,splits)):
+            if (keepSentence(pieceLabels)):
+                sentences.append((pieceTokens,pieceLabels))
+
+def writeLabeledSentence (sentTokens,labels,outstream):
+    """Writes the tokens and their labels to the output stream, one token/label pair per line, followed by an empty line."""
+    # Don't filter right now 
+    # (sentTokens,labels) = filterTokens(sentTokens,labels)
+    for i in range(0,len(labels)):
+        # outstream.write("%s\t%s\n" % (sentTokens[i].encode("utf-8"),labels[i]))
+        # outstream.write("%s\t%s\n" % (sentTokens[i],labels[i]))
+        token = fixToken(sentTokens[i])
+        tmp = token
+        tmp += unicode("\t")
+        tmp += unicode(labels[i])
+        tmp += unicode("\n")
+        if ("\t" not in tmp):
+            raise "Huh?"
+        outstream.write(tmp)
+        # outstream.write(sentTokens[i])
+        # outstream.write(unicode("\t"))
+        # outstream.write(labels[i])
+        # outstream.write("\n")
+    # Last line must be empty with newline.     
+    outstream.write("\n")
+
+def keepSentence (labels):
+    """Decides whether a sentence with these labels is written out, and counts it.  All-'O' sentences are kept with
+       probability negFraction.  The cap on the number of tokens is applied later, by writeConversion."""
+    sentenceCounts["sentences"] += 1
+    if (all([label == "O" for label in labels])):
+        sentenceCounts["negatives"] += 1
+        if (sampler.random() >= negFraction):
+            return False
+        sentenceCounts["negativesKept"] += 1
+    return True
 
 def fixToken (token):
     hasWhite = False
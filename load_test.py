@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+import os
+import re
+import sys
+import json
+import math
+import shutil
+import random
+import socket
+import urllib2
+import tempfile
+import urlparse
+import threading
+import subprocess
+from sys import stderr
+from time import time,sleep
+from argparse import ArgumentParser
+from synthetic_mturk import makeForms
+
+scriptArgs = ArgumentParser(description="Load test for the train_model.php endpoint: starts a local server, POSTs synthetic MTurk JSON to it at one or more request rates, and records latency percentiles, failure rates and the time taken by each stage of train_model.sh on the server.")
+
+scriptArgs.add_argument('--server',default="wsgi",choices=["wsgi","php","none"],help="Server to start: 'wsgi' for train_model_wsgi.py, 'php' for PHP's built-in server running train_model.php, or 'none' to use the one at --url. Default is wsgi.")
+scriptArgs.add_argument('--url',help="Base URL of an already running server, with --server none.")
+scriptArgs.add_argument('--root',help="Directory to serve from, laid out as for serving train_model.php: train_model.php, train_model.sh, bin/ and outputs/. If not given, a temporary one is made from this checkout, and removed afterwards.")
+scriptArgs.add_argument('--port',type=int,default=0,help="Port for the server. Default is any free port.")
+scriptArgs.add_argument('--rates',type=float,nargs='+',default=[0.1],help="Request rates to test, in requests per second, one stage per rate. Requests arrive at random (Poisson) times, whether or not earlier ones have finished. Default is 0.1.")
+scriptArgs.add_argument('--duration',type=float,default=60,help="Seconds over which requests are sent at each rate. Each stage also waits for its requests to finish. Default is 60.")
+scriptArgs.add_argument('--forms',type=int,default=200,help="Number of forms in each uploaded JSON file. Default is 200.")
+scriptArgs.add_argument('--timeout',type=float,default=600,help="Seconds after which a request counts as failed. Default is 600, the time limit train_model.php sets.")
+scriptArgs.add_argument('--seed',type=int,default=0,help="Seed for the uploads and arrival times. Default is 0.")
+scriptArgs.add_argument('--report',help="Optional output file for the results as JSON. They are printed to stderr in any case.")
+
+argValues = vars(scriptArgs.parse_args())
+
+
+# Command line arguments
+
+serverType = argValues["server"]
+baseUrl    = argValues["url"]
+rootDir    = argValues["root"]
+port       = argValues["port"]
+rates      = argValues["rates"]
+duration   = argValues["duration"]
+numForms   = argValues["forms"]
+timeout    = argValues["timeout"]
+seed       = argValues["seed"]
+reportFile = argValues["report"]
+
+# Where this checkout is, for making a server root from it
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PERCENTILES = [50,90,95,99]
+TIMING_LINE = re.compile(r'^TIMING (\S+) ([\d.]+)$',re.M)
+
+
+########################################################################################################################################
+
+
+def main ():
+    """The function that is called in a command line context. """
+    global baseUrl
+    if (serverType == "none" and baseUrl == None):
+        raise RuntimeError("--server none needs --url")
+    tempRoot = rootDir == None and serverType != "none"
+    root     = makeServerRoot() if tempRoot else rootDir
+    server   = None
+    try:
+        if (serverType != "none"):
+            (server,baseUrl) = startServer(root)
+        stages = []
+        for i,rate in enumerate(rates):
+            stderr.write("Sending %.3g requests/s for %.0fs to %s\n" % (rate,duration,baseUrl))
+            stages.append(runStage(rate,random.Random(seed + i)))
+        printStages(stages)
+        if (reportFile):
+            with open(reportFile,"wb") as outstream:
+                json.dump({"server": serverType, "url": baseUrl, "forms": numForms, "duration": duration, "stages": stages},
+                          outstream,indent=1,sort_keys=True)
+    finally:
+        if (server):
+            server.terminate()
+            server.wait()
+        if (tempRoot):
+            shutil.rmtree(root,ignore_errors=True)
+
+def makeServerRoot ():
+    """Makes a temporary directory laid out as train_model.php is served from, with bin/ pointing at this checkout."""
+    root = tempfile.mkdtemp(prefix="loadtest")
+    for filename in ["train_model.php","train_model.sh","index.html"]:
+        shutil.copy(os.path.join(SCRIPT_DIR,filename),root)
+    os.symlink(SCRIPT_DIR,os.path.join(root,"bin"))
+    os.mkdir(os.path.join(root,"outputs"))
+    return root
+
+def startServer (root):
+    """Starts the server on the root directory; returns the process and its base URL, once it is accepting connections.
+       PHP's built-in server handles one request at a time unless PHP_CLI_SERVER_WORKERS is set in the environment."""
+    serverPort = port or freePort()
+    if (serverType == "php"):
+        command = ["php","-S","127.0.0.1:%d" % serverPort,"-t",root]
+    else:
+        command = [sys.executable,os.path.join(SCRIPT_DIR,"train_model_wsgi.py"),"--root",root,"--port",str(serverPort),"--quiet"]
+    process = subprocess.Popen(command,cwd=root)
+    for i in range(100):
+        try:
+            socket.create_connection(("127.0.0.1",serverPort),1).close()
+            return (process,format("http://127.0.0.1:%d" % serverPort))
+        except socket.error:
+            if (process.poll() != None):
+                break
+            sleep(0.1)
+    process.terminate()
+    raise RuntimeError(format("Server did not start: %s" % " ".join(command)))
+
+def freePort ():
+    s = socket.socket()
+    s.bind(("127.0.0.1",0))
+    number = s.getsockname()[1]
+    s.close()
+    return number
+
+def runStage (rate,rng):
+    """Sends requests at random times at the given average rate for the stage's duration, each from a thread of its own,
+       then waits for them all to finish.  Returns the stage's results as a dict."""
+    results   = []
+    threads   = []
+    startTime = time()
+    sendTime  = startTime
+    count     = 0
+    while (True):
+        sendTime += rng.expovariate(rate)
+        if (sendTime - startTime > duration):
+            break
+        sleep(max(sendTime - time(),0))
+        payload = makeUpload(random.Random(rng.random()))
+        thread  = threading.Thread(target=sendRequest,args=(payload,results))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+        count += 1
+    for thread in threads:
+        thread.join()
+    return summarizeStage(rate,count,results,time() - startTime)
+
+def makeUpload (rng):
+    """Returns a multipart/form-data body with synthetic MTurk JSON as the 'jsonfile' upload, and its content type."""
+    boundary = "----loadtest%016x" % rng.getrandbits(64)
+    content  = json.dumps(makeForms(numForms,rng))
+    body     = ("--%s\r\nContent-Disposition: form-data; name=\"jsonfile\"; filename=\"upload.json\"\r\n"
+                "Content-Type: application/json\r\n\r\n%s\r\n--%s--\r\n" % (boundary,content,boundary))
+    return (body,"multipart/form-data; boundary=%s" % boundary)
+
+def sendRequest (payload,results):
+    """POSTs an upload and adds its outcome to results: latency, whether a model came back, and the stage timings from
+       the job's log.  Any HTTP error, timeout or response without a model is a failure."""
+    (body,contentType) = payload
+    result    = {"ok": False, "error": None, "timings": {}}
+    startTime = time()
+    try:
+        request  = urllib2.Request(baseUrl + "/train_model.php",body,{"Content-Type": contentType})
+        response = json.loads(urllib2.urlopen(request,timeout=timeout).read())
+        result["latency"] = time() - startTime
+        result["ok"]      = "model" in response
+        if (not result["ok"]):
+            result["error"] = "no model"
+        logUrl = response.get("log") or response.get("logf")
+        if (logUrl):
+            result["timings"] = fetchTimings(logUrl)
+    except Exception as e:
+        result["latency"] = time() - startTime
+        result["error"]   = format("%s: %s" % (type(e).__name__,e))
+    results.append(result)
+
+def fetchTimings (logUrl):
+    """Reads the 'TIMING <stage> <seconds>' lines of a job's log.  train_model.php gives URLs on http://localhost, so only
+       the path of the URL is used, on the server under test."""
+    path = urlparse.urlparse(logUrl).path
+    try:
+        log = urllib2.urlopen(baseUrl + path,timeout=timeout).read()
+    except Exception:
+        return {}
+    return dict([(stage,float(seconds)) for stage,seconds in TIMING_LINE.findall(log)])
+
+def summarizeStage (rate,count,results,elapsed):
+    latencies = sorted([r["latency"] for r in results])
+    succeeded = [r for r in results if r["ok"]]
+    errors    = dict()
+    for r in results:
+        if (r["error"]):
+            kind = r["error"].split(":")[0]
+            errors[kind] = errors.get(kind,0) + 1
+    stageTimes = dict()
+    for r in results:
+        for stage,seconds in r["timings"].items():
+            stageTimes.setdefault(stage,[]).append(seconds)
+    return {"rate": rate, "requests": count, "succeeded": len(succeeded), "failureRate": 1.0 - float(len(succeeded)) / max(count,1),
+            "errors": errors, "elapsedSeconds": elapsed, "throughput": len(succeeded) / max(elapsed,1e-9),
+            "latency": summarize(latencies),
+            "stageSeconds": dict([(stage,summarize(sorted(times))) for stage,times in stageTimes.items()])}
+
+def summarize (values):
+    """Takes sorted values; returns their mean, max and nearest-rank percentiles."""
+    if (not values):
+        return {}
+    summary = {"mean": sum(values) / len(values), "max": values[-1]}
+    for p in PERCENTILES:
+        summary["p%d" % p] = values[max(int(math.ceil(p / 100.0 * len(values))) - 1,0)]
+    return summary
+
+def printStages (stages):
+    stderr.write("\n%8s %8s %8s %8s %10s %8s %8s %8s %8s %8s\n" % ("rate/s","requests","ok","failed","models/s","p50 s","p90 s","p95 s","p99 s","max s"))
+    for stage in stages:
+        latency = stage["latency"]
+        stderr.write("%8.3g %8d %8d %7.1f%% %10.3f" % (stage["rate"],stage["requests"],stage["succeeded"],100 * stage["failureRate"],stage["throughput"]))
+        for key in ["p50","p90","p95","p99","max"]:
+            stderr.write(" %8.2f" % latency.get(key,0.0))
+        stderr.write("\n")
+    for stage in stages:
+        if (stage["errors"]):
+            stderr.write("\nFailures at %.3g/s: %s\n" % (stage["rate"],", ".join(["%s %d" % e for e in sorted(stage["errors"].items())])))
+        if (stage["stageSeconds"]):
+            stderr.write("\nServer-side stage times at %.3g/s (mean / p95 seconds):\n" % stage["rate"])
+            for name,summary in sorted(stage["stageSeconds"].items(),key=lambda s: -s[1]["mean"]):
+                stderr.write("  %-12s %8.2f %8.2f\n" % (name,summary["mean"],summary["p95"]))
+
+# Call the 'main' function if we are being invoke in a script context.
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+import os
+import json
+from sys import stderr
+from time import time
+from argparse import ArgumentParser
+import crf_text_model
+import model_bundle
+
+scriptArgs = ArgumentParser(description="Makes a model bundle: one file with a trained model and the feature plan crf_features.py resolved from the feat-list it was trained with (columns, compositions, OPTIONS: monocase, extra feature definitions, word and phrase lists and templates). 'crf_features.py --bundle' featurizes input from it exactly as the training data was, and crf_decode.py decodes with it; both map it into memory rather than parsing it.")
+
+scriptArgs.add_argument('--model',help="Required CRF++ text model file, i.e. the 'crf.model.txt' written by 'crf_learn -t'.",required=True)
+scriptArgs.add_argument('--plan',help="Required feature plan file, written by 'crf_features.py --plan' along with the model's training data.",required=True)
+scriptArgs.add_argument('--output',help="Required output file for the bundle.",required=True)
+scriptArgs.add_argument('--verbose',action='store_true',help="Print the bundle's size and how long it takes to load, compared with the text model.")
+
+argValues = vars(scriptArgs.parse_args())
+
+
+# Command line arguments
+
+modelFile  = argValues["model"]
+planFile   = argValues["plan"]
+outputFile = argValues["output"]
+verbose    = argValues["verbose"]
+
+
+########################################################################################################################################
+
+
+def main ():
+    """The function that is called in a command line context. """
+    nonOverlapping([modelFile,planFile],[outputFile])
+    startTime = time()
+    model     = crf_text_model.readTextModel(modelFile)
+    textTime  = time() - startTime
+    with open(planFile,"rb") as instream:
+        plan = json.load(instream)
+    # Written by way of a temporary file, so that a decoder never maps half a bundle.
+    model_bundle.writeBundle(outputFile + ".tmp",model,plan)
+    os.rename(outputFile + ".tmp",outputFile)
+    if (verbose):
+        startTime = time()
+        bundle    = model_bundle.readBundle(outputFile)
+        stderr.write("Wrote %s: %.1f MB, %d labels, %d templates, %d features, %d columns, %d word and phrase lists\n" %
+                     (outputFile,os.path.getsize(outputFile) / 1048576.0,len(bundle.model.labels),len(bundle.model.templates),
+                      len(bundle.model.featureIds),len(plan["columns"]),len(plan["gazetteers"])))
+        stderr.write("Loads in %.3fs; the text model took %.3fs\n" % (time() - startTime,textTime))
+
+
+def nonOverlapping (files1, files2):
+    """Takes two lists of files; raises an exception if they overlap."""
+    for file1 in files1:
+        for file2 in files2:
+            if (file1 != None and file2 != None and file1 == file2):
+                raise RuntimeError(format("Can't overwrite %s" % file1))
+
+# Call the 'main' function if we are being invoke in a script context.
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+import json
+import random
+from sys import stdout,stderr
+from argparse import ArgumentParser
+from synthetic_mturk import makeForms,ALL_NAME_TYPES
+
+scriptArgs = ArgumentParser(description="Writes synthetic DIG MTurk JSON, a list of forms with 'allTokens' and an 'annotationSet', as json_to_name_annotations.py and train_model.php take it, of a given size: for benchmarks, load tests and trying out the training pipeline without real annotations.")
+
+scriptArgs.add_argument('--forms',type=int,required=True,help="Required number of forms (ads) to write.")
+scriptArgs.add_argument('--output',help="Optional output file. Writes to stdout if no argument provided.")
+scriptArgs.add_argument('--nametypes',default=",".join(ALL_NAME_TYPES),help="Comma-separated name types to annotate, from %s. Default is all of them." % ",".join(ALL_NAME_TYPES))
+scriptArgs.add_argument('--multiword',type=float,default=0.25,help="Fraction of entities that are more than one token long, e.g. 'dirty blonde'. Default is 0.25.")
+scriptArgs.add_argument('--annotated',type=float,default=0.6,help="Fraction of forms that are annotated; the rest have 'noAnnotations', as when an MTurk worker finds nothing to mark. Default is 0.6.")
+scriptArgs.add_argument('--minlength',type=int,default=5,help="Smallest number of tokens in a form. Default is 5.")
+scriptArgs.add_argument('--maxlength',type=int,default=40,help="Largest number of tokens in a form, give or take an entity. Default is 40.")
+scriptArgs.add_argument('--seed',type=int,default=0,help="Seed for the random forms, so that a corpus can be made again. Default is 0.")
+scriptArgs.add_argument('--verbose',action='store_true',help="Print the number of forms, tokens and entities of each name type to stderr.")
+
+argValues = vars(scriptArgs.parse_args())
+
+
+# Command line arguments
+
+numForms          = argValues["forms"]
+outputFile        = argValues["output"]
+nameTypes         = argValues["nametypes"].split(",")
+multiWordFraction = argValues["multiword"]
+annotatedFraction = argValues["annotated"]
+minLength         = argValues["minlength"]
+maxLength         = argValues["maxlength"]
+seed              = argValues["seed"]
+verbose           = argValues["verbose"]
+
+
+########################################################################################################################################
+
+
+def main ():
+    """The function that is called in a command line context. """
+    for nameType in nameTypes:
+        if (nameType not in ALL_NAME_TYPES):
+            raise RuntimeError(format("Unknown name type %s; known ones are %s" % (nameType,",".join(ALL_NAME_TYPES))))
+    if (minLength < 1 or maxLength < minLength):
+        raise RuntimeError(format("Bad form lengths %d to %d" % (minLength,maxLength)))
+    forms = makeForms(numForms,random.Random(seed),minLength,maxLength,annotatedFraction,nameTypes,multiWordFraction)
+    if (outputFile != None):
+        with open(outputFile,"wb") as outstream:
+            json.dump(forms,outstream)
+    else:
+        json.dump(forms,stdout)
+    if (verbose):
+        printCounts(forms)
+
+def printCounts (forms):
+    entities = dict()
+    tokens   = 0
+    for form in forms:
+        tokens += len(form["allTokens"])
+        for nameType,annotations in form["annotationSet"].items():
+            if (nameType != "noAnnotations"):
+                (count,entityTokens) = entities.get(nameType,(0,0))
+                entities[nameType]   = (count + len(annotations),entityTokens + sum([len(a["annotatedTokens"]) for a in annotations]))
+    stderr.write("%d forms, %d tokens\n" % (len(forms),tokens))
+    for nameType in sorted(entities):
+        (count,entityTokens) = entities[nameType]
+        stderr.write("%-10s %7d entities, %.2f tokens each\n" % (nameType,count,float(entityTokens) / count))
+
+# Call the 'main' function if we are being invoke in a script context.
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,119 @@
+"""Model bundles: a trained CRF++ model together with everything needed to featurize input for it, in one file, used by
+   make_bundle.py, crf_features.py and crf_decode.py.  This is a plain module, with no command line of its own.
+
+   A bundle holds the labels, templates, feature dictionary and weights of a text model (crf_learn -t), and the feature
+   plan crf_features.py resolved from the feat-list the model was trained with (see --plan there): the feature matrix
+   columns and how each is computed, OPTIONS: monocase, the source of any --extrafeatdefs, and the word and phrase lists
+   of defwordlist and defphraselist lines, already read and indexed.  Input featurized from a bundle needs no feat-list
+   or word list files, and can't be featurized differently from the training data.
+
+   The file is laid out to be memory-mapped and used in place:
+
+     magic          - 8 bytes, MAGIC
+     header length  - uint64, little-endian
+     header         - JSON: the text model's header, labels and templates, the plan, and the type, offset and length of
+                      each array, the offsets counting from the first multiple of ALIGNMENT after the header
+     weights        - float64, the model's weights, followed by labels^2 zeros for features not in the dictionary
+     featureIds     - int64, the first weight of each dictionary feature, in the order of 'features'
+     features       - uint8, the dictionary's feature strings in UTF-8, separated by newlines
+
+   Each array starts at a multiple of ALIGNMENT bytes.  numpy is only needed for the arrays, so that crf_features.py can
+   read the plan without it."""
+
+import json
+import mmap
+import struct
+import itertools
+import crf_text_model
+
+
+MAGIC     = "CRFBNDL1"
+ALIGNMENT = 64
+VERSION   = 1
+
+
+def isBundle (filename):
+    """Returns true if the file is a model bundle, rather than e.g. a text model."""
+    with open(filename,"rb") as instream:
+        return instream.read(len(MAGIC)) == MAGIC
+
+def aligned (offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def writeBundle (filename,model,plan):
+    """Writes a bundle of a TextModel and a feature plan, as crf_features.py --plan writes it.  Raises an exception if the
+       templates of the plan are not those of the model, i.e. if the model was trained on another feat-list."""
+    import numpy
+    if ([line for line in plan["templates"] if line.strip() != ""] != model.templates):
+        raise RuntimeError(format("The templates of the feature plan for %s are not those the model was trained with" % plan["featlist"]))
+    features = sorted(model.featureIds)
+    arrays   = [("weights",numpy.concatenate([model.weights,numpy.zeros(len(model.labels) ** 2)]).astype("<f8")),
+                ("featureIds",numpy.array([model.featureIds[feature] for feature in features],dtype="<i8")),
+                ("features",numpy.array(bytearray(u"\n".join(features).encode("utf-8")),dtype=numpy.uint8))]
+    layout   = dict()
+    offset   = 0
+    for (name,array) in arrays:
+        layout[name] = {"dtype": array.dtype.str, "offset": offset, "length": len(array)}
+        offset       = aligned(offset + array.nbytes)
+    header = json.dumps({"version": VERSION, "modelHeader": model.header, "labels": model.labels, "templates": model.templates,
+                         "plan": plan, "arrays": layout},sort_keys=True)
+    start  = aligned(len(MAGIC) + 8 + len(header))
+    with open(filename,"wb") as outstream:
+        outstream.write(MAGIC + struct.pack("<Q",len(header)) + header)
+        for (name,array) in arrays:
+            outstream.write("\0" * (start + layout[name]["offset"] - outstream.tell()))
+            outstream.write(array.tostring())
+
+def readBundleHeader (filename):
+    """Returns the header of a bundle as a dict, without mapping the rest.  Its "plan" is the feature plan."""
+    with open(filename,"rb") as instream:
+        prefix = instream.read(len(MAGIC) + 8)
+        return parseHeader(prefix + instream.read(headerLength(prefix,filename)),filename)
+
+def headerLength (data,filename):
+    if (data[:len(MAGIC)] != MAGIC):
+        raise RuntimeError(format("%s is not a model bundle (make one with make_bundle.py)" % filename))
+    return struct.unpack("<Q",data[len(MAGIC):len(MAGIC) + 8])[0]
+
+def parseHeader (data,filename):
+    """Takes the start of a bundle, at least to the end of its header, as a string or mmap; returns the header as a dict,
+       with the offset of the arrays added as "start"."""
+    length = headerLength(data,filename)
+    header = json.loads(data[len(MAGIC) + 8:len(MAGIC) + 8 + length])
+    if (header["version"] != VERSION):
+        raise RuntimeError(format("%s is a version %s bundle; this code reads version %d" % (filename,header["version"],VERSION)))
+    header["start"] = aligned(len(MAGIC) + 8 + length)
+    return header
+
+def readBundle (filename):
+    """Maps a bundle into memory; returns a Bundle.  The weights are used where they are in the file, so processes that
+       read the same bundle share them; only the feature dictionary is built, from a single split of its strings."""
+    import numpy
+    with open(filename,"rb") as instream:
+        mapped = mmap.mmap(instream.fileno(),0,access=mmap.ACCESS_READ)
+    header = parseHeader(mapped,filename)
+    arrays = dict()
+    for name,layout in header["arrays"].items():
+        arrays[name] = numpy.frombuffer(mapped,dtype=layout["dtype"],count=layout["length"],offset=header["start"] + layout["offset"])
+    model            = crf_text_model.TextModel()
+    model.header     = [tuple(pair) for pair in header["modelHeader"]]
+    model.labels     = header["labels"]
+    model.templates  = header["templates"]
+    model.weights    = arrays["weights"][:int(dict(model.header)["maxid"])]
+    features         = arrays["features"].tostring().decode("utf-8").split(u"\n") if len(arrays["featureIds"]) else []
+    model.featureIds = dict(itertools.izip(features,arrays["featureIds"].tolist()))
+    bundle         = Bundle()
+    bundle.model   = model
+    bundle.weights = arrays["weights"]
+    bundle.plan    = header["plan"]
+    bundle.mapped  = mapped
+    return bundle
+
+
+class Bundle(object):
+    """The contents of a model bundle."""
+    def __init__ (self):
+        self.model   = None   # crf_text_model.TextModel, with its weights in the mapped file.
+        self.weights = None   # The model's weights followed by labels^2 zeros, in the mapped file.
+        self.plan    = None   # The feature plan, as crf_features.py --plan writes it.
+        self.mapped  = None   # The mmap of the file, which the arrays are views of.
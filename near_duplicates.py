@@ -0,0 +1,95 @@
+"""Finding near-duplicate sentences with MinHash and locality-sensitive hashing, used by json_to_name_annotations.py to
+   shrink training corpora of scraped ads, which come in many variants that differ only in a phone number or a name.
+   This is a plain module, with no command line of its own.
+
+   A sentence is the set of its token n-grams (shingles), with tokens lower-cased and runs of digits replaced by '0'.  Two
+   sentences are near duplicates if the Jaccard similarity of their shingle sets is at least a threshold.  Rather than
+   comparing every pair, each sentence gets a MinHash signature, cut into bands; sentences that agree on all of a band's
+   values land in the same bucket, and only those are compared.  Near duplicates are then joined into clusters."""
+
+import re
+import zlib
+import random
+
+
+SHINGLE_SIZE = 3    # Tokens per shingle
+NUM_HASHES   = 32   # Length of a MinHash signature
+NUM_BANDS    = 16   # Bands of NUM_HASHES/NUM_BANDS values.  With 2 rows, pairs at 0.5 similarity share a bucket 99% of the
+                    # time; more candidates than a stricter banding would give, but checking one costs less than hashing.
+
+DIGITS = re.compile(r'\d+')
+
+# The MinHash functions are (a*x + b) mod PRIME, for random a and b below 2^30, over 32-bit shingle hashes.  PRIME is
+# the first prime above 2^32, and a*x + b stays below 2^63, so the arithmetic is on machine integers.
+
+PRIME      = (1 << 32) + 15
+COEFF_BITS = 30
+
+
+def shingleSet (tokens):
+    """Returns the set of 32-bit hashes of a sentence's shingles.  A sentence shorter than a shingle is a single shingle.
+       Tokens, which have no spaces in them, are normalized all together."""
+    tokens = DIGITS.sub("0"," ".join(tokens).lower()).split(" ")
+    if (len(tokens) <= SHINGLE_SIZE):
+        grams = [" ".join(tokens)]
+    else:
+        grams = [" ".join(tokens[i:i+SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)]
+    return frozenset([zlib.crc32(gram.encode("utf-8")) & 0xffffffff for gram in grams])
+
+def jaccard (set1,set2):
+    return float(len(set1 & set2)) / len(set1 | set2)
+
+def findClusters (sentences,threshold,seed=0):
+    """Takes a list of sentences, each a list of tokens, and a similarity threshold; returns a list giving the cluster of
+       each sentence, as the index of one of its members.  Sentences with the same shingle set are always clustered
+       together; others are if LSH makes them candidates and their similarity is at least the threshold.  Clusters are
+       closed under near duplication, so a cluster can hold a chain of sentences each close to the next."""
+    rng          = random.Random(seed)
+    coefficients = [(rng.randrange(1,1 << COEFF_BITS),rng.randrange(0,1 << COEFF_BITS)) for i in range(NUM_HASHES)]
+    rows         = NUM_HASHES // NUM_BANDS
+    shingles     = [shingleSet(tokens) for tokens in sentences]
+    clusters     = UnionFind(len(sentences))
+    # Exact duplicates of the shingle set go straight into one cluster, so that boilerplate repeated thousands of times
+    # is hashed once.
+    distinct = dict()
+    for i,shingleHashes in enumerate(shingles):
+        first = distinct.setdefault(shingleHashes,i)
+        if (first != i):
+            clusters.union(first,i)
+    buckets = dict()
+    for i in sorted(distinct.values()):
+        signature = [min([(a * x + b) % PRIME for x in shingles[i]]) for (a,b) in coefficients]
+        for band in range(NUM_BANDS):
+            key = (band,) + tuple(signature[band*rows:(band+1)*rows])
+            # Each sentence is compared with one member, the first to land there, of each cluster in its bucket, rather
+            # than with every member; if it joins none of them, it is its cluster's member there.
+            members = buckets.setdefault(key,[])
+            joined  = False
+            for j in members:
+                if (clusters.find(j) == clusters.find(i)):
+                    joined = True
+                elif (jaccard(shingles[j],shingles[i]) >= threshold):
+                    clusters.union(j,i)
+                    joined = True
+            if (not joined):
+                members.append(i)
+    return [clusters.find(i) for i in range(len(sentences))]
+
+
+class UnionFind(object):
+    """Disjoint sets of the integers 0...n-1."""
+    def __init__ (self,n):
+        self.parents = range(n)
+
+    def find (self,i):
+        root = i
+        while (self.parents[root] != root):
+            root = self.parents[root]
+        while (self.parents[i] != root):
+            (self.parents[i],i) = (root,self.parents[i])
+        return root
+
+    def union (self,i,j):
+        (i,j) = (self.find(i),self.find(j))
+        if (i != j):
+            self.parents[max(i,j)] = min(i,j)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+import os
+import json
+import gzip
+import hashlib
+from sys import stderr
+from time import time,strftime,gmtime
+from argparse import ArgumentParser
+
+scriptArgs = ArgumentParser(description="Packages trained model files, e.g. crf.model and crf.bundle, for distribution to decoding nodes: writes a gzip-compressed copy of each next to it, and a manifest with the size and SHA-256 of each file before and after compression. fetch_model.py reads the manifest, downloads the compressed files, resuming interrupted transfers, and checks them against it.")
+
+scriptArgs.add_argument('--files',nargs='+',help="Required model files to package.",required=True)
+scriptArgs.add_argument('--manifest',help="Required output file for the manifest, as JSON. The files are named in it relative to its directory, so they have to be in it or below it.",required=True)
+scriptArgs.add_argument('--level',type=int,default=6,choices=range(1,10),help="gzip compression level, from 1 (fastest) to 9 (smallest). Default is 6.")
+scriptArgs.add_argument('--verbose',action='store_true',help="Print the size of each file before and after compression.")
+
+argValues = vars(scriptArgs.parse_args())
+
+
+# Command line arguments
+
+files        = argValues["files"]
+manifestFile = argValues["manifest"]
+level        = argValues["level"]
+verbose      = argValues["verbose"]
+
+BLOCK_SIZE       = 1 << 20
+MANIFEST_VERSION = 1
+
+
+########################################################################################################################################
+
+
+def main ():
+    """The function that is called in a command line context. """
+    nonOverlapping(files,[manifestFile] + [filename + ".gz" for filename in files])
+    baseDir = os.path.dirname(os.path.abspath(manifestFile))
+    entries = []
+    for filename in files:
+        name = os.path.relpath(os.path.abspath(filename),baseDir)
+        if (name.startswith(os.pardir)):
+            raise RuntimeError(format("%s is not under the directory of the manifest %s" % (filename,manifestFile)))
+        startTime = time()
+        entry     = compressFile(filename)
+        entry.update({"name": name, "compressed": name + ".gz"})
+        entries.append(entry)
+        if (verbose):
+            stderr.write("%s: %d bytes, %d compressed (%.1f%%) in %.2fs\n" %
+                         (name,entry["bytes"],entry["compressedBytes"],100.0 * entry["compressedBytes"] / max(entry["bytes"],1),time() - startTime))
+    # The id names this set of files: it changes if and only if one of them does.
+    artifactId = hashlib.sha256("\n".join(["%s %s" % (entry["name"],entry["sha256"]) for entry in entries])).hexdigest()
+    manifest   = {"version": MANIFEST_VERSION, "id": artifactId, "created": strftime("%Y-%m-%dT%H:%M:%SZ",gmtime()), "files": entries}
+    with open(manifestFile + ".tmp","wb") as outstream:
+        json.dump(manifest,outstream,indent=1,sort_keys=True)
+    os.rename(manifestFile + ".tmp",manifestFile)
+
+def compressFile (filename):
+    """Writes filename.gz, by way of a temporary file; returns the sizes and SHA-256s of the file and its compressed copy.
+       The gzip header has no time stamp in it, so the same file always compresses to the same bytes."""
+    rawDigest  = hashlib.sha256()
+    rawBytes   = 0
+    compressed = filename + ".gz"
+    with open(filename,"rb") as instream:
+        with open(compressed + ".tmp","wb") as outstream:
+            gzipped = gzip.GzipFile(os.path.basename(filename),"wb",level,outstream,mtime=0)
+            for block in iter(lambda: instream.read(BLOCK_SIZE),""):
+                rawDigest.update(block)
+                rawBytes += len(block)
+                gzipped.write(block)
+            gzipped.close()
+    os.rename(compressed + ".tmp",compressed)
+    return {"bytes": rawBytes, "sha256": rawDigest.hexdigest(), "compressedBytes": os.path.getsize(compressed),
+            "compressedSha256": fileDigest(compressed)}
+
+def fileDigest (filename):
+    """Returns the SHA-256 of a file's contents, as hex."""
+    digest = hashlib.sha256()
+    with open(filename,"rb") as instream:
+        for block in iter(lambda: instream.read(BLOCK_SIZE),""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def nonOverlapping (files1, files2):
+    """Takes two lists of files; raises an exception if they overlap."""
+    for file1 in files1:
+        for file2 in files2:
+            if (file1 != None and file2 != None and file1 == file2):
+                raise RuntimeError(format("Can't overwrite %s" % file1))
+
+# Call the 'main' function if we are being invoke in a script context.
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+import os
+import re
+import sys
+import json
+import math
+import shutil
+import random
+import tempfile
+import subprocess
+from sys import stderr
+from time import time
+from argparse import ArgumentParser
+from synthetic_mturk import makeForms,ALL_NAME_TYPES
+from crf_runs import learnCommand,readSentences
+
+scriptArgs = ArgumentParser(description="Runs the training pipeline, json_to_name_annotations.py -> crf_features.py -> crf_learn, as train_model.sh does, on synthetic MTurk JSON of several sizes, and records the wall time, peak memory (RSS) and feature counts of each stage. From how they grow with the number of forms, it estimates the time and memory of a corpus --extrapolate times the largest one.")
+
+scriptArgs.add_argument('--sizes',type=int,nargs='+',default=[250,500,1000,2000],help="Numbers of forms to run the pipeline on. Default is 250 500 1000 2000.")
+scriptArgs.add_argument('--featlist',help="Feat-list for crf_features.py. Default is the dig-crf.feat-list of this checkout.")
+scriptArgs.add_argument('--learnflags',default="-a CRF-L2 -f 1",help="Flags for crf_learn, as one string. Default is '-a CRF-L2 -f 1'.")
+scriptArgs.add_argument('--threads',type=int,default=1,help="crf_learn threads (-p), unless --learnflags says otherwise. Default is 1.")
+scriptArgs.add_argument('--crfbin',default="",help="Optional directory containing crf_learn. It is looked for on the PATH if not given.")
+scriptArgs.add_argument('--nametypes',default=",".join(ALL_NAME_TYPES),help="Comma-separated name types in the synthetic forms, as for make_mturk_json.py. Default is all of them.")
+scriptArgs.add_argument('--multiword',type=float,default=0.25,help="Fraction of entities more than one token long, as for make_mturk_json.py. Default is 0.25.")
+scriptArgs.add_argument('--seed',type=int,default=0,help="Seed for the synthetic forms. Default is 0.")
+scriptArgs.add_argument('--extrapolate',type=float,default=10,help="Factor of the largest size at which to estimate each stage's time and memory. Default is 10.")
+scriptArgs.add_argument('--workdir',help="Optional directory for the JSON, intermediate files, models and logs of each size, which are then kept. A temporary one, removed afterwards, is used if not given.")
+scriptArgs.add_argument('--report',help="Optional output file for the results as JSON. They are printed to stderr in any case.")
+
+argValues = vars(scriptArgs.parse_args())
+
+
+# Command line arguments
+
+sizes       = sorted(argValues["sizes"])
+learnFlags  = argValues["learnflags"].split()
+numThreads  = argValues["threads"]
+crfLearn    = os.path.join(argValues["crfbin"],"crf_learn")
+nameTypes   = argValues["nametypes"].split(",")
+multiWord   = argValues["multiword"]
+seed        = argValues["seed"]
+factor      = argValues["extrapolate"]
+workDir     = argValues["workdir"]
+reportFile  = argValues["report"]
+
+# Where this checkout is, for running the pipeline's scripts
+
+SCRIPT_DIR   = os.path.dirname(os.path.abspath(__file__))
+featListFile = argValues["featlist"] or os.path.join(SCRIPT_DIR,"dig-crf.feat-list")
+
+STAGES = ["convert","featurize","learn"]
+
+
+########################################################################################################################################
+
+
+def main ():
+    """The function that is called in a command line context. """
+    temporary = workDir == None
+    directory = tempfile.mkdtemp(prefix="scaling") if temporary else workDir
+    try:
+        runs = [runPipeline(numForms,os.path.join(directory,"forms-%d" % numForms)) for numForms in sizes]
+    finally:
+        if (temporary):
+            shutil.rmtree(directory,ignore_errors=True)
+    scaling = fitScaling(runs)
+    printRuns(runs,scaling)
+    if (reportFile):
+        with open(reportFile,"wb") as outstream:
+            json.dump({"featlist": featListFile, "learnFlags": learnFlags, "nameTypes": nameTypes, "multiWord": multiWord,
+                       "seed": seed, "extrapolate": factor, "runs": runs, "scaling": scaling},outstream,indent=1,sort_keys=True)
+
+def runPipeline (numForms,directory):
+    """Makes numForms synthetic forms and runs the pipeline on them in the directory; returns the dict of what was measured."""
+    if (not os.path.isdir(directory)):
+        os.makedirs(directory)
+    path      = lambda name: os.path.join(directory,name)
+    forms     = makeForms(numForms,random.Random(seed),nameTypes=nameTypes,multiWordFraction=multiWord)
+    with open(path("training.json"),"wb") as outstream:
+        json.dump(forms,outstream)
+    stderr.write("%d forms...\n" % numForms)
+    run = {"forms": numForms, "tokens": sum([len(form["allTokens"]) for form in forms]), "jsonBytes": os.path.getsize(path("training.json"))}
+    run["convert"]   = runStage([sys.executable,os.path.join(SCRIPT_DIR,"json_to_name_annotations.py"),"--inputs",path("training.json"),
+                                 "--output",path("training.labeled")],path("convert.log"))
+    run["convert"].update(countLabeled(path("training.labeled")))
+    run["featurize"] = runStage([sys.executable,os.path.join(SCRIPT_DIR,"crf_features.py"),"--input",path("training.labeled"),
+                                 "--output",path("training.feats"),"--templates",path("training.templates"),"--labeled",
+                                 "--featlist",featListFile],path("featurize.log"))
+    run["featurize"].update(countFeaturized(path("training.feats"),path("training.templates")))
+    run["learn"]     = runStage(learnCommand(crfLearn,learnFlags,path("training.templates"),path("training.feats"),path("crf.model"),numThreads),
+                                path("learn.log"))
+    run["learn"].update(countLearned(path("learn.log"),path("crf.model")))
+    return run
+
+def runStage (command,logFile):
+    """Runs a stage's command, with its output going to logFile; returns its wall time and peak resident memory, which
+       comes from the rusage of the process, and so is its own, not the benchmark's.  Raises an exception if it fails."""
+    startTime = time()
+    with open(logFile,"wb") as logstream:
+        process = subprocess.Popen(command,stdout=logstream,stderr=subprocess.STDOUT)
+        (pid,status,usage) = os.wait4(process.pid,0)
+        process.returncode = status
+    seconds = time() - startTime
+    if (status != 0):
+        raise RuntimeError(format("Failed (see %s): %s" % (logFile," ".join(command))))
+    # ru_maxrss is in kilobytes on Linux
+    return {"seconds": seconds, "peakMB": usage.ru_maxrss / 1024.0, "cpuSeconds": usage.ru_utime + usage.ru_stime}
+
+def countLabeled (filename):
+    """Returns the numbers of sentences, tokens and entities (runs of a label other than 'O') in labeled data."""
+    sentences = readSentences(filename)
+    entities  = 0
+    for sentence in sentences:
+        previous = "O"
+        for line in sentence:
+            label = line.split("\t")[-1]
+            if (label != "O" and (label != previous or label.startswith("B_"))):
+                entities += 1
+            previous = label
+    return {"sentences": len(sentences), "tokens": sum([len(sentence) for sentence in sentences]), "entities": entities}
+
+def countFeaturized (featFile,templateFile):
+    """Returns the number of feature columns per token, the numbers of unigram and bigram templates, and the size of the
+       feature matrix file."""
+    with open(featFile,"rb") as instream:
+        first = instream.readline().rstrip("\r\n")
+    with open(templateFile,"rb") as instream:
+        templates = [line.strip() for line in instream if line.strip() != "" and not line.startswith("#")]
+    return {"columns": len(first.split("\t")) - 2, "unigramTemplates": len([t for t in templates if t.startswith("U")]),
+            "bigramTemplates": len([t for t in templates if t.startswith("B")]), "featsBytes": os.path.getsize(featFile)}
+
+def countLearned (logFile,modelFile):
+    """Returns the number of features (weights) and iterations crf_learn reports in its log, and the size of the model."""
+    with open(logFile,"rb") as instream:
+        log = instream.read()
+    features = re.search(r'^Number of features:\s*(\d+)',log,re.M)
+    return {"features": int(features.group(1)) if features else None, "iterations": len(re.findall(r'^iter=',log,re.M)),
+            "modelBytes": os.path.getsize(modelFile)}
+
+def fitScaling (runs):
+    """Fits time and memory of each stage, and crf_learn's feature count, to a power of the number of forms, y = a * n^b,
+       by least squares on their logarithms; returns a dict from stage to the exponents and the estimates for --extrapolate
+       times the largest size.  An exponent near 1 is linear growth."""
+    if (len(set([run["forms"] for run in runs])) < 2):
+        return {}
+    target  = factor * runs[-1]["forms"]
+    scaling = dict()
+    for stage in STAGES:
+        scaling[stage] = dict()
+        for measure in ["seconds","peakMB"] + (["features"] if stage == "learn" else []):
+            points = [(run["forms"],run[stage][measure]) for run in runs if run[stage].get(measure)]
+            fit    = fitPowerLaw(points)
+            if (fit != None):
+                (a,b) = fit
+                scaling[stage][measure] = {"exponent": b, "estimate": a * target ** b, "forms": target}
+    return scaling
+
+def fitPowerLaw (points):
+    """Returns (a,b) such that y = a * x^b best fits the (x,y) points on a log-log scale, or None if that can't be done."""
+    points = [(math.log(x),math.log(y)) for (x,y) in points if x > 0 and y > 0]
+    if (len(set([x for (x,y) in points])) < 2):
+        return None
+    meanX = sum([x for (x,y) in points]) / len(points)
+    meanY = sum([y for (x,y) in points]) / len(points)
+    b     = sum([(x - meanX) * (y - meanY) for (x,y) in points]) / sum([(x - meanX) ** 2 for (x,y) in points])
+    return (math.exp(meanY - b * meanX),b)
+
+def printRuns (runs,scaling):
+    stderr.write("\n%7s %8s %-10s %9s %9s  %s\n" % ("forms","tokens","stage","seconds","peak MB","counts"))
+    for run in runs:
+        for stage in STAGES:
+            result = run[stage]
+            if (stage == "convert"):
+                counts = "%d sentences, %d entities" % (result["sentences"],result["entities"])
+            elif (stage == "featurize"):
+                counts = "%d columns, %d+%d templates, %.1f MB" % (result["columns"],result["unigramTemplates"],result["bigramTemplates"],
+                                                                   result["featsBytes"] / 1048576.0)
+            else:
+                counts = "%s features, %d iterations, %.1f MB model" % (result["features"],result["iterations"],result["modelBytes"] / 1048576.0)
+            stderr.write("%7d %8d %-10s %9.2f %9.1f  %s\n" % (run["forms"],run["tokens"],stage,result["seconds"],result["peakMB"],counts))
+    if (scaling):
+        stderr.write("\nGrowth with the number of forms (time ~ forms^exponent), and estimates for %d forms:\n\n" % (factor * runs[-1]["forms"]))
+        for stage in STAGES:
+            for measure,fit in sorted(scaling[stage].items()):
+                stderr.write("%-10s %-9s exponent %5.2f  estimate %12.1f\n" % (stage,measure,fit["exponent"],fit["estimate"]))
+
+# Call the 'main' function if we are being invoke in a script context.
+if (__name__ == "__main__"):
+    main()
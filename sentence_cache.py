@@ -0,0 +1,99 @@
+"""A cache of the labels a model gave whole sentences, used by tag_cached.py so that sentences seen before, such as the
+   boilerplate that ads repeat, are not featurized and decoded again.  This is a plain module, with no command line of
+   its own.
+
+   Sentences are keyed by a hash of their tokens and of a context: the model file, the feat-list, the word and phrase
+   lists it names, and anything else that changes the labels, like --monocase.  A changed model, feat-list or word list
+   gets a new context, so stale labels are never returned, and one cache file can hold the labels of several models."""
+
+import os
+import re
+import json
+import hashlib
+from collections import OrderedDict
+
+
+def fileDigest (filename):
+    """Returns the SHA-1 of a file's contents, as hex."""
+    digest = hashlib.sha1()
+    with open(filename,"rb") as instream:
+        for block in iter(lambda: instream.read(1 << 20),""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def contextKey (files,options):
+    """Returns the context key for the contents of a list of files, e.g. the model and feat-list, and a list of option
+       strings.  Files that are None are left out."""
+    parts = [fileDigest(filename) for filename in files if filename != None] + list(options)
+    return hashlib.sha1("\n".join(parts)).hexdigest()
+
+def gazetteerFiles (featListFile):
+    """Returns the files named by the 'defwordlist' and 'defphraselist' lines of a feat-list, as crf_features.py reads
+       them: their contents change the features as much as the feat-list's own do."""
+    files = []
+    with open(featListFile,"r") as instream:
+        for line in instream:
+            tokens = line.split()
+            if (len(tokens) >= 3 and re.match(r'(?i)def(word|phrase)list$',tokens[0])):
+                files += tokens[2].split(",")
+    return files
+
+def sentenceKey (context,tokens):
+    """Returns the cache key of a sentence, a list of unicode tokens, in a context."""
+    return hashlib.sha1(context + "\n" + "\n".join(tokens).encode("utf-8")).hexdigest()
+
+
+class SentenceCache(object):
+    """A map from sentence keys to label sequences, holding at most maxEntries of them and evicting the least recently
+       used, optionally loaded from and saved to a file.  Counts its lookups, hits and evictions."""
+    def __init__ (self,maxEntries,filename=None):
+        self.maxEntries = maxEntries
+        self.filename   = filename
+        self.entries    = OrderedDict()  # Key -> tuple of labels, least recently used first.
+        self.labels     = dict()         # Label -> itself, so that each label string is kept once.
+        self.lookups    = 0
+        self.hits       = 0
+        self.evictions  = 0
+        self.loaded     = 0
+        if (filename != None and os.path.exists(filename)):
+            self.load()
+
+    def get (self,key):
+        """Returns the labels cached for a key, making it the most recently used, or None."""
+        self.lookups += 1
+        labels = self.entries.pop(key,None)
+        if (labels != None):
+            self.entries[key] = labels
+            self.hits += 1
+        return labels
+
+    def put (self,key,labels):
+        """Caches the labels for a key, evicting the least recently used entries if there are more than maxEntries."""
+        self.entries.pop(key,None)
+        self.entries[key] = tuple([self.labels.setdefault(label,label) for label in labels])
+        while (len(self.entries) > self.maxEntries):
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def load (self):
+        """Reads the entries of the cache file, one JSON [key,labels] pair per line, least recently used first."""
+        with open(self.filename,"rb") as instream:
+            for line in instream:
+                (key,labels) = json.loads(line)
+                self.put(str(key),labels)
+                self.loaded += 1
+        self.evictions = 0
+
+    def save (self):
+        """Writes the cache file, by way of a temporary file, so that a reader never sees half of it."""
+        temporary = self.filename + ".tmp"
+        with open(temporary,"wb") as outstream:
+            for key,labels in self.entries.iteritems():
+                outstream.write(json.dumps([key,labels]))
+                outstream.write("\n")
+        os.rename(temporary,self.filename)
+
+    def stats (self):
+        return {"entries": len(self.entries), "maxEntries": self.maxEntries, "loaded": self.loaded, "lookups": self.lookups,
+                "hits": self.hits, "misses": self.lookups - self.hits, "evictions": self.evictions,
+                "hitRate": float(self.hits) / self.lookups if self.lookups else 0.0}
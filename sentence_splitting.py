@@ -0,0 +1,82 @@
+"""Functions for splitting very long token sequences into pieces of bounded length, used by json_to_name_annotations.py
+   and crf_features.py.  This is a plain module, with no command line of its own."""
+
+import unicodedata
+
+# Tokens after which a split is most natural, tried before other punctuation.
+
+SENTENCE_END = set(". ! ? ; ...".split())
+
+
+def findSplitPoints (tokens,maxLength,spans=()):
+    """Takes a list of tokens, a maximum piece length and a list of (start,end) entity spans, end inclusive. Returns the
+       sorted list of indices at which to split the tokens so that no piece is longer than maxLength, and no split falls
+       inside a span.  A split is made after a sentence-ending token in the back half of the piece if there is one,
+       otherwise after any punctuation token there, otherwise as late as possible, but leaving at least half of maxLength
+       tokens after it.  Punctuation early in a piece is passed over, so that no piece is cut down to a token or two and
+       loses the context windowed templates look at.  If a span leaves no place to split within maxLength, the piece is
+       extended to the end of the span."""
+    if (maxLength < 1):
+        raise RuntimeError(format("Maximum piece length must be positive: %d" % maxLength))
+    blocked = set()
+    for (start,end) in spans:
+        blocked.update(range(start+1,end+1))
+    half   = (maxLength + 1) // 2
+    splits = []
+    start  = 0
+    while (len(tokens) - start > maxLength):
+        allowed = [b for b in range(min(start+maxLength,len(tokens)-half),start,-1) if b not in blocked]
+        split   = None
+        for test in (isSentenceEnd,isPunctuation):
+            for b in allowed:
+                if (b - start >= half and test(tokens[b-1])):
+                    split = b
+                    break
+            if (split is not None):
+                break
+        if (split is None and allowed):
+            split = allowed[0]
+        if (split is None):
+            split = start + maxLength + 1
+            while (split in blocked):
+                split += 1
+            if (split >= len(tokens)):
+                break
+        splits.append(split)
+        start = split
+    return splits
+
+def splitAt (items,splits):
+    """Takes a list and split indices as returned by findSplitPoints; returns the list of pieces."""
+    pieces = []
+    start  = 0
+    for split in splits + [len(items)]:
+        pieces.append(items[start:split])
+        start = split
+    return pieces
+
+def labelSpans (labels):
+    """Takes a list of labels, either IO like 'hairType' or IOB like 'B_hairType', with 'O' for no entity. Returns the
+       (start,end) spans, end inclusive, of the runs of the same entity type, a 'B_' label always starting a new run."""
+    spans = []
+    start = None
+    prev  = "O"
+    for i,label in enumerate(labels + ["O"]):
+        entityType = label[2:] if (label.startswith("B_") or label.startswith("I_")) else label
+        if (start is not None and (entityType != prev or label.startswith("B_"))):
+            spans.append((start,i-1))
+            start = None
+        if (start is None and entityType != "O"):
+            start = i
+        prev = entityType
+    return spans
+
+def isSentenceEnd (token):
+    return token in SENTENCE_END
+
+def isPunctuation (token):
+    """Returns true if every character of the token is punctuation."""
+    for char in unicode(token):
+        if (not unicodedata.category(char).startswith("P")):
+            return False
+    return token != ""
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+import codecs
+from sys import stdin,stdout
+from argparse import ArgumentParser
+
+scriptArgs = ArgumentParser(description="Rejoins the pieces of sentences that crf_features.py split with --maxlength, in tagged output from crf_test or crf_decode.py")
+
+scriptArgs.add_argument('--input',help="Optional tagged input file, one token per line, with a blank line after each piece. Reads from stdin if no argument provided.")
+scriptArgs.add_argument('--output',help="Optional output file, with a blank line after each original sentence. Writes to stdout if no argument provided.")
+scriptArgs.add_argument('--piecemap',help="Required piece map file written by crf_features.py --piecemap for the same data.",required=True)
+
+argValues = vars(scriptArgs.parse_args())
+
+
+# Command line arguments
+
+inputFile    = argValues["input"]
+outputFile   = argValues["output"]
+pieceMapFile = argValues["piecemap"]
+
+
+########################################################################################################################################
+
+
+def main ():
+    """The function that is called in a command line context. """
+    nonOverlapping([inputFile,pieceMapFile],[outputFile])
+    instream  = codecs.open(inputFile,encoding="utf-8",mode="rb") if inputFile != None else stdin
+    outstream = codecs.open(outputFile,encoding="utf-8",mode="wb") if outputFile != None else stdout
+    with open(pieceMapFile,"r") as mapstream:
+        pieces = [readPieceMapLine(line) for line in mapstream if line.strip() != ""]
+    stitchPieces(readSentences(instream),pieces,outstream)
+    if (inputFile != None):
+        instream.close()
+    if (outputFile != None):
+        outstream.close()
+
+def stitchPieces (sentences,pieces,outstream):
+    """Takes the tagged pieces, as lists of lines, and the corresponding (sentence number, token offset) pairs from the
+       piece map.  Writes out the lines of consecutive pieces of the same sentence as one sentence, checking as it goes that
+       each piece starts at the offset where the previous one ended."""
+    current = None
+    length  = 0
+    count   = 0
+    for sentence in sentences:
+        if (count >= len(pieces)):
+            raise RuntimeError(format("More sentences in the input than the %d pieces in the piece map" % len(pieces)))
+        (sentNum,offset) = pieces[count]
+        count += 1
+        if (sentNum != current):
+            if (current is not None):
+                outstream.write("\n")
+            current = sentNum
+            length  = 0
+        if (offset != length):
+            raise RuntimeError(format("Piece %d of sentence %d starts at token %d, but the pieces before it have %d tokens" % (count,sentNum,offset,length)))
+        for line in sentence:
+            outstream.write(line)
+            outstream.write("\n")
+        length += len(sentence)
+    if (current is not None):
+        outstream.write("\n")
+    if (count != len(pieces)):
+        raise RuntimeError(format("Input has %d sentences, but the piece map has %d pieces" % (count,len(pieces))))
+
+def readPieceMapLine (line):
+    fields = line.split("\t")
+    return (int(fields[0]),int(fields[1]))
+
+def readSentences (instream):
+    """Yields the sentences of the stream, each as the list of its lines.  Sentences are terminated by a blank line."""
+    sentence = []
+    for line in instream:
+        line = line.rstrip("\r\n")
+        if (line.strip() == ""):
+            yield sentence
+            sentence = []
+        else:
+            sentence.append(line)
+    if (sentence):
+        yield sentence
+
+def nonOverlapping (files1, files2):
+    """Takes two lists of files; raises an exception if they overlap."""
+    for file1 in files1:
+        for file2 in files2:
+            if (file1 != None and file2 != None and file1 == file2):
+                raise RuntimeError(format("Can't overwrite %s" % file1))
+
+# Call the 'main' function if we are being invoke in a script context.
+if (__name__ == "__main__"):
+    main()
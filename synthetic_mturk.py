@@ -0,0 +1,75 @@
+"""Generation of synthetic DIG MTurk JSON, in the form json_to_name_annotations.py reads, for load tests and benchmarks.
+   This is a plain module, with no command line of its own.  The ads are made of filler words with hair colors, eye
+   colors and names mixed in, annotated as hairType, eyeColor and name, so that a model trained on them learns something.
+   Ethnicities and ages can be mixed in as well, and entities can be several tokens long, as many are in real ads."""
+
+FILLER = "the a nice girl with long hair and call me now in town sweet sexy new fun real text for sweet , . ! :) 100% hh".split()
+HAIR   = "blonde brunette red black auburn platinum".split()
+EYES   = "blue green brown hazel grey".split()
+NAMES  = "Jessica Amber Tiffany Candy Brooke Lexi Mia Sasha Destiny Jasmine".split()
+ETHNIC = "latina asian ebony white european italian russian".split()
+
+# Entities of more than one token, used for a multiWordFraction of the entities
+
+HAIR_PHRASES   = [phrase.split() for phrase in ["light brown","dirty blonde","jet black","strawberry blonde","long dark brown"]]
+EYES_PHRASES   = [phrase.split() for phrase in ["baby blue","light green","dark brown","blue green"]]
+NAMES_PHRASES  = [phrase.split() for phrase in ["Mia Rose","Lexi Lane","Candy Love","Amber Marie","Sasha Grey"]]
+ETHNIC_PHRASES = [phrase.split() for phrase in ["puerto rican","half asian","middle eastern","latina mix"]]
+AGE_PHRASES    = [phrase.split() for phrase in ["early 20s","mid 20s","late 20s","early 30s"]]
+
+# The name types, and the chance that an entity of each type starts at any point in an ad.  By default, ads only have
+# the first three.
+
+NAME_TYPES     = ["hairType","eyeColor","name"]
+ENTITY_RATES   = [("hairType",0.06),("eyeColor",0.06),("name",0.04),("ethnicity",0.04),("age",0.03)]
+ALL_NAME_TYPES = [nameType for (nameType,rate) in ENTITY_RATES]
+
+
+def makeForms (numForms,rng,minLength=5,maxLength=40,annotatedFraction=0.6,nameTypes=NAME_TYPES,multiWordFraction=0.0):
+    """Takes a number of forms and a random.Random; returns a list of that many forms, each a dict with 'allTokens' and
+       an 'annotationSet'.  About annotatedFraction of them are annotated; the rest have 'noAnnotations'.  The entities
+       are of the nameTypes, and about multiWordFraction of them are more than one token long."""
+    return [makeForm(rng,rng.randint(minLength,maxLength),rng.random() < annotatedFraction,nameTypes,multiWordFraction)
+            for n in range(numForms)]
+
+def makeForm (rng,length,annotated,nameTypes=NAME_TYPES,multiWordFraction=0.0):
+    """Returns a form of about the given number of tokens.  If annotated is false, the entities in it aren't annotated,
+       as happens when an MTurk worker finds nothing to mark."""
+    rates       = [(nameType,rate) for (nameType,rate) in ENTITY_RATES if nameType in nameTypes]
+    tokens      = []
+    annotations = dict()
+    while (len(tokens) < length):
+        r = rng.random()
+        for (nameType,rate) in rates:
+            if (r < rate):
+                addNamedEntity(tokens,annotations,nameType,rng,multiWordFraction)
+                break
+            r -= rate
+        else:
+            tokens.append(rng.choice(FILLER))
+    if (not annotated or not annotations):
+        annotations = {"noAnnotations": []}
+    return {"allTokens": tokens, "annotationSet": annotations}
+
+def addNamedEntity (tokens,annotations,nameType,rng,multiWordFraction):
+    """Adds an entity of the name type to an ad, with the words that usually go with it."""
+    multiWord = multiWordFraction > 0 and rng.random() < multiWordFraction
+    if (nameType == "hairType"):
+        addEntity(tokens,annotations,nameType,rng.choice(HAIR_PHRASES) if multiWord else [rng.choice(HAIR)],["hair"])
+    elif (nameType == "eyeColor"):
+        addEntity(tokens,annotations,nameType,rng.choice(EYES_PHRASES) if multiWord else [rng.choice(EYES)],["eyes"])
+    elif (nameType == "name"):
+        tokens.append(rng.choice(["I'm","ask","for"]))
+        addEntity(tokens,annotations,nameType,rng.choice(NAMES_PHRASES) if multiWord else [rng.choice(NAMES)],[])
+    elif (nameType == "ethnicity"):
+        addEntity(tokens,annotations,nameType,rng.choice(ETHNIC_PHRASES) if multiWord else [rng.choice(ETHNIC)],["girl"])
+    elif (nameType == "age"):
+        tokens.append(rng.choice(["age","I'm","only"]))
+        addEntity(tokens,annotations,nameType,rng.choice(AGE_PHRASES) if multiWord else [str(rng.randint(18,45))],["years","old"])
+    else:
+        raise RuntimeError(format("Unknown name type %s" % nameType))
+
+def addEntity (tokens,annotations,labelType,entityTokens,followingTokens):
+    annotations.setdefault(labelType,[]).append({"start": str(len(tokens)), "annotatedTokens": entityTokens})
+    tokens.extend(entityTokens)
+    tokens.extend(followingTokens)
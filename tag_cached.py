@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+import os
+import io
+import sys
+import json
+import codecs
+import shutil
+import tempfile
+import subprocess
+from sys import stdin,stdout,stderr
+from time import time
+from collections import OrderedDict
+from argparse import ArgumentParser
+from crf_runs import readSentences,writeSentences
+from sentence_cache import SentenceCache,contextKey,sentenceKey,gazetteerFiles
+
+scriptArgs = ArgumentParser(description="Tags sentences of tokens with a trained model, running crf_features.py and crf_test (or crf_decode.py) only on sentences it has not tagged before: the labels of every sentence tagged are kept in a cache, bounded in size and optionally kept in a file between runs, keyed by the sentence's tokens, the model, the feat-list and its word and phrase lists, and --monocase.")
+
+scriptArgs.add_argument('--input',help="Optional input file, with one token per line, and a blank line after each sentence, as crf_features.py reads it. Additional tab-separated fields may follow the token; they are passed through. Reads from stdin if no argument provided.")
+scriptArgs.add_argument('--output',help="Optional output file with lines of the form '<input line><tab><label>', and a blank line after each sentence. Writes to stdout if no argument provided.")
+scriptArgs.add_argument('--model',help="Required model file: a binary model for crf_test, or with --decoder crf_decode, a text model.",required=True)
+scriptArgs.add_argument('--featlist',help="Required feat-list file the model was trained with.",required=True)
+scriptArgs.add_argument('--extrafeatdefs',help="File of additional 'defFeat' feature definitions the model was trained with, if any.")
+scriptArgs.add_argument('--monocase',action='store_true',help="Pass --monocase to crf_features.py.")
+scriptArgs.add_argument('--decoder',default="crf_test",choices=["crf_test","crf_decode"],help="What tags the sentences not in the cache. Default is crf_test.")
+scriptArgs.add_argument('--cache',help="Optional cache file. It is read, if it exists, at the start, and written at the end, so that the labels are kept between runs.")
+scriptArgs.add_argument('--cachesize',type=int,default=100000,help="Largest number of sentences kept in the cache; the least recently used go first. Default is 100000.")
+scriptArgs.add_argument('--batchsize',type=int,default=5000,help="Number of sentences read before those not in the cache are featurized and tagged together. Default is 5000.")
+scriptArgs.add_argument('--crfbin',default="",help="Optional directory containing crf_test. It is looked for on the PATH if not given.")
+scriptArgs.add_argument('--stats',help="Optional output file for the cache's counters (lookups, hits, misses, hit rate, evictions) and the run's times, as JSON.")
+scriptArgs.add_argument('--verbose',action='store_true',help="Print the counters and times to stderr.")
+
+argValues = vars(scriptArgs.parse_args())
+
+
+# Command line arguments
+
+inputFile    = argValues["input"]
+outputFile   = argValues["output"]
+modelFile    = argValues["model"]
+featListFile = argValues["featlist"]
+featDefsFile = argValues["extrafeatdefs"]
+monocase     = argValues["monocase"]
+decoder      = argValues["decoder"]
+cacheFile    = argValues["cache"]
+cacheSize    = argValues["cachesize"]
+batchSize    = argValues["batchsize"]
+crfTest      = os.path.join(argValues["crfbin"],"crf_test")
+statsFile    = argValues["stats"]
+verbose      = argValues["verbose"]
+
+# Where this checkout is, for running crf_features.py and crf_decode.py
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+########################################################################################################################################
+
+
+def main ():
+    """The function that is called in a command line context. """
+    nonOverlapping([inputFile,modelFile,featListFile,featDefsFile,cacheFile],[outputFile,statsFile])
+    startTime = time()
+    context   = contextKey([modelFile,featListFile,featDefsFile] + gazetteerFiles(featListFile),["monocase=%s" % monocase])
+    cache     = SentenceCache(cacheSize,cacheFile)
+    stats     = {"sentences": 0, "tokens": 0, "repeats": 0, "tagged": 0, "taggedTokens": 0, "featurizeSeconds": 0.0, "decodeSeconds": 0.0}
+    instream  = io.open(inputFile,encoding="utf-8",mode="r") if inputFile != None else codecs.getreader("utf-8")(stdin)
+    outstream = codecs.open(outputFile,encoding="utf-8",mode="wb") if outputFile != None else codecs.getwriter("utf-8")(stdout)
+    workDir   = tempfile.mkdtemp(prefix="tag")
+    try:
+        for batch in readBatches(instream):
+            for sentence,labels in zip(batch,labelBatch(batch,context,cache,workDir,stats)):
+                for line,label in zip(sentence,labels):
+                    outstream.write(u"%s\t%s\n" % (line,label))
+                outstream.write(u"\n")
+    finally:
+        shutil.rmtree(workDir,ignore_errors=True)
+    if (inputFile != None):
+        instream.close()
+    if (outputFile != None):
+        outstream.close()
+    if (cacheFile):
+        cache.save()
+    stats["seconds"] = time() - startTime
+    stats["cache"]   = cache.stats()
+    if (verbose):
+        printStats(stats)
+    if (statsFile):
+        with open(statsFile,"wb") as outstream:
+            json.dump(stats,outstream,indent=1,sort_keys=True)
+
+def readBatches (instream):
+    """Yields lists of up to batchSize sentences, each sentence being the list of its lines."""
+    batch    = []
+    sentence = []
+    for line in instream:
+        line = line.strip()
+        if (line != ""):
+            sentence.append(line)
+        elif (sentence):
+            batch.append(sentence)
+            sentence = []
+            if (len(batch) >= batchSize):
+                yield batch
+                batch = []
+    if (sentence):
+        batch.append(sentence)
+    if (batch):
+        yield batch
+
+def labelBatch (batch,context,cache,workDir,stats):
+    """Returns the labels of each sentence of a batch: from the cache if it has them, and otherwise from tagging the
+       sentences, each distinct one once, and caching their labels.  Repeats of a sentence already missed in the batch
+       are not looked up again, but counted in stats["repeats"], so that the cache's misses are what was tagged."""
+    keys   = [sentenceKey(context,[line.split("\t")[0] for line in sentence]) for sentence in batch]
+    found  = []
+    misses = OrderedDict()
+    for key,sentence in zip(keys,batch):
+        if (key in misses):
+            found.append(None)
+            stats["repeats"] += 1
+            continue
+        labels = cache.get(key)
+        if (labels == None):
+            misses[key] = sentence
+        found.append(labels)
+    tagged = dict()
+    if (misses):
+        for key,labels in zip(misses.keys(),tagSentences(misses.values(),workDir,stats)):
+            cache.put(key,labels)
+            tagged[key] = labels
+    stats["sentences"] += len(batch)
+    stats["tokens"]    += sum([len(sentence) for sentence in batch])
+    return [labels if labels != None else tagged[key] for key,labels in zip(keys,found)]
+
+def tagSentences (sentences,workDir,stats):
+    """Featurizes the tokens of the sentences with crf_features.py and tags them with the decoder; returns the list of
+       labels of each sentence."""
+    tokenFile  = writeSentences([[line.split("\t")[0] for line in sentence] for sentence in sentences],os.path.join(workDir,"tokens"))
+    featFile   = os.path.join(workDir,"tokens.feats")
+    taggedFile = os.path.join(workDir,"tokens.tagged")
+    command    = [sys.executable,os.path.join(SCRIPT_DIR,"crf_features.py"),"--input",tokenFile,"--output",featFile,"--featlist",featListFile]
+    if (featDefsFile):
+        command += ["--extrafeatdefs",featDefsFile]
+    if (monocase):
+        command += ["--monocase"]
+    startTime = time()
+    run(command)
+    stats["featurizeSeconds"] += time() - startTime
+    if (decoder == "crf_decode"):
+        command = [sys.executable,os.path.join(SCRIPT_DIR,"crf_decode.py"),"--model",modelFile,"--input",featFile,"--output",taggedFile]
+    else:
+        command = [crfTest,"-m",modelFile,featFile]
+    startTime = time()
+    run(command,taggedFile if decoder == "crf_test" else None)
+    stats["decodeSeconds"] += time() - startTime
+    labels = [[line.split("\t")[-1] for line in sentence] for sentence in readSentences(taggedFile)]
+    if ([len(l) for l in labels] != [len(sentence) for sentence in sentences]):
+        raise RuntimeError(format("%s did not tag the %d sentences given to it" % (decoder,len(sentences))))
+    stats["tagged"]       += len(sentences)
+    stats["taggedTokens"] += sum([len(sentence) for sentence in sentences])
+    return labels
+
+def run (command,outputFile=None):
+    """Runs a command, with its stdout going to outputFile if one is given; raises an exception if it fails."""
+    outstream = open(outputFile,"wb") if outputFile != None else None
+    try:
+        if (subprocess.call(command,stdout=outstream) != 0):
+            raise RuntimeError(format("Failed: %s" % " ".join(command)))
+    finally:
+        if (outstream):
+            outstream.close()
+
+def printStats (stats):
+    cache = stats["cache"]
+    stderr.write("%d sentences (%d tokens) in %.2fs: %d tagged (%d tokens), %d repeats of those in their batch, featurizing %.2fs, decoding %.2fs\n" %
+                 (stats["sentences"],stats["tokens"],stats["seconds"],stats["tagged"],stats["taggedTokens"],stats["repeats"],
+                  stats["featurizeSeconds"],stats["decodeSeconds"]))
+    stderr.write("Cache: %d lookups, %d hits (%.1f%%), %d misses, %d evictions, %d of %d entries, %d loaded\n" %
+                 (cache["lookups"],cache["hits"],100 * cache["hitRate"],cache["misses"],cache["evictions"],cache["entries"],
+                  cache["maxEntries"],cache["loaded"]))
+
+
+def nonOverlapping (files1, files2):
+    """Takes two lists of files; raises an exception if they overlap."""
+    for file1 in files1:
+        for file2 in files2:
+            if (file1 != None and file2 != None and file1 == file2):
+                raise RuntimeError(format("Can't overwrite %s" % file1))
+
+# Call the 'main' function if we are being invoke in a script context.
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+import re
+import json
+import numpy
+from sys import stdout
+from argparse import ArgumentParser
+import crf_text_model
+
+scriptArgs = ArgumentParser(description="Reports, for each template id (U00, U01, ...) of a trained CRF++ text model, and so for each feat-list entry, the number of features, how many of them the training left active, their share of the total weight mass, and their estimated share of the memory crf_learn and crf_test use. Entries with a large memory share and a small weight share are candidates for dropping.")
+
+scriptArgs.add_argument('--model',help="Required CRF++ text model file, i.e. the 'crf.model.txt' written by 'crf_learn -t'.",required=True)
+scriptArgs.add_argument('--featlist',help="Optional feat-list the model's templates were made from, so that each template id is reported with its feat-list entry.")
+scriptArgs.add_argument('--positions',action='store_true',help="Report each position of an entry's window separately, e.g. U18-2, U18-1, U18+0, ..., to see whether a window could be narrower.")
+scriptArgs.add_argument('--algorithm',default="CRF-L2",choices=["CRF-L2","CRF-L1","MIRA"],help="crf_learn algorithm the model was trained with, for the training memory estimate. Default is CRF-L2.")
+scriptArgs.add_argument('--activethreshold',type=float,help="A feature is counted as active if any of its weights is larger than this in absolute value. Default is 0 for CRF-L1, which leaves the weights of unused features exactly 0, and for CRF-L2 and MIRA, which leave nearly all weights nonzero, 1%% of the model's largest absolute weight.")
+scriptArgs.add_argument('--sort',default="value",choices=["id","mass","memory","value"],help="Order of the report: by template id, weight mass, memory, or weight share per memory share, lowest first. Default is value.")
+scriptArgs.add_argument('--report',help="Optional output file for the report as JSON.")
+
+argValues = vars(scriptArgs.parse_args())
+
+
+# Command line arguments
+
+modelFile    = argValues["model"]
+featListFile = argValues["featlist"]
+positions    = argValues["positions"]
+algorithm    = argValues["algorithm"]
+threshold    = argValues["activethreshold"]
+sortBy       = argValues["sort"]
+reportFile   = argValues["report"]
+
+# Rough per-item sizes in bytes, as in estimate_features.py: the doubles crf_learn keeps per weight for each algorithm
+# (with one thread), and a std::map node per distinct feature string while it builds its dictionary.  crf_test keeps a
+# double per weight, and the feature strings in a double-array trie.
+
+WEIGHT_DOUBLES = {"CRF-L2": 1 + 13, "CRF-L1": 1 + 14, "MIRA": 1}
+MAP_NODE_BYTES = 80
+
+# Default --activethreshold, as a fraction of the largest absolute weight, for algorithms other than CRF-L1
+
+ACTIVE_FRACTION = 0.01
+
+# The lines of a feat-list that are not entries, as readFeatureListFile in crf_features.py sees them
+
+NON_ENTRY = re.compile(r'^(#|defwordlist|defphraselist|options:)',re.I)
+
+
+########################################################################################################################################
+
+
+def main ():
+    """The function that is called in a command line context. """
+    model   = crf_text_model.readTextModel(modelFile)
+    groups  = groupTemplates(model.templates)
+    entries = matchFeatListEntries(readFeatListEntries(featListFile),model.templates) if featListFile else {}
+    active  = activeThreshold(model)
+    rows    = scoreTemplates(model,groups,entries,active)
+    sortRows(rows)
+    printRows(rows,active)
+    if (reportFile):
+        with open(reportFile,"wb") as outstream:
+            json.dump({"model": modelFile, "featlist": featListFile, "algorithm": algorithm, "labels": len(model.labels),
+                       "activeThreshold": active, "templates": rows},outstream,indent=1,sort_keys=True)
+
+def activeThreshold (model):
+    """Returns the absolute weight a feature has to exceed to be active: --activethreshold if given, otherwise 0 for
+       CRF-L1 and ACTIVE_FRACTION of the largest absolute weight for the others.  CRF++ text models don't record the
+       algorithm, so it is --algorithm's."""
+    if (threshold != None):
+        return threshold
+    if (algorithm == "CRF-L1" or len(model.weights) == 0):
+        return 0.0
+    return ACTIVE_FRACTION * float(numpy.abs(model.weights).max())
+
+def templateId (string):
+    """Returns the template id of a template line or dictionary feature, e.g. 'U04' for 'U04-1:%x[-1,3]' or 'U04-1:cvc'."""
+    return re.match(r'^([UB]\d*)',string).group(1)
+
+def groupKey (string):
+    """Returns what a template line or dictionary feature is reported under: its template id, or with --positions, the
+       part before the ':', e.g. 'U04-1'."""
+    return string.split(":",1)[0] if positions else templateId(string)
+
+def groupTemplates (templates):
+    """Returns the template lines grouped by groupKey, as an ordered list of (key,lines) pairs."""
+    groups = []
+    for line in templates:
+        tid = groupKey(line)
+        if (not groups or groups[-1][0] != tid):
+            groups.append((tid,[]))
+        groups[-1][1].append(line)
+    return groups
+
+def readFeatListEntries (filename):
+    """Returns the unigram and bigram entries of a feat-list, as lists of entry strings, in the order writeTemplateFile in
+       crf_features.py numbers them: the entries in file order, then a simple entry for each component of a compound
+       entry that has none of its own.  Entries are matched with templates by position, so this follows crf_features'
+       reading of the file rather than parsing the entries in full."""
+    entries = []
+    with open(filename,"r") as instream:
+        for line in instream:
+            line = line.strip()
+            if (line != "" and not NON_ENTRY.match(line)):
+                entries.append(line)
+    singles = set()
+    for entry in entries:
+        refs = entryRefs(entry)
+        if (len(refs) == 1):
+            singles.add(refs[0])
+    for entry in list(entries):
+        for ref in entryRefs(entry):
+            if (ref not in singles):
+                singles.add(ref)
+                entries.append(ref)
+    unigrams = [entry for entry in entries if not isBigram(entry)]
+    bigrams  = [entry for entry in entries if isBigram(entry)]
+    return (unigrams,bigrams)
+
+def entryRefs (entry):
+    """Returns the names of the features an entry string refers to, with any relative position like '-1' removed.  A
+       hashed entry refers to a single feature of its own, the hashed conjunction."""
+    refString = entry.split()[0]
+    if (re.search(r'-hash',entry)):
+        return [entry]
+    if (re.match(r'^[UB](:|$)',refString)):
+        refString = refString[2:]
+    return [re.sub(r'[+-]\d+$','',ref) for ref in refString.split("/") if ref != ""]
+
+def isBigram (entry):
+    return re.match(r'^B(:|$)',entry.split()[0]) != None
+
+def matchFeatListEntries (featListEntries,templates):
+    """Takes the unigram and bigram entries of a feat-list and the model's template lines; returns a dict from template
+       id to entry string.  Raises an exception if the feat-list can't be the one the templates were made from."""
+    (unigrams,bigrams) = featListEntries
+    ids = dict()
+    for line in templates:
+        # A template id is U or B and the index of the entry among the unigram or bigram entries; a bare 'U' or 'B'
+        # template, from an entry with no feature references, has no index, and is matched by its place in the model.
+        tid = templateId(line)
+        if (tid not in ids.get(tid[0],[])):
+            ids.setdefault(tid[0],[]).append(tid)
+    entries = dict()
+    for (kind,featEntries) in [("U",unigrams),("B",bigrams)]:
+        tids = ids.get(kind,[])
+        if (len(tids) != len(featEntries)):
+            raise RuntimeError(format("Feat-list %s has %d %s entries, but model %s has %d %s template ids" %
+                                      (featListFile,len(featEntries),kind,modelFile,len(tids),kind)))
+        for tid,entry in zip(tids,featEntries):
+            entries[tid] = entry
+    return entries
+
+def scoreTemplates (model,groups,entries,active):
+    """Returns a list of dicts, one per template id, with its features, active features (those with a weight above
+       'active' in absolute value), weights, weight mass and memory estimates, and their shares of the model's totals."""
+    numLabels = len(model.labels)
+    weights   = numpy.abs(model.weights)
+    massSums  = numpy.concatenate([[0.0],numpy.cumsum(weights)])
+    liveSums  = numpy.concatenate([[0],numpy.cumsum(weights > active)])
+    rows      = dict([(key,{"id": key, "templates": lines, "entry": entries.get(templateId(key)), "features": 0, "activeFeatures": 0,
+                            "weights": 0, "mass": 0.0, "maxWeight": 0.0, "stringBytes": 0}) for (key,lines) in groups])
+    for feature,fid in model.featureIds.iteritems():
+        row   = rows[groupKey(feature)]
+        width = crf_text_model.featureWidth(feature,numLabels)
+        mass  = massSums[fid + width] - massSums[fid]
+        row["features"]    += 1
+        row["weights"]     += width
+        row["mass"]        += mass
+        row["stringBytes"] += len(feature.encode("utf-8")) + 1
+        if (liveSums[fid + width] > liveSums[fid]):
+            row["activeFeatures"] += 1
+            row["maxWeight"]       = max(row["maxWeight"],weights[fid:fid + width].max())
+    rows = [rows[key] for (key,lines) in groups]
+    for row in rows:
+        row["trainingBytes"] = row["weights"] * 8 * WEIGHT_DOUBLES[algorithm] + row["features"] * MAP_NODE_BYTES + row["stringBytes"]
+        row["taggingBytes"]  = row["weights"] * 8 + row["stringBytes"]
+    totalMass  = max(sum([row["mass"] for row in rows]),1e-300)
+    totalBytes = max(sum([row["trainingBytes"] for row in rows]),1)
+    for row in rows:
+        row["massShare"]   = row["mass"] / totalMass
+        row["memoryShare"] = float(row["trainingBytes"]) / totalBytes
+        row["value"]       = row["massShare"] / row["memoryShare"] if row["memoryShare"] > 0 else None
+    return rows
+
+def sortRows (rows):
+    if (sortBy == "mass"):
+        rows.sort(key=lambda row: row["mass"])
+    elif (sortBy == "memory"):
+        rows.sort(key=lambda row: row["trainingBytes"],reverse=True)
+    elif (sortBy == "value"):
+        rows.sort(key=lambda row: row["value"] if row["value"] != None else float("inf"))
+
+def printRows (rows,active):
+    """Prints the report as a table.  'value' is the share of the weight mass over the share of the memory: below 1, an
+       entry costs more than it contributes."""
+    stdout.write("%-7s %9s %9s %8s %7s %9s %7s %7s  %s\n" % ("id","features","active","mass %","max |w|","train MB","mem %","value","entry"))
+    for row in rows:
+        describe = row["entry"] or " ".join(row["templates"])
+        stdout.write("%-7s %9d %9d %7.2f%% %7.3f %9.2f %6.2f%% %7.2f  %s\n" %
+                     (row["id"],row["features"],row["activeFeatures"],100 * row["massShare"],row["maxWeight"],
+                      row["trainingBytes"] / 1048576.0,100 * row["memoryShare"],row["value"] or 0.0,describe))
+    stdout.write("\nTotal: %d features, %d active (|w| > %g), %.1f MB to train (%s), %.1f MB to tag\n" %
+                 (sum([row["features"] for row in rows]),sum([row["activeFeatures"] for row in rows]),active,
+                  sum([row["trainingBytes"] for row in rows]) / 1048576.0,algorithm,sum([row["taggingBytes"] for row in rows]) / 1048576.0))
+
+# Call the 'main' function if we are being invoke in a script context.
+if (__name__ == "__main__"):
+    main()
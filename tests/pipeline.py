@@ -0,0 +1,69 @@
+"""Training a small model on synthetic MTurk JSON, as train_model.sh does, for the tests to decode and bundle.  This is a
+   plain module, with no command line of its own.
+
+   crf_learn and crf_test are looked for in $CRFBIN, and then on the PATH; tests that need them are skipped if they
+   aren't found."""
+
+import os
+import sys
+import json
+import random
+import subprocess
+
+TESTS_DIR  = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_DIR = os.path.dirname(TESTS_DIR)
+
+sys.path.insert(0,SCRIPT_DIR)
+
+from synthetic_mturk import makeForms,ALL_NAME_TYPES
+
+
+def crfBin ():
+    """Returns the directory with crf_learn and crf_test in it: $CRFBIN if set, otherwise the first one on the PATH that
+       has both.  Returns None if there is none."""
+    directories = [os.environ["CRFBIN"]] if os.environ.get("CRFBIN") else os.environ.get("PATH","").split(os.pathsep)
+    for directory in directories:
+        if (all([os.access(os.path.join(directory,name),os.X_OK) for name in ["crf_learn","crf_test"]])):
+            return directory
+    return None
+
+def script (name):
+    return os.path.join(SCRIPT_DIR,name)
+
+def run (command,outputFile=None):
+    """Runs a command, with its stdout going to outputFile if one is given; raises an exception, with the command's
+       output, if it fails."""
+    outstream = open(outputFile,"wb") if outputFile != None else subprocess.PIPE
+    try:
+        process = subprocess.Popen(command,stdout=outstream,stderr=subprocess.PIPE)
+        (output,errors) = process.communicate()
+    finally:
+        if (outputFile != None):
+            outstream.close()
+    if (process.returncode != 0):
+        raise RuntimeError(format("Failed: %s\n%s" % (" ".join(command),errors)))
+    return output
+
+def trainModel (directory,numForms=300,seed=0):
+    """Makes numForms synthetic forms, and in the directory, converts and featurizes them with dig-crf.feat-list, trains
+       a model with crf_learn on the first two thirds, and tags the rest with crf_test.  Returns a dict of the files."""
+    files  = dict([(name,os.path.join(directory,filename)) for (name,filename) in
+                   [("trainJson","train.json"),("testJson","test.json"),("trainLabeled","train.labeled"),
+                    ("testLabeled","test.labeled"),("trainFeats","train.feats"),("testFeats","test.feats"),
+                    ("templates","train.templates"),("plan","train.plan"),("model","crf.model"),("textModel","crf.model.txt"),
+                    ("crfTest","test.crftest")]])
+    files["featList"] = script("dig-crf.feat-list")
+    forms  = makeForms(numForms,random.Random(seed),nameTypes=ALL_NAME_TYPES,multiWordFraction=0.25)
+    split  = numForms * 2 // 3
+    for (part,partForms) in [("train",forms[:split]),("test",forms[split:])]:
+        with open(files[part + "Json"],"wb") as outstream:
+            json.dump(partForms,outstream)
+        run([sys.executable,script("json_to_name_annotations.py"),"--inputs",files[part + "Json"],"--output",files[part + "Labeled"]])
+    run([sys.executable,script("crf_features.py"),"--input",files["trainLabeled"],"--output",files["trainFeats"],"--labeled",
+         "--featlist",files["featList"],"--templates",files["templates"],"--plan",files["plan"]])
+    run([sys.executable,script("crf_features.py"),"--input",files["testLabeled"],"--output",files["testFeats"],"--labeled",
+         "--featlist",files["featList"]])
+    crfDir = crfBin()
+    run([os.path.join(crfDir,"crf_learn"),"-t","-m","30","-p","1",files["templates"],files["trainFeats"],files["model"]])
+    run([os.path.join(crfDir,"crf_test"),"-m",files["model"],files["testFeats"]],files["crfTest"])
+    return files
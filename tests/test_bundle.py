@@ -0,0 +1,120 @@
+"""Checks that a model bundle gives back the model and feature plan it was written with, and that featurizing and decoding
+   from it agree with doing so from the feat-list and the text model.  Run from the checkout with
+   'python -m unittest discover -s tests'."""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import numpy
+from pipeline import crfBin,script,run,trainModel
+import crf_text_model
+import model_bundle
+
+
+def makeTextModel ():
+    """Returns a small TextModel, of two labels, a unigram and a bigram template, and four features, one of them not ASCII."""
+    model = crf_text_model.TextModel()
+    model.header     = [("version","100"),("cost-factor","1"),("maxid","10"),("xsize","2")]
+    model.labels     = ["O","hairType"]
+    model.templates  = ["U00:%x[0,1]","B"]
+    model.featureIds = {u"U00:blonde": 0, u"U00:caf\u00e9": 2, u"B": 4, u"U00:red": 8}
+    model.weights    = numpy.arange(10,dtype=numpy.float64) / 7.0 - 1.0
+    return model
+
+
+class BundleRoundTripTest(unittest.TestCase):
+
+    def setUp (self):
+        self.directory = tempfile.mkdtemp(prefix="bundletest")
+
+    def tearDown (self):
+        shutil.rmtree(self.directory,ignore_errors=True)
+
+    def testRoundTrip (self):
+        model    = makeTextModel()
+        plan     = {"featlist": "test.feat-list", "monocase": True, "columns": [{"name": "token"}], "gazetteers": [],
+                    "extraFeatDefs": None, "templates": ["U00:%x[0,1]","","B"]}
+        filename = os.path.join(self.directory,"test.bundle")
+        model_bundle.writeBundle(filename,model,plan)
+        self.assertTrue(model_bundle.isBundle(filename))
+        self.assertEqual(model_bundle.readBundleHeader(filename)["plan"],plan)
+        bundle = model_bundle.readBundle(filename)
+        self.assertEqual(bundle.plan,plan)
+        self.assertEqual(bundle.model.header,model.header)
+        self.assertEqual(bundle.model.labels,model.labels)
+        self.assertEqual(bundle.model.templates,model.templates)
+        self.assertEqual(bundle.model.featureIds,model.featureIds)
+        self.assertTrue(numpy.array_equal(bundle.model.weights,model.weights))
+        # Features not in the dictionary score from the labels^2 zeros after the weights.
+        self.assertEqual(len(bundle.weights),len(model.weights) + len(model.labels) ** 2)
+        self.assertFalse(bundle.weights[len(model.weights):].any())
+
+
+@unittest.skipUnless(crfBin(),"crf_learn and crf_test are not in $CRFBIN or on the PATH")
+class BundlePipelineTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass (cls):
+        cls.directory = tempfile.mkdtemp(prefix="bundletest")
+        cls.files     = trainModel(cls.directory)
+        cls.bundle    = os.path.join(cls.directory,"crf.bundle")
+        run([sys.executable,script("make_bundle.py"),"--model",cls.files["textModel"],"--plan",cls.files["plan"],"--output",cls.bundle])
+
+    @classmethod
+    def tearDownClass (cls):
+        shutil.rmtree(cls.directory,ignore_errors=True)
+
+    def read (self,filename):
+        with open(filename,"rb") as instream:
+            return instream.read()
+
+    def featurize (self,*args):
+        """Runs crf_features.py with the arguments on the labeled test sentences; returns what it writes."""
+        output = os.path.join(self.directory,"bundle.feats")
+        run([sys.executable,script("crf_features.py"),"--input",self.files["testLabeled"],"--output",output,"--labeled"] + list(args))
+        return self.read(output)
+
+    def testModel (self):
+        bundle = model_bundle.readBundle(self.bundle)
+        model  = crf_text_model.readTextModel(self.files["textModel"])
+        self.assertEqual(bundle.model.featureIds,model.featureIds)
+        self.assertTrue(numpy.array_equal(bundle.model.weights,model.weights))
+        with open(self.files["plan"],"rb") as instream:
+            self.assertEqual(bundle.plan,json.load(instream))
+
+    def testFeaturize (self):
+        self.assertEqual(self.featurize("--bundle",self.bundle),self.read(self.files["testFeats"]))
+
+    def testDecode (self):
+        output = os.path.join(self.directory,"bundle.decoded")
+        run([sys.executable,script("crf_decode.py"),"--model",self.bundle,"--input",self.files["testFeats"],"--output",output])
+        self.assertEqual(self.read(output),self.read(self.files["crfTest"]))
+
+    def testExtraFeatDefsNeedTrust (self):
+        # The bundle's copy of --extrafeatdefs is Python code, so it is only run when asked to.
+        featDefs = os.path.join(self.directory,"extra.py")
+        marker   = os.path.join(self.directory,"extra.ran")
+        with open(featDefs,"wb") as outstream:
+            outstream.write("defFeat('always-x',lambda token: 'x')\nopen(%r,'wb').close()\n" % marker)
+        bundle   = model_bundle.readBundle(self.bundle)
+        plan     = dict(bundle.plan)
+        plan["extraFeatDefs"] = {"file": featDefs, "source": self.read(featDefs)}
+        filename = os.path.join(self.directory,"extra.bundle")
+        model_bundle.writeBundle(filename,bundle.model,plan)
+        self.assertRaises(RuntimeError,self.featurize,"--bundle",filename)
+        self.assertFalse(os.path.exists(marker))
+        expected = self.read(self.files["testFeats"])
+        self.assertEqual(self.featurize("--bundle",filename,"--trustbundle"),expected)
+        self.assertTrue(os.path.exists(marker))
+        self.assertEqual(self.featurize("--bundle",filename,"--extrafeatdefs",featDefs),expected)
+        with open(featDefs,"ab") as outstream:
+            outstream.write("# changed\n")
+        self.assertRaises(RuntimeError,self.featurize,"--bundle",filename,"--extrafeatdefs",featDefs)
+
+
+# Call unittest's 'main' function if we are being invoke in a script context.
+if (__name__ == "__main__"):
+    unittest.main()
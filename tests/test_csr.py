@@ -0,0 +1,56 @@
+"""Checks the CSR matrix crf_features.py --csr writes against its text output.  Run from the checkout with
+   'python -m unittest discover -s tests'."""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import numpy
+from pipeline import script,run
+
+
+class CSRTest(unittest.TestCase):
+
+    def setUp (self):
+        self.directory = tempfile.mkdtemp(prefix="csrtest")
+
+    def tearDown (self):
+        shutil.rmtree(self.directory,ignore_errors=True)
+
+    def featurize (self,name,text):
+        """Featurizes labeled input text with dig-crf.feat-list, as text and as CSR; returns the text output and the CSR
+           directory."""
+        inputFile = os.path.join(self.directory,name + ".labeled")
+        output    = os.path.join(self.directory,name + ".feats")
+        csrDir    = os.path.join(self.directory,name + ".csr")
+        with open(inputFile,"wb") as outstream:
+            outstream.write(text)
+        run([sys.executable,script("crf_features.py"),"--input",inputFile,"--output",output,"--csr",csrDir,"--labeled",
+             "--featlist",script("dig-crf.feat-list")])
+        with open(output,"rb") as instream:
+            return (instream.read(),csrDir)
+
+    def load (self,csrDir,name):
+        return numpy.load(os.path.join(csrDir,name + ".npy")).tolist()
+
+    def testConsecutiveBlankLines (self):
+        # Two blank lines in a row make an empty sentence: a blank line of its own in the text output, and a sentence of
+        # no rows in the CSR matrix.  The rows are those of the same input without it.
+        (text,csrDir)    = self.featurize("blanks","hello\tO\nworld\tO\n\n\nfoo\tO\n\n")
+        (plain,plainDir) = self.featurize("plain","hello\tO\nworld\tO\n\nfoo\tO\n\n")
+        self.assertEqual(text.replace("\n\n\n","\n\n"),plain)
+        self.assertNotEqual(text,plain)
+        self.assertEqual(self.load(csrDir,"sentences"),[0,2,2,3])
+        for name in ["indptr","indices","data","labels","vocab","vocab_offsets"]:
+            self.assertEqual(self.load(csrDir,name),self.load(plainDir,name))
+        with open(os.path.join(csrDir,"meta.json"),"rb") as instream:
+            meta = json.load(instream)
+        self.assertEqual(meta["shape"][0],3)
+        self.assertEqual(meta["sentences"],3)
+
+
+# Call unittest's 'main' function if we are being invoke in a script context.
+if (__name__ == "__main__"):
+    unittest.main()
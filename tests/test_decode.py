@@ -0,0 +1,46 @@
+"""Checks that crf_decode.py tags exactly as crf_test does.  Run from the checkout with 'python -m unittest discover -s tests'."""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from pipeline import crfBin,script,run,trainModel
+
+
+@unittest.skipUnless(crfBin(),"crf_learn and crf_test are not in $CRFBIN or on the PATH")
+class DecodeTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass (cls):
+        cls.directory = tempfile.mkdtemp(prefix="decodetest")
+        cls.files     = trainModel(cls.directory)
+        with open(cls.files["crfTest"],"rb") as instream:
+            cls.expected = instream.read()
+
+    @classmethod
+    def tearDownClass (cls):
+        shutil.rmtree(cls.directory,ignore_errors=True)
+
+    def decode (self,*args):
+        """Runs crf_decode.py with the arguments on the test sentences; returns what it writes."""
+        output = os.path.join(self.directory,"test.decoded")
+        run([sys.executable,script("crf_decode.py"),"--input",self.files["testFeats"],"--output",output] + list(args))
+        with open(output,"rb") as instream:
+            return instream.read()
+
+    def testSameAsCrfTest (self):
+        self.assertEqual(self.decode("--model",self.files["textModel"]),self.expected)
+
+    def testBatchSizes (self):
+        # One sentence per batch has buckets of a single token; seven mixes lengths within a batch.
+        for batchSize in ["1","7"]:
+            self.assertEqual(self.decode("--model",self.files["textModel"],"--batchsize",batchSize),self.expected)
+
+    def testJobs (self):
+        self.assertEqual(self.decode("--model",self.files["textModel"],"--jobs","2","--batchsize","50"),self.expected)
+
+
+# Call unittest's 'main' function if we are being invoke in a script context.
+if (__name__ == "__main__"):
+    unittest.main()
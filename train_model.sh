@@ -21,7 +21,35 @@ FEAT_LIST=$BIN/dig-crf.feat-list
 
 LABEL_FLAGS=""
 FEAT_FLAGS="--labeled --featlist $FEAT_LIST"
-TRAIN_FLAGS="-f 1 -a CRF-L2"
+TRAIN_FLAGS="-a CRF-L2"
+
+# Wall-clock budget for choosing the crf_learn algorithm, -c, -f and -m, in seconds.  tune_training.py trains candidate
+# models on part of the training data and scores them on the rest, with one thread each, as the memory estimate assumes;
+# the -f values it tries are no smaller than the one estimate_features.py chose.  As many candidates are trained at once
+# as there are CPUs and as fit in MAX_MEMORY_MB at that cutoff's estimate, which is set below as TUNE_JOBS.  Set
+# TUNE_BUDGET_SECONDS to 0 to skip tuning and train with TRAIN_FLAGS.
+
+TUNE_BUDGET_SECONDS=120
+TUNE_FLAGS="--budget $TUNE_BUDGET_SECONDS --threads 1"
+
+# Memory budget for crf_learn, in megabytes.  Before training, estimate_features.py picks the smallest feature frequency
+# cutoff (crf_learn -f) from MIN_FREQ to MAX_FREQ whose estimated memory use fits, or rejects the job if none does.  The
+# estimate is for CRF-L1, which keeps the most per weight, if tuning may choose it, and for TRAIN_FLAGS' CRF-L2 if not.
+
+MAX_MEMORY_MB=2048
+MIN_FREQ=1
+MAX_FREQ=10
+ESTIMATE_ALGORITHM=CRF-L2
+if [ "$TUNE_BUDGET_SECONDS" -gt 0 ]
+then
+    ESTIMATE_ALGORITHM=CRF-L1
+fi
+ESTIMATE_FLAGS="--algorithm $ESTIMATE_ALGORITHM --maxmemory $MAX_MEMORY_MB --minfreq $MIN_FREQ --maxfreq $MAX_FREQ"
+
+# Wall-clock budget for crf_learn, in seconds: with the tuning budget, a bit less than the time limit train_model.php sets,
+# so that a job that runs out of time is stopped and reported, rather than left running after the request is gone.
+
+TRAIN_BUDGET_SECONDS=420
 
 
 # Make a unique output directory for this invocation
@@ -35,41 +63,129 @@ TRAIN_LABELS="$OUTDIR/training.labeled"
 TRAIN_FEATS=$OUTDIR/training.feats
 TEMPLATES=$OUTDIR/training.templates
 LOG_FILE="$OUTDIR/log.txt"
+ESTIMATE_FILE="$OUTDIR/estimate.json"
+STATUS_FILE="$OUTDIR/status.json"
+TUNING_FILE="$OUTDIR/tuning.json"
+PLAN_FILE=$OUTDIR/training.plan
 
-# The result file in OUTDIR
+# The result files in OUTDIR: the binary model for crf_test, and a bundle of the model with its feature plan for
+# 'crf_features.py --bundle' and crf_decode.py.  crf_learn -t also writes the text model, $MODEL.txt.
 
 MODEL=$OUTDIR/crf.model
+BUNDLE=$OUTDIR/crf.bundle
+
+# For decoding nodes: a gzip-compressed copy of each of those, and a manifest of their sizes and SHA-256s, which
+# fetch_model.py downloads and checks them against.
+
+MANIFEST=$OUTDIR/manifest.json
+
+
+# Each stage logs how long it took, as a line 'TIMING <stage> <seconds>'
+
+STAGE_START=$(date +%s.%N)
+
+function endStage {
+    local now=$(date +%s.%N)
+    awk "BEGIN { printf \"TIMING $1 %.3f\\n\", $now - $STAGE_START }" &>>$LOG_FILE
+    STAGE_START=$now
+}
 
 
 echo "INPUT: $INPUT" &>>$LOG_FILE
+echo '{"state": "preparing"}' > $STATUS_FILE
 
 # Copy the temporary input file to TRAIN_JSON
 
 cp $INPUT $TRAIN_JSON &>>$LOG_FILE
+endStage copy
 
 # Convert the JSON into name annotations
 
 python -u $BIN/json_to_name_annotations.py --inputs $TRAIN_JSON --output $TRAIN_LABELS $LABEL_FLAGS &>>$LOG_FILE
+endStage convert
 
 # Featurize the name annotations
 
-python -u $BIN/crf_features.py --input $TRAIN_LABELS --output $TRAIN_FEATS --templates $TEMPLATES $FEAT_FLAGS &>>$LOG_FILE
+python -u $BIN/crf_features.py --input $TRAIN_LABELS --output $TRAIN_FEATS --templates $TEMPLATES --plan $PLAN_FILE $FEAT_FLAGS &>>$LOG_FILE
+endStage featurize
+
+# Estimate the feature space and choose the frequency cutoff; if nothing fits the memory budget, don't train
+
+FREQ=$(python -u $BIN/estimate_features.py --input $TRAIN_FEATS --templates $TEMPLATES --report $ESTIMATE_FILE $ESTIMATE_FLAGS 2>>$LOG_FILE)
+endStage estimate
+
+# Train as many tuning candidates at once as fit the memory budget, each at most the chosen cutoff's estimate, and the CPUs
+
+TUNE_JOBS=1
+if [ -n "$FREQ" ]
+then
+    TUNE_JOBS=$(python -c "import json; r = json.load(open('$ESTIMATE_FILE')); e = [e for e in r['estimates'] if e['freq'] == r['chosenFreq']][0]; print(max(1,min($(nproc),int(r['maxMemory'] // max(e['megabytes'],1)))))" 2>>$LOG_FILE || echo 1)
+fi
+
+# Choose the training flags on a held-out part of the training data; if that gives nothing, fall back on TRAIN_FLAGS
+
+LEARN_FLAGS="-f $FREQ $TRAIN_FLAGS"
+if [ -n "$FREQ" ] && [ "$TUNE_BUDGET_SECONDS" -gt 0 ]
+then
+    TUNED=$(python -u $BIN/tune_training.py --input $TRAIN_FEATS --templates $TEMPLATES --minfreq $FREQ --report $TUNING_FILE --jobs $TUNE_JOBS $TUNE_FLAGS 2>>$LOG_FILE)
+    if [ -n "$TUNED" ]
+    then
+        LEARN_FLAGS=$TUNED
+    fi
+    echo "TRAINING FLAGS: $LEARN_FLAGS" &>>$LOG_FILE
+fi
+endStage tune
 
 # Train the model on the features
 
-crf_learn $TRAIN_FLAGS $TEMPLATES $TRAIN_FEATS $MODEL &>>$LOG_FILE
+if [ -n "$FREQ" ]
+then
+    # crf_progress.py keeps STATUS_FILE up to date with the iteration, objective, elapsed time and estimated time remaining
+    python -u $BIN/crf_progress.py --status $STATUS_FILE --budget $TRAIN_BUDGET_SECONDS -- crf_learn -t $LEARN_FLAGS $TEMPLATES $TRAIN_FEATS $MODEL &>>$LOG_FILE
+else
+    echo "REJECTED: estimated memory use is over $MAX_MEMORY_MB MB" &>>$LOG_FILE
+    echo "{\"state\": \"rejected\", \"message\": \"Estimated memory use is over $MAX_MEMORY_MB MB\"}" > $STATUS_FILE
+fi
+endStage train
+
+# Bundle the model with the feature plan, so that decoders need neither the feat-list nor its word lists
+
+if [ -e $MODEL ]
+then
+    python -u $BIN/make_bundle.py --model $MODEL.txt --plan $PLAN_FILE --output $BUNDLE &>>$LOG_FILE
+fi
+endStage bundle
+
+# Compress the model files and write the manifest
+
+if [ -e $MODEL ]
+then
+    ARTIFACTS=$MODEL
+    if [ -e $BUNDLE ]
+    then
+        ARTIFACTS="$MODEL $BUNDLE"
+    fi
+    python -u $BIN/package_model.py --files $ARTIFACTS --manifest $MANIFEST --verbose &>>$LOG_FILE
+fi
+endStage package
 
 
 # If the model file exists, we have succeeded. Emit 200 on stderr.
 if [ -e $MODEL ]
 then
     echo "SUCCESS" &>>$LOG_FILE
-    echo "{\"model\": \"$URL_PREFIX/$MODEL\", \"log\": \"$URL_PREFIX/$LOG_FILE\"}"
+    # tuning.json is only there if tuning ran
+    TUNING=""
+    if [ -e $TUNING_FILE ]
+    then
+        TUNING=", \"tuning\": \"$URL_PREFIX/$TUNING_FILE\""
+    fi
+    echo "{\"model\": \"$URL_PREFIX/$MODEL\", \"log\": \"$URL_PREFIX/$LOG_FILE\", \"status\": \"$URL_PREFIX/$STATUS_FILE\"$TUNING, \"bundle\": \"$URL_PREFIX/$BUNDLE\", \"manifest\": \"$URL_PREFIX/$MANIFEST\"}"
     >&2 echo $SUCCESS_CODE 
 # Otherwise, we have failed. Output failure code on stderr
 else
     echo "FAILURE" &>>$LOG_FILE
-    echo "{\"logf\": \"$URL_PREFIX/$LOG_FILE\"}"
+    echo "{\"logf\": \"$URL_PREFIX/$LOG_FILE\", \"status\": \"$URL_PREFIX/$STATUS_FILE\"}"
     >&2 echo $FAILURE_CODE
 fi
 
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+import os
+import re
+import cgi
+import tempfile
+import subprocess
+import mimetypes
+from sys import stderr
+from email.utils import formatdate,parsedate_tz,mktime_tz
+from SocketServer import ThreadingMixIn
+from wsgiref.simple_server import make_server,WSGIServer,WSGIRequestHandler
+from argparse import ArgumentParser
+
+scriptArgs = ArgumentParser(description="A stand-in for serving train_model.php where PHP is not available, e.g. for load tests: a threaded WSGI server that takes the same POST of a 'jsonfile' upload, runs train_model.sh on it as train_model.php does, and returns its output. Also serves the files under the root directory, such as the models and logs in outputs/, with ETag and Last-Modified headers, answering conditional requests (If-None-Match, If-Modified-Since) with 304 Not Modified and byte-range requests (Range, If-Range) with 206 Partial Content, so that decoding nodes can skip unchanged models and resume interrupted downloads.")
+
+scriptArgs.add_argument('--root',default=".",help="Directory laid out as for serving train_model.php: train_model.sh, bin/ with the scripts and feat-list, and outputs/. Default is the current directory.")
+scriptArgs.add_argument('--host',default="127.0.0.1",help="Address to listen on. Default is 127.0.0.1.")
+scriptArgs.add_argument('--port',type=int,default=8000,help="Port to listen on. Default is 8000.")
+scriptArgs.add_argument('--quiet',action='store_true',help="Don't log each request to stderr.")
+
+argValues = vars(scriptArgs.parse_args())
+
+
+# Command line arguments
+
+rootDir = os.path.abspath(argValues["root"])
+host    = argValues["host"]
+port    = argValues["port"]
+quiet   = argValues["quiet"]
+
+# The URL prefix train_model.sh puts in front of the model and log paths it returns.
+
+urlPrefix = format("http://%s:%d" % (host,port))
+
+# Files are sent this many bytes at a time, rather than read into memory whole
+
+BLOCK_SIZE = 1 << 20
+
+
+########################################################################################################################################
+
+
+def main ():
+    """The function that is called in a command line context. """
+    handler = QuietRequestHandler if quiet else WSGIRequestHandler
+    server  = make_server(host,port,application,server_class=ThreadingWSGIServer,handler_class=handler)
+    stderr.write("Serving %s on %s\n" % (rootDir,urlPrefix))
+    server.serve_forever()
+
+def application (environ,start_response):
+    """POSTs to train_model.php train a model; GETs and HEADs are answered with files under the root directory."""
+    path   = environ.get("PATH_INFO","/")
+    method = environ.get("REQUEST_METHOD","GET")
+    if (method == "POST" and path == "/train_model.php"):
+        return trainModel(environ,start_response)
+    elif (method in ("GET","HEAD")):
+        return serveFile(path,environ,start_response)
+    start_response("405 Method Not Allowed",[("Content-Type","text/plain")])
+    return ["Method not allowed\n"]
+
+def trainModel (environ,start_response):
+    """Does what train_model.php does: saves the uploaded 'jsonfile' to a temporary file, runs train_model.sh on it and
+       returns what the script writes to stdout.  As with PHP's shell_exec, that is the response whether or not training
+       succeeded; the script's exit code goes to its stderr."""
+    form = cgi.FieldStorage(fp=environ["wsgi.input"],environ=environ,keep_blank_values=True)
+    if ("jsonfile" not in form):
+        start_response("400 Bad Request",[("Content-Type","text/plain")])
+        return ["No jsonfile in the upload\n"]
+    (handle,trainJson) = tempfile.mkstemp()
+    try:
+        with os.fdopen(handle,"wb") as outstream:
+            outstream.write(form["jsonfile"].value)
+        process  = subprocess.Popen(["bash","train_model.sh",trainJson,urlPrefix],cwd=rootDir,stdout=subprocess.PIPE)
+        response = process.communicate()[0]
+    finally:
+        os.remove(trainJson)
+    start_response("200 OK",[("Content-Type","text/html"),("Content-Length",str(len(response)))])
+    return [response]
+
+def serveFile (path,environ,start_response):
+    """Answers a GET or HEAD of a file: with 304 if the request's validators show the client has it already, with 206 and
+       part of it for a satisfiable Range request whose If-Range, if any, still holds, and otherwise with all of it."""
+    filename = os.path.normpath(os.path.join(rootDir,path.lstrip("/")))
+    if (not filename.startswith(rootDir + os.sep) or not os.path.isfile(filename)):
+        start_response("404 Not Found",[("Content-Type","text/plain")])
+        return ["Not found\n"]
+    info         = os.stat(filename)
+    size         = info.st_size
+    modified     = int(info.st_mtime)
+    etag         = format('"%x-%x"' % (int(info.st_mtime * 1000000),size))
+    headers      = [("ETag",etag),("Last-Modified",formatdate(modified,usegmt=True)),("Accept-Ranges","bytes")]
+    ifNoneMatch  = environ.get("HTTP_IF_NONE_MATCH")
+    ifModified   = httpDate(environ.get("HTTP_IF_MODIFIED_SINCE"))
+    if ((ifNoneMatch != None and (ifNoneMatch.strip() == "*" or etag in [tag.strip() for tag in ifNoneMatch.split(",")])) or
+        (ifNoneMatch == None and ifModified != None and modified <= ifModified)):
+        start_response("304 Not Modified",headers)
+        return []
+    contentType = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    headers.append(("Content-Type",contentType))
+    byteRange   = requestedRange(environ,size,etag,modified)
+    if (byteRange == "unsatisfiable"):
+        start_response("416 Requested Range Not Satisfiable",headers + [("Content-Range","bytes */%d" % size),("Content-Length","0")])
+        return []
+    elif (byteRange != None):
+        (start,end) = byteRange
+        start_response("206 Partial Content",headers + [("Content-Range","bytes %d-%d/%d" % (start,end,size)),("Content-Length",str(end - start + 1))])
+    else:
+        (start,end) = (0,size - 1)
+        start_response("200 OK",headers + [("Content-Length",str(size))])
+    if (environ["REQUEST_METHOD"] == "HEAD"):
+        return []
+    return readBlocks(filename,start,end - start + 1)
+
+def requestedRange (environ,size,etag,modified):
+    """Returns the (first,last) byte positions of a request's Range header, "unsatisfiable" if it asks for bytes past the
+       end of the file, or None if the whole file is to be sent: there is no Range, it isn't a single byte range, or its
+       If-Range names another version of the file."""
+    header = environ.get("HTTP_RANGE","").strip()
+    match  = re.match(r'^bytes=(\d*)-(\d*)$',header)
+    if (not match or match.group(1) + match.group(2) == ""):
+        return None
+    ifRange = environ.get("HTTP_IF_RANGE")
+    if (ifRange != None and ifRange.strip() != etag and httpDate(ifRange) != modified):
+        return None
+    if (match.group(1) == ""):
+        # A suffix range, the last n bytes
+        (start,end) = (max(size - int(match.group(2)),0),size - 1)
+    else:
+        (start,end) = (int(match.group(1)),min(int(match.group(2)),size - 1) if match.group(2) else size - 1)
+    if (start >= size or start > end):
+        return "unsatisfiable"
+    return (start,end)
+
+def httpDate (string):
+    """Returns the time an HTTP date header gives, in seconds since the epoch, or None if it isn't one."""
+    parsed = parsedate_tz(string) if string else None
+    return mktime_tz(parsed) if parsed else None
+
+def readBlocks (filename,start,length):
+    """Yields length bytes of a file from start, a block at a time."""
+    with open(filename,"rb") as instream:
+        instream.seek(start)
+        while (length > 0):
+            block = instream.read(min(length,BLOCK_SIZE))
+            if (not block):
+                break
+            length -= len(block)
+            yield block
+
+
+class ThreadingWSGIServer(ThreadingMixIn,WSGIServer):
+    """A WSGIServer that handles each request in a thread of its own, so that concurrent uploads train concurrently."""
+    daemon_threads = True
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message (self,format,*args):
+        pass
+
+# Call the 'main' function if we are being invoke in a script context.
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+import os
+import json
+import random
+import shutil
+import tempfile
+import numpy
+from sys import stderr
+from time import time
+from multiprocessing import cpu_count
+from argparse import ArgumentParser
+import crf_text_model
+from crf_runs import learnCommand,runCommands,logFileFor,evaluateModel,readSentences,writeSentences
+
+scriptArgs = ArgumentParser(description="Trains a CRF++ model on featurized training data split into shards, one crf_learn process per shard, running in parallel, and averages the shard models' weights into one model. Can also just average text models trained elsewhere. Optionally compares the accuracy of the averaged model with that of a single model trained on all of the data.")
+
+scriptArgs.add_argument('--input',help="Featurized training file, as produced by crf_features.py --labeled. Required unless --average is given.")
+scriptArgs.add_argument('--templates',help="Required template file, as produced by crf_features.py --templates, shared by all shards.",required=True)
+scriptArgs.add_argument('--model',help="Required output file for the averaged binary model. The averaged text model is written next to it, with '.txt' added, as 'crf_learn -t' does.",required=True)
+scriptArgs.add_argument('--shards',type=int,default=4,help="Number of shards the training sentences are dealt into. Default is 4.")
+scriptArgs.add_argument('--jobs',type=int,default=0,help="Number of crf_learn processes run at once. Default is one per shard.")
+scriptArgs.add_argument('--rounds',type=int,default=1,help="Number of times the sentences are reshuffled with a new seed and dealt into shards again. The models of all rounds are averaged. Default is 1.")
+scriptArgs.add_argument('--seed',type=int,default=0,help="Seed for shuffling sentences into shards and picking held-out sentences. Default is 0.")
+scriptArgs.add_argument('--learnflags',default="-f 1 -a CRF-L2",help="Flags given to each crf_learn. Default is '-f 1 -a CRF-L2'. Unless they include -p, each crf_learn gets an equal share of the cores.")
+scriptArgs.add_argument('--average',nargs='+',help="Text models, written by 'crf_learn -t' from the same template file, e.g. on other machines, to average instead of training shards here.")
+scriptArgs.add_argument('--heldout',help="Optional featurized, labeled file to measure the accuracy of the averaged model on.")
+scriptArgs.add_argument('--heldoutfraction',type=float,default=0.0,help="Fraction of the training sentences to hold out to measure accuracy on, if --heldout is not given. Default is 0, i.e. no accuracy measurement.")
+scriptArgs.add_argument('--baseline',action='store_true',help="Also train a single model on all of the training sentences, and compare its accuracy and training time with the averaged model's.")
+scriptArgs.add_argument('--report',help="Optional output file for the training times and accuracies as JSON. They are printed to stderr in any case.")
+scriptArgs.add_argument('--workdir',help="Optional directory for shard files and models. A temporary one is made, and removed afterwards, if not given.")
+scriptArgs.add_argument('--crfbin',default="",help="Optional directory containing crf_learn and crf_test. They are looked for on the PATH if not given.")
+
+argValues = vars(scriptArgs.parse_args())
+
+
+# Command line arguments
+
+inputFile       = argValues["input"]
+templateFile    = argValues["templates"]
+modelFile       = argValues["model"]
+numShards       = argValues["shards"]
+numJobs         = argValues["jobs"] or numShards
+numRounds       = argValues["rounds"]
+seed            = argValues["seed"]
+learnFlags      = argValues["learnflags"].split()
+averageFiles    = argValues["average"]
+heldoutFile     = argValues["heldout"]
+heldoutFraction = argValues["heldoutfraction"]
+baseline        = argValues["baseline"]
+reportFile      = argValues["report"]
+workDir         = argValues["workdir"]
+crfLearn        = os.path.join(argValues["crfbin"],"crf_learn")
+crfTest         = os.path.join(argValues["crfbin"],"crf_test")
+
+
+# How the averaging works:
+#
+#  - Each shard model has its own feature dictionary, holding only the features seen often enough in its shard.  The
+#    averaged model's dictionary is the union of them, in CRF++'s sorted order.
+#  - Each feature's weights are the mean, over all shard models, of that model's weights for it, a model without the
+#    feature counting as zero.  Weights are matched up by label name, so shards need not have seen the same labels.
+#  - CRF++ can't start training from given weights, so later rounds don't start from the average of earlier ones;
+#    each round deals the sentences into shards differently, and the models of all rounds are averaged together.
+
+
+########################################################################################################################################
+
+
+def main ():
+    """The function that is called in a command line context. """
+    if (averageFiles == None and inputFile == None):
+        raise RuntimeError("Either --input or --average is required")
+    nonOverlapping([inputFile,templateFile,heldoutFile] + (averageFiles or []),[modelFile,modelFile + ".txt",reportFile])
+    tempDir = workDir == None
+    workdir = tempfile.mkdtemp(prefix="shards") if tempDir else workDir
+    if (not os.path.isdir(workdir)):
+        os.makedirs(workdir)
+    report = {"shards": numShards, "rounds": numRounds, "learnFlags": " ".join(learnFlags)}
+    try:
+        heldout = None
+        if (inputFile != None):
+            sentences = readSentences(inputFile)
+            if (heldoutFile == None and heldoutFraction > 0):
+                random.Random(seed).shuffle(sentences)
+                numHeldout = int(len(sentences) * heldoutFraction)
+                heldout    = writeSentences(sentences[:numHeldout],os.path.join(workdir,"heldout.feats"))
+                sentences  = sentences[numHeldout:]
+            report["trainingSentences"] = len(sentences)
+        if (heldoutFile != None):
+            heldout = heldoutFile
+        # Train the shard models, or take the given ones
+        startTime = time()
+        if (averageFiles != None):
+            shardModels = averageFiles
+        else:
+            shardModels = trainShards(sentences,workdir)
+            report["shardedSeconds"] = time() - startTime
+        # Average them, and make the binary model crf_test needs
+        startTime = time()
+        averaged  = averageModels([crf_text_model.readTextModel(f) for f in shardModels])
+        crf_text_model.writeTextModel(averaged,modelFile + ".txt")
+        runAll([[crfLearn,"-C",modelFile + ".txt",modelFile]],1,workdir)
+        report["averageSeconds"] = time() - startTime
+        report["averagedFeatures"] = len(averaged.featureIds)
+        stderr.write("Averaged %d models into %s: %d features, %d weights\n" % (len(shardModels),modelFile,len(averaged.featureIds),len(averaged.weights)))
+        if (heldout != None):
+            report["averagedAccuracy"] = evaluateModel(crfTest,modelFile,heldout,workdir)
+        # Train the single model on all of the data, for comparison
+        if (baseline and inputFile != None):
+            baselineModel = os.path.join(workdir,"baseline.model")
+            trainFile     = writeSentences(sentences,os.path.join(workdir,"all.feats"))
+            startTime     = time()
+            runAll([learnCommand(crfLearn,learnFlags,templateFile,trainFile,baselineModel,cpu_count())],1,workdir)
+            report["baselineSeconds"] = time() - startTime
+            if (heldout != None):
+                report["baselineAccuracy"] = evaluateModel(crfTest,baselineModel,heldout,workdir)
+        printReport(report)
+        if (reportFile):
+            with open(reportFile,"wb") as outstream:
+                json.dump(report,outstream,indent=1,sort_keys=True)
+    finally:
+        if (tempDir):
+            shutil.rmtree(workdir,ignore_errors=True)
+
+def trainShards (sentences,workdir):
+    """Deals the sentences into shards, for each round, and trains a text model on each shard.  Returns the text model
+       files."""
+    commands = []
+    models   = []
+    for r in range(numRounds):
+        order = range(len(sentences))
+        random.Random(seed + r + 1).shuffle(order)
+        for s in range(numShards):
+            shardFile  = os.path.join(workdir,"round%d.shard%d.feats" % (r,s))
+            shardModel = os.path.join(workdir,"round%d.shard%d.model" % (r,s))
+            writeSentences([sentences[i] for i in order[s::numShards]],shardFile)
+            commands.append(learnCommand(crfLearn,learnFlags + ["-t"],templateFile,shardFile,shardModel,max(cpu_count() // numJobs,1)))
+            models.append(shardModel + ".txt")
+    runAll(commands,numJobs,workdir)
+    return models
+
+def runAll (commands,numJobs,workdir):
+    """Runs the commands, up to numJobs at a time; raises an exception naming the log file of any that fails."""
+    for command,(exitCode,seconds) in zip(commands,runCommands(commands,numJobs,workdir)):
+        if (exitCode != 0):
+            raise RuntimeError(format("Command failed with exit status %s; see %s" % (exitCode,logFileFor(command,workdir))))
+
+def averageModels (models):
+    """Takes a list of TextModels trained with the same templates; returns the TextModel whose weights are their average."""
+    templates = models[0].templates
+    for model in models[1:]:
+        if (model.templates != templates):
+            raise RuntimeError("Models to be averaged must have been trained with the same templates")
+    averaged           = crf_text_model.TextModel()
+    averaged.header    = models[0].header
+    averaged.templates = templates
+    averaged.labels    = sorted(set([label for model in models for label in model.labels]))
+    numLabels          = len(averaged.labels)
+    # Give each feature in the union of the dictionaries its place in the averaged weights
+    features = sorted(set([feature for model in models for feature in model.featureIds]))
+    nextId   = 0
+    for feature in features:
+        averaged.featureIds[feature] = nextId
+        nextId += crf_text_model.featureWidth(feature,numLabels)
+    averaged.weights = numpy.zeros(nextId)
+    for model in models:
+        # Positions of the model's labels among the averaged model's labels
+        labelMap  = numpy.array([averaged.labels.index(label) for label in model.labels])
+        pairMap   = (labelMap[:,None] * numLabels + labelMap[None,:]).ravel()
+        modelSize = len(model.labels)
+        for feature,first in model.featureIds.iteritems():
+            target = averaged.featureIds[feature]
+            if (feature.startswith("B")):
+                averaged.weights[target + pairMap] += model.weights[first:first + modelSize * modelSize]
+            else:
+                averaged.weights[target + labelMap] += model.weights[first:first + modelSize]
+    averaged.weights /= len(models)
+    return averaged
+
+def printReport (report):
+    stderr.write("\n")
+    if ("shardedSeconds" in report):
+        stderr.write("Trained %d shard models in %d rounds in %.1fs\n" % (report["shards"] * report["rounds"],report["rounds"],report["shardedSeconds"]))
+    if ("baselineSeconds" in report):
+        stderr.write("Trained the single baseline model in %.1fs\n" % report["baselineSeconds"])
+    rows = [("averaged",report.get("averagedAccuracy")),("baseline",report.get("baselineAccuracy"))]
+    if (rows[0][1] != None):
+        stderr.write("\n%-10s %10s %10s %10s %10s\n" % ("model","token acc","precision","recall","F1"))
+        for name,accuracy in rows:
+            if (accuracy != None):
+                stderr.write("%-10s %10.4f %10.4f %10.4f %10.4f\n" % (name,accuracy["tokenAccuracy"],accuracy["precision"],accuracy["recall"],accuracy["f1"]))
+
+def nonOverlapping (files1, files2):
+    """Takes two lists of files; raises an exception if they overlap."""
+    for file1 in files1:
+        for file2 in files2:
+            if (file1 != None and file2 != None and file1 == file2):
+                raise RuntimeError(format("Can't overwrite %s" % file1))
+
+# Call the 'main' function if we are being invoke in a script context.
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+import os
+import re
+import json
+import random
+import shutil
+import tempfile
+import itertools
+from sys import stdout,stderr
+from time import time
+from argparse import ArgumentParser
+from crf_runs import learnCommand,runCommands,logFileFor,evaluateModel,readSentences,writeSentences
+
+scriptArgs = ArgumentParser(description="Chooses the crf_learn algorithm and -c, -f and -m values for featurized training data, within a wall-clock budget: trains candidate models on part of the data, in parallel, scores them on the rest, and prints the flags of the best one, e.g. '-a CRF-L2 -c 1 -f 2 -m 1000'.")
+
+scriptArgs.add_argument('--input',help="Required featurized training file, as produced by crf_features.py --labeled.",required=True)
+scriptArgs.add_argument('--templates',help="Required template file, as produced by crf_features.py --templates.",required=True)
+scriptArgs.add_argument('--algorithms',nargs='+',default=["CRF-L2","CRF-L1","MIRA"],help="crf_learn algorithms (-a) to try. Default is CRF-L2 CRF-L1 MIRA.")
+scriptArgs.add_argument('--costs',type=float,nargs='+',default=[0.25,1.0,4.0],help="crf_learn -c values to try. Default is 0.25 1 4.")
+scriptArgs.add_argument('--freqs',type=int,nargs='+',default=[1,2,3],help="crf_learn -f values to try. Default is 1 2 3.")
+scriptArgs.add_argument('--minfreq',type=int,default=1,help="Smallest -f value allowed, e.g. the one estimate_features.py chose to fit a memory budget. Smaller --freqs are dropped. Default is 1.")
+scriptArgs.add_argument('--maxiters',type=int,nargs='+',default=[100,1000],help="crf_learn -m values to try. Default is 100 1000.")
+scriptArgs.add_argument('--budget',type=float,default=300,help="Wall-clock budget in seconds. Candidates not started by then are skipped, those still training are stopped, and those not yet scored are left unscored. Default is 300.")
+scriptArgs.add_argument('--jobs',type=int,default=1,help="Number of candidates trained at once. Each is a crf_learn process of its own, so the memory estimate_features.py checked is multiplied by this. Default is 1.")
+scriptArgs.add_argument('--threads',type=int,default=1,help="Number of crf_learn threads (its -p) per candidate. Each thread adds to crf_learn's memory use, and estimate_features.py assumes 1 unless told otherwise. Default is 1.")
+scriptArgs.add_argument('--heldoutfraction',type=float,default=0.2,help="Fraction of the sentences held out to score the candidates on. Default is 0.2.")
+scriptArgs.add_argument('--minheldout',type=int,default=20,help="If fewer sentences than this would be held out, nothing is tuned and the default flags are printed. Default is 20.")
+scriptArgs.add_argument('--maxsentences',type=int,default=20000,help="Largest number of sentences the candidates are trained on; a random sample is taken from larger training splits. Default is 20000.")
+scriptArgs.add_argument('--seed',type=int,default=0,help="Seed for the held-out split, the sample and the order candidates are tried in. Default is 0.")
+scriptArgs.add_argument('--report',help="Optional output file for every candidate's flags, scores, training time and model size, and the winner, as JSON.")
+scriptArgs.add_argument('--workdir',help="Optional directory for the split and candidate models. A temporary one is made, and removed afterwards, if not given.")
+scriptArgs.add_argument('--crfbin',default="",help="Optional directory containing crf_learn and crf_test. They are looked for on the PATH if not given.")
+
+argValues = vars(scriptArgs.parse_args())
+
+
+# Command line arguments
+
+inputFile       = argValues["input"]
+templateFile    = argValues["templates"]
+algorithms      = argValues["algorithms"]
+costs           = argValues["costs"]
+minFreq         = argValues["minfreq"]
+freqs           = sorted(set([max(f,minFreq) for f in argValues["freqs"]]))
+maxIters        = argValues["maxiters"]
+budget          = argValues["budget"]
+numJobs         = argValues["jobs"]
+numThreads      = argValues["threads"]
+heldoutFraction = argValues["heldoutfraction"]
+minHeldout      = argValues["minheldout"]
+maxSentences    = argValues["maxsentences"]
+seed            = argValues["seed"]
+reportFile      = argValues["report"]
+workDir         = argValues["workdir"]
+crfLearn        = os.path.join(argValues["crfbin"],"crf_learn")
+crfTest         = os.path.join(argValues["crfbin"],"crf_test")
+
+# The flags train_model.sh trains with when it doesn't tune (its TRAIN_FLAGS), used with the --minfreq cutoff and crf_learn's
+# own -c and -m defaults if no candidate is scored.  They are tried last: with crf_learn's 10000 iteration limit they can take
+# the whole budget.
+
+DEFAULT_FLAGS = ["-a","CRF-L2"]
+
+
+########################################################################################################################################
+
+
+def main ():
+    """The function that is called in a command line context. """
+    deadline = time() + budget
+    tempDir  = workDir == None
+    workdir  = tempfile.mkdtemp(prefix="tune") if tempDir else workDir
+    if (not os.path.isdir(workdir)):
+        os.makedirs(workdir)
+    try:
+        candidates = makeCandidates()
+        report     = {"budgetSeconds": budget, "candidates": candidates, "winner": None}
+        sentences  = readSentences(inputFile)
+        rng        = random.Random(seed)
+        rng.shuffle(sentences)
+        numHeldout = int(len(sentences) * heldoutFraction)
+        report["sentences"] = len(sentences)
+        if (numHeldout < minHeldout):
+            stderr.write("Only %d sentences to hold out; not tuning\n" % numHeldout)
+            report["skipped"] = format("Fewer than %d held-out sentences" % minHeldout)
+            winner = candidates[-1]
+        else:
+            heldout = writeSentences(sentences[:numHeldout],os.path.join(workdir,"heldout.feats"))
+            train   = sentences[numHeldout:]
+            if (len(train) > maxSentences):
+                train = train[:maxSentences]
+            report["trainingSentences"] = len(train)
+            report["heldoutSentences"]  = numHeldout
+            trainFile = writeSentences(train,os.path.join(workdir,"train.feats"))
+            trainCandidates(candidates,trainFile,heldout,workdir,deadline)
+            winner = chooseWinner(candidates) or candidates[-1]
+        report["winner"] = winner
+        printCandidates(candidates,winner)
+        if (reportFile):
+            with open(reportFile,"wb") as outstream:
+                json.dump(report,outstream,indent=1,sort_keys=True)
+        stdout.write("%s\n" % " ".join(winner["flags"]))
+    finally:
+        if (tempDir):
+            shutil.rmtree(workdir,ignore_errors=True)
+
+def makeCandidates ():
+    """Returns the candidates, as dicts: one per combination of algorithm, cost, frequency cutoff and iteration limit, in
+       random order, so that a budget that runs out leaves a sample of the grid tried rather than one corner of it, and
+       the default flags with the --minfreq cutoff last."""
+    grid = list(itertools.product(algorithms,costs,freqs,maxIters))
+    random.Random(seed).shuffle(grid)
+    candidates = []
+    for (algorithm,cost,freq,maxIter) in grid:
+        flags = ["-a",algorithm,"-c","%g" % cost,"-f",str(freq),"-m",str(maxIter)]
+        candidates.append({"flags": flags, "status": "skipped"})
+    candidates.append({"flags": ["-f",str(minFreq)] + DEFAULT_FLAGS, "status": "skipped"})
+    return candidates
+
+def trainCandidates (candidates,trainFile,heldout,workdir,deadline):
+    """Trains the candidates in rounds of numJobs at a time, scoring those that finish on the held-out sentences after
+       each round, until the deadline.  Fills in each candidate's status, training time, model size, feature count and
+       scores."""
+    for i,candidate in enumerate(candidates):
+        candidate["model"] = os.path.join(workdir,"candidate%d.model" % i)
+    for first in range(0,len(candidates),numJobs):
+        if (time() >= deadline):
+            break
+        trainRound(candidates[first:first+numJobs],trainFile,heldout,workdir,deadline)
+
+def trainRound (candidates,trainFile,heldout,workdir,deadline):
+    commands = [learnCommand(crfLearn,c["flags"],templateFile,trainFile,c["model"],numThreads) for c in candidates]
+    results  = runCommands(commands,numJobs,workdir,deadline)
+    for candidate,command,(exitCode,seconds) in zip(candidates,commands,results):
+        if (exitCode == None and seconds == 0):
+            continue
+        candidate["trainSeconds"] = seconds
+        if (exitCode == None):
+            candidate["status"] = "stopped"
+            continue
+        if (exitCode != 0 or not os.path.exists(candidate["model"])):
+            candidate["status"] = "failed"
+            continue
+        candidate["modelBytes"] = os.path.getsize(candidate["model"])
+        candidate["features"]   = readFeatureCount(logFileFor(command,workdir))
+        accuracy = evaluateModel(crfTest,candidate["model"],heldout,workdir,deadline)
+        if (accuracy == None):
+            candidate["status"] = "unscored"
+            continue
+        candidate["status"]   = "done"
+        candidate["accuracy"] = accuracy
+
+def readFeatureCount (logFile):
+    with open(logFile,"r") as instream:
+        match = re.search(r'Number of features:\s*(\d+)',instream.read())
+    return int(match.group(1)) if match else None
+
+def chooseWinner (candidates):
+    """Returns the finished candidate with the best entity F1, then token accuracy, then the shortest training time."""
+    finished = [c for c in candidates if c["status"] == "done"]
+    if (not finished):
+        return None
+    return max(finished,key=lambda c: (c["accuracy"]["f1"],c["accuracy"]["tokenAccuracy"],-c["trainSeconds"]))
+
+def printCandidates (candidates,winner):
+    stderr.write("\n%-36s %8s %8s %9s %8s %8s %10s\n" % ("flags","status","F1","token acc","seconds","features","model KB"))
+    for candidate in candidates:
+        if (candidate["status"] == "skipped"):
+            continue
+        accuracy = candidate.get("accuracy",{})
+        stderr.write("%-36s %8s %8.4f %9.4f %8.1f %8d %10.1f%s\n" %
+                     (" ".join(candidate["flags"]),candidate["status"],accuracy.get("f1",0.0),accuracy.get("tokenAccuracy",0.0),
+                      candidate.get("trainSeconds",0.0),candidate.get("features") or 0,candidate.get("modelBytes",0) / 1024.0,
+                      "  <=" if candidate is winner else ""))
+    skipped = len([c for c in candidates if c["status"] == "skipped"])
+    if (skipped):
+        stderr.write("%d of %d candidates not tried within the budget\n" % (skipped,len(candidates)))
+
+# Call the 'main' function if we are being invoke in a script context.
+if (__name__ == "__main__"):
+    main()